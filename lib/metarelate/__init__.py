@@ -15,10 +15,10 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with metarelate. If not, see <http://www.gnu.org/licenses/>.
 
-from collections import Iterable, MutableMapping, namedtuple
+from collections import Iterable, MutableMapping, defaultdict, namedtuple
 from datetime import datetime
-import hashlib
 import json
+import math
 import os
 import urllib
 import urlparse
@@ -30,8 +30,11 @@ import requests
 from cachecontrol import CacheControl
 from requests.exceptions import ConnectionError
 
+from metarelate.cache import LRUCache
 from metarelate.config import update
+import metarelate.hashing as hashing
 import metarelate.prefixes as prefixes
+import metarelate.queries as queries
 
 __version__ = '1.1'
 
@@ -47,6 +50,11 @@ update(site_config)
 req_session = requests.session()
 cached_session = CacheControl(req_session)
 
+#: The cache of the identifiers of statements, shared by all exports; it
+#: may be replaced by an :class:`metarelate.cache.LRUCache` persisted in a
+#: directory, to keep the identifiers between runs.
+identifier_cache = LRUCache()
+
 
 def careful_update(adict, bdict):
     """
@@ -169,7 +177,46 @@ class KBaseSummary(_DotMixin):
                 graph.add_edge(revedge)                
         for k,g in subgraphs.iteritems():
             graph.add_subgraph(g)
-        graph.write_dot('/tmp/mydot.dot')
+        return graph
+
+
+class KBaseFormatSummary(_DotMixin):
+    """
+    Summary of the knowledge base, as the number of mappings between each
+    pair of formats.
+
+    """
+    def __init__(self, results):
+        self.results = results
+    def dot(self):
+        alabel = 'Metarelate {}'.format(site_config['fuseki_dataset'])
+        graph = pydot.Dot(graph_type='digraph',
+                          label=alabel,
+                          labelloc='t', labeljust='l',
+                          fontsize=15, rankdir='LR', layout='dot')
+        counts = [int(result.get('mappings', 0)) for result in self.results]
+        most = max(counts + [1])
+        nodes = {}
+        for result in self.results:
+            for fkey in ['sourceformat', 'targetformat']:
+                fmt = result.get(fkey)
+                if fmt not in nodes:
+                    nodes[fmt] = pydot.Node(self.dot_escape(fmt),
+                                            label=fmt.strip('<>'),
+                                            shape='box', style='filled',
+                                            color='lightgrey')
+                    graph.add_node(nodes[fmt])
+            mappings = int(result.get('mappings', 0))
+            invertibles = int(result.get('invertibles', 0))
+            elabel = '{}'.format(mappings)
+            if invertibles:
+                elabel += ' ({} invertible)'.format(invertibles)
+            penwidth = 1 + 4 * math.log(1 + mappings) / math.log(1 + most)
+            anedge = pydot.Edge(nodes[result.get('sourceformat')],
+                                nodes[result.get('targetformat')],
+                                label=elabel, arrowhead='open',
+                                penwidth='{:.2f}'.format(penwidth))
+            graph.add_edge(anedge)
         return graph
         
 
@@ -324,11 +371,60 @@ class Mapping(_DotMixin):
         pstr = '{}\nSource:\n{!r}\nTarget:\n{!r}'.format(self.uri, self.source, self.target)
         return pstr
 
+    def _content_podict(self):
+        # The mapping's statements, as in _podict, but with the source and
+        # target by content, and without the creation date.
+        podict = {}
+        if self.source is not None:
+            podict['mr:source'] = '"{}"'.format(self.source.content_key)
+        if self.target is not None:
+            podict['mr:target'] = '"{}"'.format(self.target.content_key)
+        if self.invertible is not None:
+            podict['mr:invertible'] = self.invertible
+        if self.creator:
+            podict['dc:creator'] = self.creator.data
+        if self.valuemaps:
+            podict['mr:hasValueMap'] = sorted(vmap.uri.data for vmap in
+                                              self.valuemaps)
+        if self.note:
+            podict['skos:note'] = self.note
+        if self.dateAccepted:
+            podict['dc:dateAccepted'] = self.dateAccepted.isoformat()
+        if self.replaces:
+            podict['dc:replaces'] = self.replaces.data
+        if self.rights:
+            podict['dc:rights'] = self.rights.data
+        if self.rightsHolders:
+            podict['dc:rightsHolder'] = sorted(rh.data for rh in
+                                               self.rightsHolders)
+        if self.contributors:
+            podict['dc:contributor'] = sorted(cont.data for cont in
+                                              self.contributors)
+        return podict
+
+    @property
+    def content_key(self):
+        """
+        The sha1 hex digest, from :func:`make_hash`, of the content of the
+        mapping: its statements, in a canonical order, with the source and
+        target by their content keys, ignoring the mapping's URI and date.
+
+        """
+        podict = self._content_podict()
+        state = sorted(podict.items())
+        cached = self.__dict__.get('_content')
+        if cached is None or cached[0] != state:
+            cached = (state, make_hash(podict))
+            self._content = cached
+        return cached[1]
+
+    def __hash__(self):
+        return hash(self.content_key)
+
     def __eq__(self, other):
         result = NotImplemented
         if isinstance(other, Mapping):
-            result = self.source == other.source and \
-                self.target == other.target
+            result = self.content_key == other.content_key
         return result
 
     def __ne__(self, other):
@@ -448,7 +544,18 @@ class Mapping(_DotMixin):
         ## what about other attributes?? not implemented yet
         return referrer
 
-    def populate_from_uri(self, fuseki_process, graph=None, service=None):
+    def populate_from_uri(self, fuseki_process, graph=None, service=None,
+                          session=None):
+        """
+        Populate the mapping, and its source and target components, from
+        the knowledge base.
+
+        Kwargs:
+        * session:
+            A :class:`metarelate.session.RetrievalSession`, sharing the
+            components populated with other mappings.
+
+        """
         elements, = fuseki_process.run_query(self.sparql_retriever(graph=graph,
                                                                    rep=False,
                                                                    service=service))
@@ -456,13 +563,18 @@ class Mapping(_DotMixin):
             if self.invertible != '"True"':
                 raise ValueError('A mapping may not be inverted but not '
                                  'invertible')
-            self.source = Component(elements.get('target'))
-            self.target = Component(elements.get('source'))
+            source, target = elements.get('target'), elements.get('source')
+        else:
+            source, target = elements.get('source'), elements.get('target')
+        if session is not None:
+            self.source, self.target = session.components([source, target],
+                                                          fuseki_process,
+                                                          graph, service)
         else:
-            self.source = Component(elements.get('source'))
-            self.target = Component(elements.get('target'))
-        self.source.populate_from_uri(fuseki_process, graph, service)
-        self.target.populate_from_uri(fuseki_process, graph, service)
+            self.source = Component(source)
+            self.target = Component(target)
+            populate_components([self.source, self.target], fuseki_process,
+                                graph, service)
         self.date = elements.get('date')
         self.creator = elements.get('creator')
         self.invertible = elements.get('invertible')
@@ -481,62 +593,29 @@ class Mapping(_DotMixin):
         if elements.get('dateAccepted'):
             self.dateAccepted = elements.get('dateAccepted')
 
-    def get_identifiers(self, fuseki_process):
+    def get_identifiers(self, fuseki_process, cache=None):
+        """
+        Return the identifiers of the source and target components.
+
+        Kwargs:
+        * cache:
+            The :class:`metarelate.cache.LRUCache` of statement identifiers;
+            by default, the shared :data:`identifier_cache`.
+
+        """
         source_ids = {}
         for prop in self.source.properties:
-            careful_update(source_ids, prop.get_identifiers(fuseki_process))
+            careful_update(source_ids, prop.get_identifiers(fuseki_process,
+                                                            cache))
         target_ids = {}
         for prop in self.target.properties:
-            careful_update(target_ids, prop.get_identifiers(fuseki_process))
+            careful_update(target_ids, prop.get_identifiers(fuseki_process,
+                                                            cache))
         return (source_ids, target_ids)
 
     def sparql_retriever(self, rep=True, graph=None, service=None):
-        graph_pattern = 'http://metarelate.net/{}mappings.ttl'
-        vstr = ''
-        if rep:
-            vstr += '\n\tMINUS {?mapping ^dc:replaces+ ?anothermap}'
-        graphs = ('FROM NAMED <{}>\n'.format(graph_pattern.format('')))
-        if graph:
-            graphs = graphs + ('FROM NAMED <{}>\n'.format(graph_pattern.format(graph)))
-        qstr = ("SELECT ?mapping ?source ?target ?invertible ?replaces\n"
-                "       ?note ?date ?creator ?rights ?dateAccepted\n"
-                "(GROUP_CONCAT(?rightsHolder; SEPARATOR = '&') AS ?rightsHolders)\n"
-                "(GROUP_CONCAT(?contributor; SEPARATOR = '&') AS ?contributors)\n"
-                "(GROUP_CONCAT(?valueMap; SEPARATOR = '&') AS ?valueMaps)\n"
-                "%s"
-                "WHERE {\n"
-                "graph ?g {\n"
-                "?mapping mr:source ?source ;\n"
-                "     mr:target ?target ;\n"
-                "     mr:invertible ?invertible ;\n"
-                "     dc:date ?date ;\n"
-                "     dc:creator ?creator .\n"
-                "OPTIONAL {?mapping dc:replaces ?replaces .}\n"
-                "OPTIONAL {?mapping skos:note ?note .}\n"
-                "OPTIONAL {?mapping mr:hasValueMap ?valueMap .}\n"
-                "OPTIONAL {?mapping dc:rightsHolder ?rights .}\n"
-                "OPTIONAL {?mapping dc:rightsHolder ?rightsHolder .}\n"
-                "OPTIONAL {?mapping dc:contributor ?contributor .}\n"
-                "OPTIONAL {?mapping dc:dateAccepted ?dateAccepted .}\n"
-                "FILTER(?mapping = %s)\n"
-                "%s"
-                "}\n\n}\n"
-                "GROUP BY ?mapping ?source ?target ?invertible ?replaces\n"
-                "         ?note ?date ?creator ?rights ?dateAccepted"
-                " \n")
-        if service is not None:
-            graphs = ''
-            service = '{}?named-graph-uri={}'.format(service, graph_pattern.format(''))
-            qstr = ("SELECT ?mapping ?source ?target ?invertible ?replaces\n"
-                    "       ?note ?date ?creator ?rights ?dateAccepted\n"
-                    "       ?rightsHolders ?contributors ?valueMaps\n"
-                    "WHERE {\n"
-                    "SERVICE <%s> {"
-                    "%s"
-                    "}}" % (service, qstr % (graphs, self.uri.data, vstr)))
-        else:
-            qstr = qstr % (graphs, self.uri.data, vstr)
-        return qstr
+        return mappings_sparql_retriever([self.uri.data], rep=rep,
+                                         graph=graph, service=service)
 
     def sparql_creator(self, po_dict, graph=None):
         if graph is None:
@@ -629,16 +708,47 @@ class Component(_DotMixin):
             result = self.uri.data.split('/')[-1].rstrip('>')
         return result
 
+    def _content_podict(self):
+        # The component's statements, as in _podict, in a canonical order.
+        podict = {}
+        if self.com_type:
+            podict['rdf:type'] = [self.com_type.data]
+        for aprop in self.properties:
+            if isinstance(aprop, StatementProperty):
+                obj = aprop.rdfobject.data
+            else:
+                obj = aprop.component.uri.data
+            podict.setdefault(aprop.predicate.data, []).append(obj)
+        for objs in podict.itervalues():
+            objs.sort()
+        return podict
+
+    @property
+    def content_key(self):
+        """
+        The sha1 hex digest, from :func:`make_hash`, of the content of the
+        component: its type and statements, in a canonical order, with
+        member components by URI.
+
+        The key is cached until the content changes.
+
+        """
+        podict = self._content_podict()
+        state = sorted(podict.items())
+        cached = self.__dict__.get('_content')
+        if cached is None or cached[0] != state:
+            cached = (state, make_hash(podict))
+            # bypass __setattr__, which only accepts properties
+            self.__dict__['_content'] = cached
+        return cached[1]
+
+    def __hash__(self):
+        return hash(self.content_key)
+
     def __eq__(self, other):
         result = NotImplemented
         if isinstance(other, type(self)):
-            result = False
-            if self.uri == other.uri and len(self) == len(other):
-                result=True
-                if not self.properties.sort() == other.properties.sort():
-                    res = False
-                if not self.com_type == other.com_type:
-                    result = False
+            result = self.content_key == other.content_key
         return result
 
     def __ne__(self, other):
@@ -776,58 +886,23 @@ class Component(_DotMixin):
             result = node
         return result
 
-    def populate_from_uri(self, fuseki_process, graph=None, service=None):
-        statements = fuseki_process.run_query(self.sparql_retriever(graph=graph,
-                                                                    service=service))
-        for statement in statements:
-            if statement.get('p') == '<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>':
-                self.com_type = Item(statement.get('o'),
-                                     get_notation(statement.get('o')))
-            else:
-                data = statement.get('p')
-                notation = get_notation(statement.get('p'))
-                predicate = Item(data, notation)
-                data = statement.get('o')
-                notation = get_notation(statement.get('o'))
-                rdfobject = Item(data, notation)
-
-                subc = '<http://www.metarelate.net/metOcean/component/'
-                if rdfobject.data.startswith(subc):
-                    comp = Component(rdfobject.data)
-                    comp.populate_from_uri(fuseki_process, graph, service)
-                    self.properties.append(ComponentProperty(predicate,
-                                                             comp))
-                else:
-                    self.properties.append(StatementProperty(predicate, 
-                                                             rdfobject))
+    def populate_from_uri(self, fuseki_process, graph=None, service=None,
+                          session=None):
+        """
+        Populate the component, and its member components, from the
+        knowledge base, as described by :func:`populate_components`.
+
+        Kwargs:
+        * session:
+            A :class:`metarelate.session.RetrievalSession`, sharing the
+            member components populated with other components.
+
+        """
+        populate_components([self], fuseki_process, graph, service, session)
 
     def sparql_retriever(self, graph=None, service=None):
-        g_pattern = 'http://metarelate.net/{}concepts.ttl'
-        if self.uri is None:
-            raise ValueError('URI required, None found')
-        graphs = ('FROM NAMED <{}>\n'.format(g_pattern.format('')))
-        if graph:
-            graphs = graphs + ('FROM NAMED <{}>\n'.format(g_pattern.format(graph)))
-        qstr = ('SELECT ?component ?p ?o \n'
-                '%s'
-                'WHERE {\n'
-                'GRAPH ?g {\n'
-                '?component ?p ?o ; \n'
-                'rdf:type mr:Component .\n'
-                'FILTER(?component = %s) \n'
-                'FILTER(?o != mr:Component) } \n'
-                '}\n')
-        if service is not None:
-            graphs = ''
-            service = '{}?named-graph-uri={}'.format(service, g_pattern.format(''))
-            qstr = ("SELECT ?component ?p ?o \n"
-                    "WHERE {\n"
-                    "SERVICE <%s> {"
-                    "%s"
-                    "}}" % (service, qstr % (graphs, self.uri.data)))
-        else:
-            qstr = qstr % (graphs, self.uri.data)
-        return qstr
+        return components_sparql_retriever([self.uri.data], graph=graph,
+                                           service=service)
 
     def sparql_creator(self, po_dict, graph=None):
         if graph is None:
@@ -926,6 +1001,137 @@ class Component(_DotMixin):
         self.uri = Item(result['component'])
 
 
+def mappings_sparql_retriever(uris, rep=True, graph=None, service=None):
+    """
+    Return a SPARQL query for the statements about all of the mappings with
+    the given URIs, from the registered 'mappings' query template.
+
+    Kwargs:
+    * rep:
+        Exclude the mappings which have been replaced.
+
+    """
+    if not uris or None in uris:
+        raise ValueError('URI required, None found')
+    graphs = queries.graph_uris('mappings.ttl', graph)
+    if service is not None:
+        qstr = queries.bind('mappings', graphs=[], mappings=uris,
+                            current=rep)
+        service = '<{}?named-graph-uri={}>'.format(service,
+                                                   graphs[0].strip('<>'))
+        qstr = queries.bind('mappings_service', service=service, query=qstr)
+    else:
+        qstr = queries.bind('mappings', graphs=graphs, mappings=uris,
+                            current=rep)
+    return qstr
+
+
+def components_sparql_retriever(uris, graph=None, service=None):
+    """
+    Return a SPARQL query for the statements about all of the components
+    with the given URIs, from the registered 'components' query template.
+
+    """
+    if not uris or None in uris:
+        raise ValueError('URI required, None found')
+    graphs = queries.graph_uris('concepts.ttl', graph)
+    if service is not None:
+        qstr = queries.bind('components', graphs=[], components=uris)
+        service = '<{}?named-graph-uri={}>'.format(service,
+                                                   graphs[0].strip('<>'))
+        qstr = queries.bind('components_service', service=service,
+                            query=qstr)
+    else:
+        qstr = queries.bind('components', graphs=graphs, components=uris)
+    return qstr
+
+
+def populate_components(components, fuseki_process, graph=None, service=None,
+                        session=None):
+    """
+    Populate components, and their member components, from the knowledge
+    base, breadth first: the statements about all of the components at
+    each depth are fetched in one query, so a tree of components is
+    populated in as many queries as it is deep.
+
+    A member component appearing more than once is populated once and
+    shared.
+
+    Args:
+    * components:
+        The :class:`Component` instances to populate.
+    * fuseki_process:
+        The :class:`metarelate.fuseki.FusekiServer` to query.
+
+    Kwargs:
+    * graph:
+        The branch to populate from, as well as the main graphs.
+    * service:
+        The SPARQL service to populate from.
+    * session:
+        A :class:`metarelate.session.RetrievalSession`, sharing the member
+        components populated with other components; the member components
+        claimed from it are released once all of the levels are populated.
+
+    """
+    rdf_type = '<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>'
+    subc = '<http://www.metarelate.net/metOcean/component/'
+    members = {}
+    claimed = []
+    level = list(components)
+    try:
+        while level:
+            uris = []
+            for comp in level:
+                if comp.uri.data not in uris:
+                    uris.append(comp.uri.data)
+            qstr = components_sparql_retriever(uris, graph=graph,
+                                               service=service)
+            statements = defaultdict(list)
+            for statement in fuseki_process.run_query(qstr):
+                statements[statement.get('component')].append(statement)
+            next_level = []
+            for comp in level:
+                for statement in statements[comp.uri.data]:
+                    if statement.get('p') == rdf_type:
+                        comp.com_type = Item(statement.get('o'),
+                                             get_notation(statement.get('o')))
+                        continue
+                    data = statement.get('p')
+                    notation = get_notation(statement.get('p'))
+                    predicate = Item(data, notation)
+                    data = statement.get('o')
+                    notation = get_notation(statement.get('o'))
+                    rdfobject = Item(data, notation)
+                    if not rdfobject.data.startswith(subc):
+                        comp.properties.append(StatementProperty(predicate,
+                                                                 rdfobject))
+                        continue
+                    member = members.get(rdfobject.data)
+                    if member is None:
+                        entry = None
+                        if session is not None:
+                            member, entry = session.claim(rdfobject.data,
+                                                          graph, service)
+                        if member is None:
+                            # not yet populated, or being populated by
+                            # another thread, which is not waited for
+                            member = Component(rdfobject.data)
+                            next_level.append(member)
+                            if entry is not None:
+                                claimed.append((entry, member))
+                        members[rdfobject.data] = member
+                    comp.properties.append(ComponentProperty(predicate,
+                                                             member))
+            level = next_level
+    except Exception, e:
+        for entry, member in claimed:
+            entry.set(error=e)
+        raise
+    for entry, member in claimed:
+        entry.set(member)
+
+
 class Property(_DotMixin):
     """
     Abstract Property class
@@ -951,10 +1157,11 @@ class ComponentProperty(Property):
     def __repr__(self):
         return '{!r}:{!r}'.format(self.predicate, self.component)
 
-    def get_identifiers(self, fuseki_process):
+    def get_identifiers(self, fuseki_process, cache=None):
         comp_ids = {}
         for prop in self.component.properties:
-            careful_update(comp_ids, prop.get_identifiers(fuseki_process))
+            careful_update(comp_ids, prop.get_identifiers(fuseki_process,
+                                                          cache))
         identifiers = {self.predicate.notation: comp_ids}
         return identifiers
 
@@ -1028,47 +1235,26 @@ class StatementProperty(Property):
     def __repr__(self):
         return '{!r}:{!r}'.format(self.predicate, self.rdfobject)
 
-    def get_identifiers(self, fuseki_process):
+    def get_identifiers(self, fuseki_process, cache=None):
         """Returns a dictionary of key value pairs, providing a pattern
-        of skos:notations which match the component explicitly"""
-        qstr = ('SELECT ?key ?value\n'
-                ' WHERE {\n'
-                '  {SELECT ?key ?value\n'
-                '   WHERE {\n'
-                '    {SERVICE %(ps)s \n'
-                '     {SELECT ?key WHERE {\n'
-                '      %(p)s skos:notation ?key .\n'
-                '    }}}\n'
-                '    {SERVICE %(os)s \n'
-                '     {SELECT ?value WHERE {\n'
-                '      %(o)s skos:notation ?value\n'
-                '    }}}\n'
-                '       }}\n'
-                ' UNION \n'
-                '  {SELECT ?key ?value\n'
-                '   WHERE {\n'
-                '    {SERVICE %(ps)s \n'
-                '     {SELECT ?key ?value WHERE {\n'
-                '      %(p)s skos:notation ?key .\n'
-                '      FILTER(isLiteral(%(o)s))\n'
-                '      BIND(%(o)s as ?value)\n'
-                '    }}}\n'
-                '       }}\n'
-                ' UNION \n'
-                '  {SELECT ?key ?value\n'
-                '   WHERE {\n'
-                '    {SERVICE %(os)s \n'
-                '     {SELECT ?key ?value ?idr ?rdfobj ?rdfobjnot WHERE {\n'
-                '      %(o)s <http://metarelate.net/vocabulary/index.html#identifier> ?idr ;\n'
-                '       ?idr ?rdfobj .\n'
-                '      OPTIONAL {?idr skos:notation ?key . }\n'
-                '      OPTIONAL {?rdfobj skos:notation ?rdfobjnot}\n'
-                '      %(ssc)s\n'
-                '      BIND((IF(isURI(?rdfobj), ?rdfobjnot, ?rdfobj)) AS ?value)\n'
-                '     }}\n'
-                '    }\n'
-                '  }}\n'
-                '}')
+        of skos:notations which match the component explicitly
+
+        The identifiers are memoised by predicate and object, in the cache
+        given, or the shared :data:`identifier_cache`.
+
+        """
+        if cache is None:
+            cache = identifier_cache
+        key = '{} {}'.format(self.predicate.data, self.rdfobject.data)
+        identifiers = cache.get(key)
+        if identifiers is None:
+            identifiers = self._get_identifiers(fuseki_process)
+            cache.set(key, identifiers)
+        # values read back from a persisted cache are unicode
+        return dict((key, str(value) if isinstance(value, unicode) else
+                     value) for key, value in identifiers.iteritems())
+
+    def _get_identifiers(self, fuseki_process):
         predicate = self.predicate.data
         psplit = urlparse.urlsplit(predicate.strip('<>'))
         if psplit.netloc == 'vocab.nerc.ac.uk':
@@ -1087,18 +1273,13 @@ class StatementProperty(Property):
         else:
             rospq = pspq
 
-        subservicecall = ''
+        subservicecall = queries.Query()
         if rospq != pspq:
-            subservicecall = ('{SERVICE %(ps)s \n'
-                              '\t\t{SELECT ?idr ?rdfobj ?rdfobjnot ?key WHERE {\n'
-                              '\t\tOPTIONAL {?idr skos:notation ?key .} \n'
-                              '\t\tOPTIONAL {?rdfobj skos:notation ?rdfobjnot .}\n'
-                              '\t}}}') % {'ps':pspq}
+            subservicecall = queries.bind('identifiers_subservice', ps=pspq)
 
-        aqstr = qstr % {'p':predicate, 'o':rdfobject, 'ps':pspq, 'os':rospq,
-                        'ssc':subservicecall}
-
-        results = fuseki_process.run_query(aqstr)
+        results = queries.run('identifiers', fuseki_process, p=predicate,
+                              o=rdfobject, ps=pspq, os=rospq,
+                              ssc=subservicecall)
         identifiers = {}
         for item in results:
             key = item.get('key', '').strip('"')
@@ -1260,6 +1441,8 @@ def make_hash(pred_obj, omitted=None):
     (object list) dictionary
     skipping any 'ommited' (list) predicates and objects
 
+    See :mod:`metarelate.hashing`.
+
     Args:
     
     * pred_obj:
@@ -1269,37 +1452,7 @@ def make_hash(pred_obj, omitted=None):
         A list of predicate strings to be ignored when building the hash
         
     """
-    if omitted is None:
-        omitted = []
-    pre = prefixes.Prefixes()
-    sha1 = hashlib.sha1()
-    #sort keys
-    po_keys = pred_obj.keys()
-    po_keys.sort()
-    for pred in po_keys:
-        if pred not in omitted:
-            if not pred.startswith('<'):
-                pred_elems = pred.split(':')
-                if len(pred_elems) == 2:
-                    if pre.has_key(pred_elems[0]):
-                        predicate = '%s%s' % (pre[pred_elems[0]], pred_elems[1])
-                    else:
-                        raise ValueError('predicate {} not in prefixes.py'
-                                         ''.format(pred_elems[0]))
-                else:
-                    raise ValueError('make hash passed a predicate '
-                                     'which is not of the form <prefix>:<item>')
-            else:
-                predicate = pred
-            if isinstance(pred_obj[pred], list):
-                for obj in pred_obj[pred]:
-                    sha1.update(predicate)
-                    sha1.update(obj)
-            else:
-                sha1.update(predicate)
-                sha1.update(pred_obj[pred])
-    sha1_hex = str(sha1.hexdigest())
-    return sha1_hex
+    return hashing.make_hash(pred_obj, omitted)
     
 
 class Contact(object):
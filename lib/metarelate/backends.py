@@ -0,0 +1,279 @@
+# (C) British Crown Copyright 2015, Met Office
+#
+# This file is part of metarelate.
+#
+# metarelate is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metarelate is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metarelate. If not, see <http://www.gnu.org/licenses/>.
+"""
+Provides the triple store backends which run the SPARQL queries and
+updates of a :class:`metarelate.fuseki.FusekiServer`.
+
+Each backend provides a query method, returning the SPARQL JSON results
+document as a string, and an update method.
+
+"""
+
+import glob
+import os
+import re
+from threading import Lock
+import urllib
+
+import requests
+
+try:
+    import rdflib
+    from rdflib.graph import ReadOnlyGraphAggregate
+    from metarelate.snapshot import SnapshotStore, compile_snapshot
+except ImportError:
+    rdflib = None
+
+_DATASET_CLAUSE = re.compile(r'\bFROM\s+(NAMED\s+)?<([^>]*)>\s*', re.I)
+_GRAPH_VARIABLE = re.compile(r'\bGRAPH\s+(\?\w+)', re.I)
+_WHERE = re.compile(r'\bWHERE\s*\{', re.I)
+
+
+class FusekiBackend(object):
+    """
+    Runs queries and updates over HTTP on an Apache Fuseki SPARQL server.
+
+    Args:
+    * host:
+        The host name of the server.
+    * port:
+        The port of the server, or None.
+    * dataset:
+        The name of the Fuseki dataset.
+
+    Kwargs:
+    * max_url_length:
+        The length of the longest URL of a query sent by GET; longer
+        queries are sent by POST.
+
+    """
+    def __init__(self, host, port, dataset, max_url_length=4096):
+        self.host = host
+        port = ':{}'.format(port) if port else ''
+        self.baseurl = 'http://{}{}/{}'.format(host, port, dataset)
+        self.max_url_length = max_url_length
+
+    def _get(self, url, qparams, **kwargs):
+        # long queries exceed the URL length limits of servers and proxies
+        length = len(url) + 1 + len(urllib.urlencode(qparams))
+        if length > self.max_url_length:
+            results = requests.post(url, data=qparams, **kwargs)
+        else:
+            results = requests.get(url, params=qparams, **kwargs)
+        return results
+
+    def _request(self, query_string, update):
+        if self.host != 'localhost':
+            qparams = {'query': query_string, 'output': 'json'}
+            results = self._get(self.baseurl, qparams)
+        elif update:
+            qparams = {'update': query_string}
+            url = self.baseurl + '/update'
+            results = requests.post(url, proxies={'http':''}, data=qparams)
+        else:
+            qparams = {'query': query_string, 'output': 'json'}
+            url = self.baseurl + '/query'
+            results = self._get(url, qparams, proxies={'http':''})
+        return results
+
+    def _run(self, query_string, update):
+        results = self._request(query_string, update)
+        if results.status_code != 200:
+            results = self._request(query_string, update)
+        if results.status_code != 200:
+            msg = ('Error connection to Fuseki server on {}.\n'
+                   ' server returned {}\n'
+                   '{}')
+            msg = msg.format(self.baseurl, results.status_code, query_string)
+            raise RuntimeError(msg)
+        return results.text
+
+    def query(self, query_string):
+        """Run a SPARQL query and return the JSON results document."""
+        return self._run(query_string, update=False)
+
+    def update(self, update_string):
+        """Run a SPARQL update."""
+        return self._run(update_string, update=True)
+
+
+class LocalBackend(object):
+    """
+    Runs queries and updates on an in-process rdflib dataset, loaded from
+    the turtle files of a static data directory, with no Apache Jena or
+    Fuseki process.
+
+    Unlike the Fuseki store, the default graph queried is the union of all
+    of the graphs.
+
+    Requires the optional rdflib package.
+
+    Args:
+    * static_dir:
+        The static data directory, holding the metarelate.net graphs.
+
+    """
+    def __init__(self, static_dir):
+        if rdflib is None:
+            raise ImportError('the local triple store backend requires '
+                              'the rdflib package')
+        self.static_dir = static_dir
+        self.dataset = None
+        self._lock = Lock()
+
+    @property
+    def loaded(self):
+        return self.dataset is not None
+
+    def load(self, subgraphs=None):
+        """
+        Load the turtle files of the static data directory, each into the
+        named graph http://metarelate.net/<file name>.
+
+        Kwargs:
+        * subgraphs:
+            The file names to load, replacing the existing graphs of those
+            names; if None, a new dataset is loaded from all of the files.
+
+        """
+        graphs = os.path.join(self.static_dir, 'metarelate.net')
+        with self._lock:
+            if subgraphs is None or self.dataset is None:
+                self.dataset = rdflib.ConjunctiveGraph()
+                paths = sorted(glob.glob(os.path.join(graphs, '*.ttl')))
+            else:
+                paths = [os.path.join(graphs, subgraph) for subgraph in
+                         subgraphs]
+            for path in paths:
+                name = rdflib.URIRef('http://metarelate.net/{}'
+                                     ''.format(os.path.basename(path)))
+                graph = self.dataset.get_context(name)
+                self.dataset.remove_context(graph)
+                if os.path.exists(path):
+                    self.dataset.parse(path, format='turtle',
+                                       publicID=name)
+
+    def clear(self):
+        """Discard the dataset."""
+        with self._lock:
+            self.dataset = None
+
+    def _check(self):
+        if self.dataset is None:
+            raise RuntimeError('the local triple store has not been loaded')
+
+    def _dataset(self, query_string):
+        # rdflib loads the graphs of FROM and FROM NAMED clauses from the
+        # web, so these are removed, and the query is run on an aggregate
+        # of the FROM graphs, with the variables of its GRAPH patterns
+        # restricted to the FROM NAMED graphs.
+        default = []
+        named = []
+        for is_named, uri in _DATASET_CLAUSE.findall(query_string):
+            (named if is_named else default).append(uri)
+        graph = self.dataset
+        if default or named:
+            query_string = _DATASET_CLAUSE.sub('', query_string)
+        if default:
+            graph = ReadOnlyGraphAggregate([self.dataset.get_context(
+                rdflib.URIRef(uri)) for uri in default])
+        if named:
+            values = ' '.join('<{}>'.format(uri) for uri in named)
+            variables = sorted(set(_GRAPH_VARIABLE.findall(query_string)))
+            restriction = ''.join('VALUES {} {{ {} }}\n'.format(var, values)
+                                  for var in variables)
+            query_string = _WHERE.sub(lambda where: where.group(0) + '\n' +
+                                      restriction, query_string, count=1)
+        return graph, query_string
+
+    def query(self, query_string):
+        """Run a SPARQL query and return the JSON results document."""
+        with self._lock:
+            self._check()
+            try:
+                graph, query_string = self._dataset(query_string)
+                result = graph.query(query_string)
+                result = result.serialize(format='json')
+            except Exception, e:
+                msg = 'Error running query on the local store: {}\n{}'
+                raise RuntimeError(msg.format(e, query_string))
+        return result
+
+    def update(self, update_string):
+        """Run a SPARQL update."""
+        with self._lock:
+            self._check()
+            try:
+                self.dataset.update(update_string)
+            except Exception, e:
+                msg = 'Error running update on the local store: {}\n{}'
+                raise RuntimeError(msg.format(e, update_string))
+        return ''
+
+
+class SnapshotBackend(LocalBackend):
+    """
+    Runs queries on a read-only snapshot of the static data directory,
+    compiled into an indexed SQLite database keyed by the git sha of the
+    static data (see :mod:`metarelate.snapshot`), with no Apache Jena or
+    Fuseki process, and no parsing of the turtle files once compiled.
+
+    Updates are not supported.
+
+    Requires the optional rdflib package.
+
+    Args:
+    * static_dir:
+        The static data directory, holding the metarelate.net graphs.
+    * directory:
+        The directory of the compiled snapshots.
+
+    Kwargs:
+    * updates:
+        SPARQL updates compiled into the snapshot, building its index
+        graphs.
+
+    """
+    def __init__(self, static_dir, directory, updates=()):
+        super(SnapshotBackend, self).__init__(static_dir)
+        self.directory = directory
+        self.updates = tuple(updates)
+
+    def load(self, subgraphs=None):
+        """
+        Open the snapshot of the current git sha of the static data,
+        compiling it first if it does not exist.
+
+        """
+        path = compile_snapshot(self.static_dir, self.directory,
+                                updates=self.updates)
+        with self._lock:
+            if self.dataset is not None:
+                self.dataset.close()
+            self.dataset = rdflib.ConjunctiveGraph(store=SnapshotStore(path))
+
+    def clear(self):
+        """Close the snapshot."""
+        with self._lock:
+            if self.dataset is not None:
+                self.dataset.close()
+            self.dataset = None
+
+    def update(self, update_string):
+        """Updates are not supported on a read-only snapshot."""
+        raise RuntimeError('the snapshot triple store is read-only, '
+                           'unable to run:\n{}'.format(update_string))
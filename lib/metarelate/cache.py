@@ -0,0 +1,304 @@
+# (C) British Crown Copyright 2015, Met Office
+#
+# This file is part of metarelate.
+#
+# metarelate is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metarelate is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metarelate. If not, see <http://www.gnu.org/licenses/>.
+"""
+Provides caches for results derived from the knowledge base.
+
+"""
+
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import re
+import tempfile
+from threading import Lock
+import time
+
+
+class DiskCache(object):
+    """
+    A persistent cache of strings, stored as one file per key in a
+    directory, which may be shared between processes.
+
+    Args:
+    * directory:
+        The directory in which to store the cache files; it is created if
+        it does not exist.
+
+    Kwargs:
+    * suffix:
+        The file name suffix for the cache files.
+    * maxsize:
+        The maximum number of values stored, or None for no limit; storing
+        a value beyond it removes the least recently stored values.
+
+    """
+    def __init__(self, directory, suffix='', maxsize=None):
+        self.directory = directory
+        self.suffix = suffix
+        self.maxsize = maxsize
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                if not os.path.isdir(directory):
+                    raise
+
+    def path(self, key):
+        """Return the path of the file which holds the value for a key."""
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        fname = hashlib.sha1(key).hexdigest() + self.suffix
+        return os.path.join(self.directory, fname)
+
+    def get(self, key, default=None):
+        """Return the value stored for a key, or the default."""
+        try:
+            with open(self.path(key), 'rb') as cfile:
+                result = cfile.read()
+        except IOError:
+            result = default
+        return result
+
+    def set(self, key, value):
+        """
+        Store the value for a key.
+
+        The value is written to a temporary file which is renamed into
+        place, so readers never see a partially written value.
+
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+        path = self.path(key)
+        try:
+            with os.fdopen(fd, 'wb') as cfile:
+                cfile.write(value)
+            os.rename(tmp_path, path)
+        except:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if self.maxsize is not None:
+            self._prune(path)
+
+    def _prune(self, keep):
+        # Remove the least recently stored values beyond the maximum size,
+        # other than the value just stored; another process may remove
+        # them first.
+        stored = []
+        for fname in os.listdir(self.directory):
+            path = os.path.join(self.directory, fname)
+            if fname.startswith('.tmp') or not fname.endswith(self.suffix) \
+                    or path == keep:
+                continue
+            try:
+                stored.append((os.path.getmtime(path), path))
+            except OSError:
+                pass
+        excess = len(stored) + 1 - self.maxsize
+        for mtime, path in sorted(stored)[:max(excess, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def mtime(self, key):
+        """Return the time a key's value was stored, or None."""
+        try:
+            result = os.path.getmtime(self.path(key))
+        except OSError:
+            result = None
+        return result
+
+    def __contains__(self, key):
+        return os.path.exists(self.path(key))
+
+
+class LRUCache(object):
+    """
+    A bounded, thread safe, in memory cache of JSON serialisable values,
+    discarding the least recently used value when full, and optionally
+    persisted in a :class:`DiskCache`, so values are kept between runs.
+
+    Kwargs:
+    * maxsize:
+        The maximum number of values held in memory.
+    * directory:
+        The directory of a disk cache to persist the values in, or None.
+
+    """
+    def __init__(self, maxsize=4096, directory=None):
+        self.maxsize = maxsize
+        self.disk = None
+        if directory is not None:
+            self.disk = DiskCache(directory, suffix='.json')
+        self._values = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _store(self, key, value):
+        # Store a value in memory, evicting the least recently used.
+        self._values.pop(key, None)
+        self._values[key] = value
+        while len(self._values) > self.maxsize:
+            self._values.popitem(last=False)
+
+    def get(self, key, default=None):
+        """Return the value stored for a key, or the default."""
+        with self._lock:
+            if key in self._values:
+                value = self._values.pop(key)
+                self._values[key] = value
+                self.hits += 1
+                return value
+        value = None
+        if self.disk is not None:
+            value = self.disk.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return default
+            value = json.loads(value)
+            self._store(key, value)
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        """Store the value for a key."""
+        with self._lock:
+            self._store(key, value)
+        if self.disk is not None:
+            self.disk.set(key, json.dumps(value))
+
+    def clear(self):
+        """Discard the values held in memory, and the counters."""
+        with self._lock:
+            self._values.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._values)
+
+    def stats(self):
+        """
+        Return a dictionary of the number of 'hits', 'misses' and values
+        held in memory, 'size'.
+
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self._values)}
+
+
+# SPARQL string literals and IRIs, in which whitespace is significant
+_QUERY_TOKEN = re.compile(r'("(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'|<[^<>\s]*>)'
+                          r'|\s+')
+
+
+def normalise_query(query_string):
+    """
+    Return a query string with each run of whitespace, outside of its
+    string literals and IRIs, replaced by a single space.
+
+    """
+    def replace(match):
+        return match.group(1) or ' '
+    return _QUERY_TOKEN.sub(replace, query_string).strip()
+
+
+class ResultCache(object):
+    """
+    A bounded, thread safe, in memory cache of the results of read only
+    queries, keyed by the normalised query string and the generation of
+    the store, which is bumped by every change to the store.
+
+    Kwargs:
+    * maxsize:
+        The maximum number of results held.
+    * ttl:
+        The number of seconds for which a result is held, or None; this
+        bounds the staleness of results from a store changed by other
+        processes.
+
+    """
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation = 0
+        self._values = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, query_string, default=None):
+        """Return the result stored for a query string, or the default."""
+        text = normalise_query(query_string)
+        with self._lock:
+            key = (self.generation, text)
+            entry = self._values.pop(key, None)
+            if entry is not None and (self.ttl is None or
+                                      time.time() - entry[0] < self.ttl):
+                self._values[key] = entry
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return default
+
+    def set(self, query_string, result, generation=None):
+        """
+        Store the result of a query string.
+
+        Kwargs:
+        * generation:
+            The generation of the store when the query was run; the result
+            is not stored if the store has changed since.
+
+        """
+        text = normalise_query(query_string)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            key = (self.generation, text)
+            self._values.pop(key, None)
+            self._values[key] = (time.time(), result)
+            while len(self._values) > self.maxsize:
+                self._values.popitem(last=False)
+
+    def bump(self):
+        """Start a new generation of the store, discarding all results."""
+        with self._lock:
+            self.generation += 1
+            self._values.clear()
+
+    def __len__(self):
+        return len(self._values)
+
+    def stats(self):
+        """
+        Return a dictionary of the number of 'hits' and 'misses', their
+        'hit_rate', the number of results held, 'size', and the store
+        'generation'.
+
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            hit_rate = float(self.hits) / lookups if lookups else 0.0
+            return {'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': hit_rate, 'size': len(self._values),
+                    'generation': self.generation}
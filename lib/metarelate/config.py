@@ -36,6 +36,8 @@ _DEFAULT_FUSEKI_TEST_PORT = 3636
 _DEFAULT_FUSEKI_TIMEOUT_ATTEMPTS = 1000
 _DEFAULT_FUSEKI_TIMEOUT_SLEEP = 0.1
 _DEFAULT_WORKERS = 8
+_DEFAULT_BACKEND = 'fuseki'
+_BACKENDS = ('fuseki', 'local', 'snapshot')
 
 # environment variable prefix
 ENV_PREF = 'METARELATE_'
@@ -118,6 +120,21 @@ def update(config):
             else:
                 config['fuseki_dataset'] = result
 
+            option = 'backend'
+            result = _get_option(parser, _SECTION_SYSTEM, option,
+                                 _DEFAULT_BACKEND)
+            env_var = ENV_PREF + option.upper()
+            if os.environ.has_key(env_var):
+                result = os.environ[env_var]
+            if result not in _BACKENDS:
+                msg = 'Metarelate Configuration - Ignoring invalid triple ' \
+                    'store backend {!r}. Section {!r}, option {!r}. ' \
+                    'Defaulting to {!r}.'
+                warnings.warn(msg.format(result, _SECTION_SYSTEM, option,
+                                         _DEFAULT_BACKEND))
+                result = _DEFAULT_BACKEND
+            config[option] = result
+
             option = 'tdb_dir'
             result = None
             env_var = ENV_PREF + option.upper()
@@ -140,10 +157,13 @@ def update(config):
                         raise OSError(msg)
                 config['tdb_dir'] = os.path.join(result, 'tdb')
                 config['log_dir'] = os.path.join(result, 'logs')
+                config['cache_dir'] = os.path.join(result, 'cache')
                 if not os.path.exists(config['tdb_dir']):
                     os.mkdir(config['tdb_dir'])
                 if not os.path.exists(config['log_dir']):
                     os.mkdir(config['log_dir'])
+                if not os.path.exists(config['cache_dir']):
+                    os.mkdir(config['cache_dir'])
             option = 'test_static_dir'
             result = _get_dir_option(parser, _SECTION_RESOURCE, option)
             if result is None:
@@ -216,6 +236,29 @@ def update(config):
                                          _DEFAULT_FUSEKI_TIMEOUT_ATTEMPTS))
                 config[option] = _DEFAULT_FUSEKI_TIMEOUT_ATTEMPTS
 
+            option = 'result_cache_size'
+            result = _get_option(parser, _SECTION_FUSEKI, option)
+            if result is not None:
+                try:
+                    config[option] = int(result)
+                except ValueError:
+                    msg = 'Metarelate Configuration - Ignoring invalid ' \
+                        'query result cache size. Section {!r}, ' \
+                        'option {!r}. Results are not cached.'
+                    warnings.warn(msg.format(_SECTION_FUSEKI, option))
+
+            option = 'result_cache_ttl'
+            result = _get_option(parser, _SECTION_FUSEKI, option)
+            if result is not None:
+                try:
+                    config[option] = float(result)
+                except ValueError:
+                    msg = 'Metarelate Configuration - Ignoring invalid ' \
+                        'query result cache time to live. Section {!r}, ' \
+                        'option {!r}. Results are held until the store ' \
+                        'changes.'
+                    warnings.warn(msg.format(_SECTION_FUSEKI, option))
+
             option = 'num_workers'
             result = _get_option(parser, _SECTION_THREADING, option)
             try:
@@ -69,6 +69,8 @@ class SearchStatement(forms.Form):
                                 widget=forms.TextInput(attrs={'size':'100%'}))
     rdfobject = forms.CharField(required=False, 
                                 widget=forms.TextInput(attrs={'size':'100%'}))
+    prefix = forms.BooleanField(required=False,
+                                help_text='match the start of words only')
 
             
 class SelectWithPop(forms.Select):
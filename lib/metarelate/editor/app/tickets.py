@@ -0,0 +1,154 @@
+# (C) British Crown Copyright 2015, Met Office
+#
+# This file is part of metarelate.
+#
+# metarelate is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metarelate is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metarelate. If not, see <http://www.gnu.org/licenses/>.
+"""
+Provides a cache of the open review tickets for branches, from the
+GitHub issues API, refreshed in the background.
+
+"""
+
+from collections import defaultdict
+import logging
+import re
+from threading import Lock, Thread
+import time
+import urllib
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+#: The GitHub issues API of the knowledge base repository.
+ISSUES_URI = 'https://api.github.com/repos/metarelate/metOcean/issues'
+
+#: The control panel URL, which tickets link to with a branch query.
+CONTROL_PANEL_URL = 'https://www.metarelate.net/metOcean/controlpanel/'
+
+
+class TicketCache(object):
+    """
+    The open tickets raised for branches, found from the links to the
+    branch control panels in the issue bodies.
+
+    Lookups are answered from the cache, never waiting for the issues API;
+    once the cache is older than the ttl, a lookup starts a background
+    refresh, a conditional request using the ETag of the previous
+    response.
+
+    Kwargs:
+    * issues_uri:
+        The GitHub issues API URI to request.
+    * control_panel_url:
+        The control panel URL which tickets link to.
+    * ttl:
+        The age, in seconds, after which the cache is refreshed.
+    * timeout:
+        The timeout, in seconds, for requests to the issues API.
+
+    """
+    def __init__(self, issues_uri=ISSUES_URI,
+                 control_panel_url=CONTROL_PANEL_URL, ttl=300, timeout=10):
+        self.issues_uri = issues_uri
+        self.ttl = ttl
+        self.timeout = timeout
+        self.tickets = {}
+        self.etag = None
+        self.fetched = None
+        self._refreshing = None
+        self._lock = Lock()
+        self._link = re.compile(re.escape(control_panel_url) +
+                                r'\?branch=([^\s&#"\'<>)\]]+)')
+
+    def ticket(self, branch, token=None):
+        """
+        Return the URL of the single open ticket for a branch, or None,
+        refreshing the cache in the background if it is stale.
+
+        Args:
+        * branch:
+            The branch identifier.
+
+        Kwargs:
+        * token:
+            A GitHub access token to authorise the refresh with.
+
+        """
+        self.refresh_if_stale(token)
+        with self._lock:
+            return self.tickets.get(branch)
+
+    def refresh_if_stale(self, token=None):
+        """
+        Start a background refresh, if the cache is stale and no refresh is
+        running; returns the refresh thread, or None.
+
+        """
+        with self._lock:
+            stale = self.fetched is None or \
+                time.time() - self.fetched > self.ttl
+            if not stale or self._refreshing is not None:
+                return None
+            self._refreshing = Thread(target=self._refresh, args=(token,))
+            self._refreshing.daemon = True
+            worker = self._refreshing
+        worker.start()
+        return worker
+
+    def _refresh(self, token):
+        try:
+            self.refresh(token)
+        except Exception, e:
+            logger.error('refreshing the ticket cache failed: {}'.format(e))
+        finally:
+            with self._lock:
+                self._refreshing = None
+
+    def refresh(self, token=None):
+        """Request the open issues and update the cache."""
+        headers = {}
+        if token:
+            headers['Authorization'] = 'token {}'.format(token)
+        with self._lock:
+            etag = self.etag
+        if etag:
+            headers['If-None-Match'] = etag
+        response = requests.get(self.issues_uri, headers=headers,
+                                timeout=self.timeout)
+        tickets = None
+        if response.status_code == 200:
+            tickets = self.branch_tickets(response.json())
+        elif response.status_code != 304:
+            logger.warning('GitHub issues request returned {}'
+                           ''.format(response.status_code))
+        with self._lock:
+            if tickets is not None:
+                self.tickets = tickets
+                self.etag = response.headers.get('ETag')
+            self.fetched = time.time()
+
+    def branch_tickets(self, issues):
+        """
+        Return a dictionary of branch to the URL of the issue linking to
+        the branch's control panel, for branches with exactly one issue.
+
+        """
+        urls = defaultdict(set)
+        for issue in issues:
+            for branch in self._link.findall(issue.get('body') or ''):
+                branch = urllib.unquote(branch)
+                urls[branch].add(issue.get('html_url'))
+        return dict((branch, burls.pop()) for branch, burls in
+                    urls.iteritems() if len(burls) == 1)
@@ -36,6 +36,7 @@ from django.http import HttpResponseRedirect, HttpResponse, Http404, HttpRespons
 from django.core.urlresolvers import reverse
 from django.template import RequestContext
 from django.utils.html import escape 
+from django.utils.http import http_date, parse_http_date_safe
 from django.utils.safestring import mark_safe
 from django.forms.formsets import formset_factory
 from django.forms.models import inlineformset_factory
@@ -52,15 +53,118 @@ from social.apps.django_app.utils import psa
 import requests
 
 from metarelate.editor.app.decorators import render_to
+from metarelate.editor.app.tickets import TicketCache
 import metarelate.editor.app.forms as forms
 import metarelate
 import metarelate.prefixes as prefixes
+from metarelate.cache import DiskCache
+from metarelate.validation import ValidationCache
 from metarelate.editor.settings import READ_ONLY
 from metarelate.editor.settings import fuseki_process
 from metarelate.editor.settings import ROOTUSER
 
 logger = logging.getLogger(__name__)
 
+#: The number of results listed on each page by list_mappings.
+PAGE_SIZE = 100
+
+#: The number of rendered graphs kept in the cache of renderings.
+SVG_CACHE_SIZE = 1000
+
+_VALIDATION_CACHE = []
+
+def _validation_cache():
+    """Return the validation report cache, creating it on first use."""
+    if not _VALIDATION_CACHE:
+        cache_dir = os.path.join(metarelate.site_config['cache_dir'],
+                                 'validation')
+        _VALIDATION_CACHE.append(ValidationCache(fuseki_process, cache_dir))
+    return _VALIDATION_CACHE[0]
+
+_TICKET_CACHE = TicketCache()
+
+_SVG_CACHE = []
+
+def _svg_cache():
+    """Return the rendered graph cache, creating it on first use."""
+    if not _SVG_CACHE:
+        cache_dir = os.path.join(metarelate.site_config['cache_dir'], 'svg')
+        _SVG_CACHE.append(DiskCache(cache_dir, suffix='.svg',
+                                    maxsize=SVG_CACHE_SIZE))
+    return _SVG_CACHE[0]
+
+_SUMMARY_CACHE = []
+
+def _summary_counts():
+    """
+    Return the summary counts of the mappings between each pair of formats
+    for the current store revision, from the cache of counts if possible.
+
+    """
+    if not _SUMMARY_CACHE:
+        cache_dir = os.path.join(metarelate.site_config['cache_dir'],
+                                 'summary')
+        # the counts of older revisions are not needed
+        _SUMMARY_CACHE.append(DiskCache(cache_dir, suffix='.json',
+                                        maxsize=1))
+    cache = _SUMMARY_CACHE[0]
+    revision = fuseki_process.latest_sha().strip()
+    key = ' '.join(['summary_counts', revision])
+    counts = cache.get(key)
+    if counts is None:
+        counts = fuseki_process.summary_counts()
+        cache.set(key, json.dumps(counts))
+    else:
+        counts = json.loads(counts)
+    return counts
+
+def _svg_response(request, render, kind, uri='', branch=''):
+    """
+    Return a response of the SVG rendering of a graph, from the cache of
+    renderings for the current store revision if possible, supporting
+    conditional requests.
+
+    Args:
+    * request:
+        The request being responded to.
+    * render:
+        A callable returning the SVG, called if it is not cached.
+    * kind:
+        The kind of graph rendered.
+
+    Kwargs:
+    * uri:
+        The identifier of the mapping or component rendered.
+    * branch:
+        The branch the graph is rendered from.
+
+    """
+    revision = fuseki_process.latest_sha().strip()
+    key = ' '.join(['svg', kind, uri, branch, revision])
+    if isinstance(key, unicode):
+        key = key.encode('utf-8')
+    cache = _svg_cache()
+    etag = '"{}"'.format(hashlib.sha1(key).hexdigest())
+    modified = cache.mtime(key)
+    since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE',
+                                                  ''))
+    match = request.META.get('HTTP_IF_NONE_MATCH')
+    if modified is not None and (match == etag or
+                                 (match is None and since is not None and
+                                  int(modified) <= since)):
+        response = HttpResponse(status=304)
+    else:
+        svg = cache.get(key)
+        if svg is None:
+            svg = render()
+            cache.set(key, svg)
+            modified = cache.mtime(key)
+        response = HttpResponse(svg, content_type="image/svg+xml")
+    response['ETag'] = etag
+    if modified is not None:
+        response['Last-Modified'] = http_date(modified)
+    return response
+
 def logout(request):
     """Logs out user"""
     if request.user.is_authenticated():
@@ -126,14 +230,42 @@ def _get_branch(request):
     return branch
 
 def home(request):
-    context = RequestContext(request)
+    format_pairs = []
+    for pair in _summary_counts():
+        url = url_qstr(reverse('homegraph'),
+                       sourceformat=pair['sourceformat'],
+                       targetformat=pair['targetformat'])
+        label = '{} to {}: {} mappings'.format(
+            pair['sourceformat'].strip('<>'),
+            pair['targetformat'].strip('<>'), pair['mappings'])
+        format_pairs.append({'url': url, 'label': label})
+    context = RequestContext(request, {'format_pairs': format_pairs})
     response = render_to_response('home.html', context)
     return response
 
 def homegraph(request):
-    response = HttpResponse(content_type="image/svg+xml")
-    graph = fuseki_process.summary_graph()
-    response.write(graph.create_svg())
+    """
+    The summary graph of the mappings between formats; or, given a
+    sourceformat and a targetformat, of each mapping between that pair.
+
+    """
+    sourceformat = request.GET.get('sourceformat')
+    targetformat = request.GET.get('targetformat')
+    if sourceformat is None and targetformat is None:
+        def render():
+            graph = fuseki_process.summary_graph(aggregate=True)
+            return graph.create_svg()
+        response = _svg_response(request, render, 'summary')
+    else:
+        def render():
+            try:
+                graph = fuseki_process.summary_graph(
+                    sourceformat=sourceformat, targetformat=targetformat)
+            except ValueError:
+                raise Http404
+            return graph.create_svg()
+        pair = '{} {}'.format(sourceformat, targetformat)
+        response = _svg_response(request, render, 'summary', pair)
     return response
     
 
@@ -145,19 +277,7 @@ def controlpanel(request):
     
     """
     branch = _get_branch(request)
-    branch_mappings = []
     logger.info('branch %s requested by control panel' % branch)
-    if branch:
-        branch_mappings = fuseki_process.query_branch(branch)
-        branch_mappings = [bm['mapping'].rstrip('>').lstrip('<') for bm in
-                           branch_mappings]
-        branch_mappings = [bm.split('http://www.metarelate.net/metOcean/mapping/')[-1]
-                           for bm in
-                           branch_mappings]
-        branch_mappings = [reverse(mapping, kwargs={'mapping_id':bm}) 
-                           for bm in branch_mappings]
-        branch_mappings = [{'url':'{}?branch={}'.format(bm, branch),
-                            'label':bm} for bm in branch_mappings] 
     open_ticket = _open_ticket(request, branch)
     if request.method == 'POST':# and request.user.username:
         form = forms.CPanelForm(request.POST)#, user=request.user.username)
@@ -182,6 +302,9 @@ def controlpanel(request):
                 response = HttpResponseRedirect(url)
             elif form.cleaned_data.get('merge') and request.user.username:
                 if request.user.username == 'https://github.com/marqh':
+                    # the merge commit names the ticket, so wait for it
+                    _TICKET_CACHE.refresh(request.session.get('access_token'))
+                    open_ticket = _open_ticket(request, branch)
                     all_additions = fuseki_process.merge(branch, open_ticket)
                     if not all_additions:
                         logger.error('The merge process failed')
@@ -199,16 +322,31 @@ def controlpanel(request):
     else:
         form = forms.CPanelForm()
         con_dict = {}
+        user = None
+        if not branch and request.user.is_authenticated():
+            user = request.user.username
+        cpanel = fuseki_process.control_panel(branch, user)
+        branch_mappings = []
+        for muri in cpanel['mappings']:
+            bm = muri.rstrip('>').lstrip('<')
+            bm = bm.split('http://www.metarelate.net/metOcean/mapping/')[-1]
+            url = reverse(mapping, kwargs={'mapping_id':bm})
+            branch_mappings.append({'url':'{}?branch={}'.format(url, branch),
+                                    'label':bm})
         if branch:
-            save_string = ''
-            for subgraph in ['mappings.ttl', 'concepts.ttl']:
-                save_string += subgraph + '\n\n'
-                save_string += fuseki_process.save_branch(branch, subgraph, merge=False)
-                save_string += 40*'-' + '\n'
-            con_dict['save_string'] = save_string
-            contacts = set(re.findall("<https://github.com/([a-zA-Z0-9-]+)>",
-                                      save_string))
-            con_dict['contacts'] = list(contacts)
+            con_dict['contacts'] = cpanel['contacts']
+            con_dict['triples'] = sorted(cpanel['triples'].items())
+            if request.GET.get('show') == 'turtle':
+                save_string = ''
+                for subgraph in ['mappings.ttl', 'concepts.ttl']:
+                    save_string += subgraph + '\n\n'
+                    save_string += fuseki_process.save_branch(branch, subgraph,
+                                                              merge=False)
+                    save_string += 40*'-' + '\n'
+                con_dict['save_string'] = save_string
+            else:
+                con_dict['show_url'] = url_qstr(reverse('control_panel'),
+                                                branch=branch, show='turtle')
         con_dict['mappings'] = branch_mappings
         if request.user and request.user.username == 'https://github.com/marqh':
             con_dict['metarelateuser'] = 'https://github.com/marqh'
@@ -218,65 +356,40 @@ def controlpanel(request):
                                           branch=branch)
         if branch and request.user:
             uname = request.user.username
-            owner = fuseki_process.branch_owner(branch)
-            if owner:
-                owner = owner.get('owner')
-            if owner == '<{}>'.format(uname):
+            if cpanel['owner'] == '<{}>'.format(uname):
                 con_dict['ownership'] = uname
-        #open_ticket = _open_ticket(request, branch)
         if open_ticket:        
             con_dict['review_url'] = open_ticket
             logger.info('Issue open: {}'.format(open_ticket))
-        if not branch and request.user.is_authenticated():
-            branches = _branches(request)
-            if branches:
-                urls = [url_qstr(reverse('control_panel'), branch=b) for
-                        b in branches]
-                con_dict['branches'] = urls
+        if cpanel['branches']:
+            urls = [url_qstr(reverse('control_panel'), branch=b) for
+                    b in cpanel['branches']]
+            con_dict['branches'] = urls
         con_dict['upload'] = _uploaders(branch)
         con_dict['branch'] = branch
+        # the validation key is made from the control panel query, rather
+        # than fingerprinting the branch again
+        cache = _validation_cache()
+        validation = cache.status(branch, cache.key(branch,
+                                                    cpanel['revision']))
+        if validation:
+            if validation['state'] == 'complete':
+                validation['url'] = url_qstr(reverse('list_mappings',
+                                                     kwargs={'validate': True}),
+                                             ref=json.dumps(branch))
+            con_dict['validation'] = validation
         context = RequestContext(request, con_dict)
         response = render_to_response('cpanel.html', context)
     return response
 
-def _branches(request):
-    branches = []
-    if request.user.is_authenticated():
-        user = '<{}>'.format(request.user.username)
-        qstr = ('SELECT ?g WHERE {\n'
-                '?g dc:creator %s . }\n' % user)
-        results = fuseki_process.run_query(qstr)
-        for res in results:
-            graph = res.get('g')
-            rexp = '<http://metarelate.net/([0-9a-f/]+)mappings.ttl>'
-            branchid = re.findall(rexp, graph)
-            if branchid and len(branchid) == 1:
-                branches.append(branchid[0])
-    return branches
-
 def _open_ticket(request, branch):
-    ticket_url = None
-    api_uri = 'https://api.github.com'
-    repo_uri = api_uri + '/repos/metarelate/metOcean/issues'
-    myheaders = {}
+    """
+    Return the URL of the open review ticket for a branch, or None, from
+    the ticket cache, which is refreshed in the background.
+
+    """
     atoken = request.session.get('access_token')
-    if atoken:
-        myheaders['Authorization'] = 'token {}'.format(atoken)
-    params = {}
-    r = requests.get(repo_uri,
-                      headers=myheaders)
-    if r.status_code == 200:
-        results = r.json()
-        aurl = 'https://www.metarelate.net/metOcean/controlpanel/?{}'
-        urlbranch = urllib.urlencode({'branch':branch})
-        aurl = aurl.format(urlbranch)
-        urls = []
-        for r in results:
-            if aurl in r.get('body', ''):
-                urls.append(r.get('html_url'))
-        if len(urls) == 1:
-            ticket_url, = urls
-    return ticket_url
+    return _TICKET_CACHE.ticket(branch, atoken)
 
 
 def _uploaders(branch):
@@ -360,13 +473,12 @@ def latest_sha(request):
 def mapping_view_graph(request, mapping_id):
     """"""
     branch = _get_branch(request)
-    mapping = metarelate.Mapping(None)
-    mapping.shaid = mapping_id
-    mapping.populate_from_uri(fuseki_process, graph=branch)
-    response = HttpResponse(content_type="image/svg+xml")
-    graph = mapping.dot()
-    response.write(graph.create_svg())
-    return response
+    def render():
+        mapping = metarelate.Mapping(None)
+        mapping.shaid = mapping_id
+        mapping.populate_from_uri(fuseki_process, graph=branch)
+        return mapping.dot().create_svg()
+    return _svg_response(request, render, 'mapping', mapping_id, branch)
 
 def mapping(request, mapping_id):
     """"""
@@ -405,13 +517,12 @@ def mapping_json(request, mapping_id):
 
 def component_view_graph(request, component_id):
     """"""
-    component = metarelate.Component(None)
-    component.shaid = component_id
-    component.populate_from_uri(fuseki_process)
-    response = HttpResponse(content_type="image/svg+xml")
-    graph = component.dot()
-    response.write(graph.create_svg())
-    return response
+    def render():
+        component = metarelate.Component(None)
+        component.shaid = component_id
+        component.populate_from_uri(fuseki_process)
+        return component.dot().create_svg()
+    return _svg_response(request, render, 'component', component_id)
 
 def component(request, component_id):
     """"""
@@ -441,17 +552,38 @@ def list_mappings(request, validate):
     if requestor_path == '':
         requestor_path = '{}'
     requestor = json.loads(requestor_path)
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    offset = (page - 1) * PAGE_SIZE
     if validate:
-        results = fuseki_process.validate(requestor)
-        logger.info('validation: {}'.format(results))
+        cache = _validation_cache()
+        key = cache.key(requestor)
+        report = cache.get(requestor, key)
+        if report is None:
+            # validate in the background, reporting progress on the
+            # control panel, which links back here once it is complete
+            cache.start(requestor, key)
+            url = url_qstr(reverse('control_panel'), branch=requestor)
+            return HttpResponseRedirect(url)
+        logger.info('validation: {} failures'.format(report.count))
+        validated = report.valid
+        has_next = offset + PAGE_SIZE < report.count
+        results = report.page(offset, PAGE_SIZE)
     else:
-        results = fuseki_process.search(requestor)
+        # ask for one more than a page, to find whether there is a next page
+        results = fuseki_process.search(requestor, offset=offset,
+                                        limit=PAGE_SIZE + 1)
+        has_next = False
+        for key, hits in results.items():
+            if len(hits) > PAGE_SIZE:
+                has_next = True
+                results[key] = hits[:PAGE_SIZE]
     mapping_links = []
-    validated = True
     for key, inv_mappings in results.iteritems():
         mapping_link = {'label':key, 'mappings':[]}
         for inv_map in inv_mappings:
-            validated = False
             muri = inv_map['amap']
             mapping = metarelate.Mapping(muri)
             url = reverse('mapping', kwargs={'mapping_id':mapping.shaid})
@@ -465,6 +597,14 @@ def list_mappings(request, validate):
     elif validate:
         context_dict['validated'] = ('This graph has not validated and should '
                                      'not be merged.  Details below:')
+    page_url = reverse('list_mappings', kwargs={'validate': validate})
+    ref = requestor_path.encode('utf8')
+    if page > 1:
+        context_dict['previous_url'] = url_qstr(page_url, ref=ref,
+                                                page=page - 1)
+    if has_next:
+        context_dict['next_url'] = url_qstr(page_url, ref=ref, page=page + 1)
+    context_dict['page'] = page
     context = RequestContext(request, context_dict)
     return render_to_response('select_list.html', context)
 
@@ -483,8 +623,10 @@ def search(request):
             for sform in formset.cleaned_data:
                 predicate = sform.get('predicate')
                 rdfobject = sform.get('rdfobject')
+                prefix = sform.get('prefix', False)
                 statements.append({'predicate':predicate, 
-                                   'rdfobject':rdfobject})
+                                   'rdfobject':rdfobject,
+                                   'prefix':prefix})
             url = url_qstr(reverse('list_mappings',
                                    kwargs={'validate': False}), 
                            ref=json.dumps(statements))
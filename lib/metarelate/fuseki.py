@@ -17,15 +17,20 @@
 
 from collections import deque
 from datetime import datetime
+import errno
+import fcntl
+from functools import partial
 import glob
-from inspect import getmembers, isfunction
+import hashlib
+from inspect import getargspec, getmembers, isfunction
 import json
 import os
+import re
 from Queue import Queue
 import socket
 import subprocess
 import sys
-from threading import Thread
+from threading import Lock, Thread
 import time
 import urllib
 import urllib2
@@ -35,8 +40,15 @@ import requests
 
 import metarelate
 import metarelate.prefixes as prefixes
+import metarelate.queries as queries
 import metarelate_metocean.validation
+from metarelate.backends import FusekiBackend, LocalBackend, SnapshotBackend
+from metarelate.cache import ResultCache
+from metarelate.search import SearchIndex
+from metarelate.session import RetrievalSession
 from metarelate.thread import WorkerThread, MAXTHREADS
+from metarelate.validation import (ValidationCheck, ValidationEngine,
+                                   ValidationReport, run_checks)
 
 import logging
 logger = logging.getLogger(__name__)
@@ -61,6 +73,113 @@ HEADER = '''#(C) British Crown Copyright 2012 - 2014 , Met Office
 
 PRE = prefixes.Prefixes()
 
+# A URI, as written in a SPARQL query.
+_URI = re.compile(r'^<[^<>"{}|^`\\\s]+>$')
+
+#: The graph of the current mappings of the main graphs, those which no
+#: mapping replaces, each recorded as an mr:Mapping.
+CURRENT_GRAPH = 'http://metarelate.net/current.ttl'
+
+# The graph pattern matching the current mappings of the main graphs.
+_CURRENT = 'GRAPH <%s> {?mapping rdf:type mr:Mapping . } ' % CURRENT_GRAPH
+
+#: The graph indexing the current mappings of the main graphs by the pair
+#: of formats they map between, see :func:`format_pair`.
+FORMAT_GRAPH = 'http://metarelate.net/formats.ttl'
+
+# The updates rebuilding the index graphs from the main graphs.
+_CURRENT_REFRESH = ('DELETE WHERE { GRAPH <%(c)s> { ?s ?p ?o . } } ;\n'
+                    'INSERT { GRAPH <%(c)s> { ?mapping rdf:type mr:Mapping . } }\n'
+                    'WHERE { GRAPH <http://metarelate.net/mappings.ttl> {\n'
+                    '?mapping rdf:type mr:Mapping .\n'
+                    'MINUS {?anothermap dc:replaces ?mapping . }\n'
+                    '} }' % {'c': CURRENT_GRAPH})
+
+# Index the mappings matched by a graph pattern, forwards, and backwards
+# if they are invertible, by the sha1 of their source and target formats.
+_FORMAT_INSERT = ('INSERT { GRAPH <%(f)s> { ?pair mr:hasMapping ?mapping . } }\n'
+                  'WHERE { %%(mappings)s\n'
+                  'GRAPH <http://metarelate.net/mappings.ttl> {\n'
+                  '?mapping mr:source ?source ; mr:target ?target ;\n'
+                  '         mr:invertible ?invertible . }\n'
+                  'GRAPH <http://metarelate.net/concepts.ttl> {\n'
+                  '?source rdf:type ?sourceformat .\n'
+                  '?target rdf:type ?targetformat . }\n'
+                  'BIND(IRI(CONCAT("%(f)s#", SHA1(CONCAT(STR(?sourceformat), '
+                  '" ", STR(?targetformat))))) AS ?pair)\n'
+                  '} ;\n'
+                  'INSERT { GRAPH <%(f)s> {\n'
+                  '?pair mr:hasInvertedMapping ?mapping . } }\n'
+                  'WHERE { %%(mappings)s\n'
+                  'GRAPH <http://metarelate.net/mappings.ttl> {\n'
+                  '?mapping mr:source ?target ; mr:target ?source ;\n'
+                  '         mr:invertible "True" . }\n'
+                  'GRAPH <http://metarelate.net/concepts.ttl> {\n'
+                  '?source rdf:type ?sourceformat .\n'
+                  '?target rdf:type ?targetformat . }\n'
+                  'BIND(IRI(CONCAT("%(f)s#", SHA1(CONCAT(STR(?sourceformat), '
+                  '" ", STR(?targetformat))))) AS ?pair)\n'
+                  '}' % {'f': FORMAT_GRAPH})
+
+_FORMAT_REFRESH = ('DELETE WHERE { GRAPH <%s> { ?s ?p ?o . } } ;\n'
+                   '' % FORMAT_GRAPH +
+                   _FORMAT_INSERT % {'mappings': _CURRENT})
+
+#: The updates building the index graphs, :data:`CURRENT_GRAPH` and
+#: :data:`FORMAT_GRAPH`, from the main graphs, in order.
+INDEX_UPDATES = (_CURRENT_REFRESH, _FORMAT_REFRESH)
+
+
+def snapshot_updates():
+    """
+    Return the updates compiled into each snapshot of the static data (see
+    :mod:`metarelate.snapshot`): the :data:`INDEX_UPDATES`, with their
+    prologues.
+
+    """
+    return [prefixes.sparql_prologue(instr) + instr for instr in
+            INDEX_UPDATES]
+
+# the subjects of branch graphs, with the number and total object length
+# of their statements, from which a fingerprint of their content is made
+# The sha1 digest of each statement of each subject of some graphs, of its
+# predicate and its object, with the language or datatype of a literal.
+_BRANCH_SUBJECTS = ('SELECT ?graph ?subject\n'
+                    '       (GROUP_CONCAT(?statement; SEPARATOR = " ")\n'
+                    '        AS ?statements)\n'
+                    'WHERE { VALUES ?graph { %s }\n'
+                    '        GRAPH ?graph { ?subject ?p ?o . }\n'
+                    '        BIND(SHA1(CONCAT(STR(?p), " ", STR(?o), " ",\n'
+                    '                         IF(isIRI(?o), "<>",\n'
+                    '                            COALESCE(LANG(?o), ""))'
+                    ', " ",\n'
+                    '                         COALESCE(STR(DATATYPE(?o)), '
+                    '""))) AS ?statement) }\n'
+                    'GROUP BY ?graph ?subject')
+
+
+def _content_hash(rows):
+    # A sha1 hex digest of the rows of a _BRANCH_SUBJECTS query, with the
+    # statement digests of each subject sorted, as their order is not
+    # defined; the aggregate of empty graphs may give a row with no subject.
+    lines = sorted(u'{} {} {}'.format(row['graph'], row['subject'],
+                                      ' '.join(sorted(row['statements']
+                                                      .strip('"').split())))
+                   for row in rows if 'subject' in row)
+    return hashlib.sha1('\n'.join(lines).encode('utf-8')).hexdigest()
+
+
+def format_pair(sourceformat, targetformat):
+    """
+    Return the URI, in :data:`FORMAT_GRAPH`, indexing the current mappings
+    from the source format to the target format, given as URIs.
+
+    """
+    formats = '{} {}'.format(sourceformat.strip('<>'),
+                             targetformat.strip('<>'))
+    digest = hashlib.sha1(formats.encode('utf-8')).hexdigest()
+    return '<{}#{}>'.format(FORMAT_GRAPH, digest)
+
 # Configure the Apache Jena environment.
 if metarelate.site_config.get('jena_dir') is not None:
     os.environ['JENAROOT'] = metarelate.site_config['jena_dir']
@@ -78,44 +197,132 @@ else:
     raise ValueError(msg)
 
 class lockfile(object):
-    def __init__(self, fpath):
+    """
+    An advisory, exclusive lock on a file, held for the duration of a
+    with block, using :func:`fcntl.flock`.
+
+    The lock file itself is left in place on release; only the lock is
+    dropped, so there is no window between one holder removing the file
+    and the next creating it.
+
+    Args:
+    * fpath:
+        The path of the file to lock; it is created if it does not exist.
+
+    Kwargs:
+    * timeout:
+        The number of seconds to wait for the lock before raising a
+        ValueError, or None to block until the lock is acquired.
+    * poll:
+        The interval, in seconds, between attempts to acquire the lock
+        whilst waiting under a timeout.
+
+    """
+    # lock wait timing metrics, shared by all instances in this process
+    stats = {'acquired': 0, 'timeouts': 0, 'total_wait': 0.0,
+             'max_wait': 0.0}
+    _stats_lock = Lock()
+
+    def __init__(self, fpath, timeout=64, poll=0.05):
         self.fpath = fpath
+        self.timeout = timeout
+        self.poll = poll
+        self.wait_time = None
 
     def __enter__(self):
-	i = 0
-        while os.path.exists(self.fpath):
-            time.sleep(1)
-            i += 1
-            if i > 64:
-		raise ValueError('lockfile has been locked '
-                                 'a long time')
-        self.lockfile = open(self.fpath, 'w')
+        self.lockfile = open(self.fpath, 'a')
+        start = time.time()
+        try:
+            if self.timeout is None:
+                fcntl.flock(self.lockfile, fcntl.LOCK_EX)
+            else:
+                while True:
+                    try:
+                        fcntl.flock(self.lockfile,
+                                    fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except IOError, e:
+                        if e.errno not in (errno.EAGAIN, errno.EACCES):
+                            raise
+                    if time.time() - start > self.timeout:
+                        self._record(time.time() - start, acquired=False)
+                        raise ValueError('lockfile {} has been locked for '
+                                         'more than {} seconds'
+                                         ''.format(self.fpath,
+                                                   self.timeout))
+                    time.sleep(self.poll)
+        except:
+            self.lockfile.close()
+            raise
+        self.wait_time = time.time() - start
+        self._record(self.wait_time)
+        logger.info('lockfile {} acquired after {:.3f}s'
+                    ''.format(self.fpath, self.wait_time))
+        return self
 
     def __exit__(self, *args):
+        fcntl.flock(self.lockfile, fcntl.LOCK_UN)
         self.lockfile.close()
-        os.remove(self.fpath)
+
+    @classmethod
+    def _record(cls, wait, acquired=True):
+        with cls._stats_lock:
+            if acquired:
+                cls.stats['acquired'] += 1
+            else:
+                cls.stats['timeouts'] += 1
+            cls.stats['total_wait'] += wait
+            cls.stats['max_wait'] = max(cls.stats['max_wait'], wait)
 
 
 class MappingPopulateWorker(WorkerThread):
     """
     WorkerThread for populating a Mapping instance from its URI.
     """
+    def __init__(self, aqueue, adeque, fu_p=None, service=None,
+                 session=None):
+        super(MappingPopulateWorker, self).__init__(aqueue, adeque, fu_p,
+                                                    service)
+        self.session = session
+
     def dowork(self, resource):
-        resource.populate_from_uri(self.fuseki_process, service=self.service)
+        resource.populate_from_uri(self.fuseki_process, service=self.service,
+                                   session=self.session)
 
 
 class FusekiServer(object):
     """
     A class to represent an instance of a process managing
     an Apache Jena triple store database and Fuseki SPARQL server.
+
+    With the 'local' backend, the queries are instead run on an in-process
+    store, loaded from the static data turtle files, with no Apache Jena
+    or Fuseki process.  With the 'snapshot' backend, the queries are run
+    on a read-only snapshot of the static data, compiled into an indexed
+    SQLite database for each git sha of the static data.
     
+    The results of read only queries may be cached, by a
+    :class:`metarelate.cache.ResultCache`, until the store is next changed.
+
+    Kwargs:
+    * backend:
+        The triple store backend, 'fuseki', 'local' or 'snapshot';
+        defaults to the configured backend.
+    * result_cache:
+        The :class:`metarelate.cache.ResultCache` of query results; by
+        default, one of the configured 'result_cache_size' and
+        'result_cache_ttl', if the size is configured.
+
     """
-    def __init__(self, host='localhost', test=False, update=True, port=None):
+    def __init__(self, host='localhost', test=False, update=True, port=None,
+                 backend=None, result_cache=None):
 
         self.update=update
+        if backend is None:
+            backend = metarelate.site_config.get('backend', 'fuseki')
 
-        self._jena_dir = metarelate.site_config['jena_dir']
-        self._fuseki_dir = metarelate.site_config['fuseki_dir']
+        self._jena_dir = metarelate.site_config.get('jena_dir')
+        self._fuseki_dir = metarelate.site_config.get('fuseki_dir')
 
         static_key = 'static_dir'
         tdb_key = 'tdb_dir'
@@ -127,12 +334,11 @@ class FusekiServer(object):
         if metarelate.site_config.get(static_key) is not None:
             self._static_dir = metarelate.site_config[static_key]
 
-        if metarelate.site_config.get(tdb_key) is None:
+        self._tdb_dir = metarelate.site_config.get(tdb_key)
+        if self._tdb_dir is None and backend not in ('local', 'snapshot'):
             msg = 'The Apache Jena {}triple store database directory has not ' \
                 'been configured for metarelate.'
             raise ValueError(msg.format('test ' if test else ''))
-        else:
-            self._tdb_dir = metarelate.site_config[tdb_key]
         
         self._fuseki_dataset = metarelate.site_config['fuseki_dataset']
         if test:
@@ -148,6 +354,43 @@ class FusekiServer(object):
         self.host = host
         self.test = test
         self._process = None
+        if backend == 'local':
+            self._backend = LocalBackend(self._static_dir)
+        elif backend == 'snapshot':
+            cache_dir = metarelate.site_config.get('cache_dir')
+            if cache_dir is None:
+                msg = 'The metarelate cache directory, for the triple store ' \
+                    'snapshots, has not been configured.'
+                raise ValueError(msg)
+            snapshots = os.path.join(cache_dir, 'snapshots')
+            self._backend = SnapshotBackend(self._static_dir, snapshots,
+                                            snapshot_updates())
+        elif backend == 'fuseki':
+            self._backend = FusekiBackend(self.host, self.port,
+                                          self._fuseki_dataset)
+        else:
+            raise ValueError('unknown triple store backend: {}'
+                             ''.format(backend))
+        self._search_index = None
+        self._search_lock = Lock()
+        self._latest_sha = None
+        self._refs_stamp = None
+        self._git_dir = None
+        if result_cache is None:
+            size = metarelate.site_config.get('result_cache_size')
+            if size:
+                ttl = metarelate.site_config.get('result_cache_ttl')
+                result_cache = ResultCache(size, ttl)
+        self._results = result_cache
+
+    @property
+    def local(self):
+        """
+        Whether queries are run on an in-process backend, the local or the
+        snapshot backend.
+
+        """
+        return isinstance(self._backend, LocalBackend)
 
     def __enter__(self):
         self.start()
@@ -160,8 +403,17 @@ class FusekiServer(object):
         """
         Initialise the Apache Fuseki SPARQL server process on the configured
         port, using the configured Apache Jena triple store database.
+
+        The local backend is loaded, if it has not been, and the index
+        graphs are built, if they are missing.
         
         """
+        if self.local:
+            if not self._backend.loaded:
+                self._backend.load()
+                self._changed()
+                self.refresh_indexes()
+            return
         if not self.alive():
             nohup_dir = metarelate.site_config['log_dir']
             if self.test and \
@@ -189,13 +441,18 @@ class FusekiServer(object):
                 msg = 'The metarelate Apache Fuseki SPARQL server failed ' \
                     'to start.'
                 raise RuntimeError(msg)
+        if self.update and self._indexes_missing():
+            self.refresh_indexes()
 
     def stop(self):
         """
         Shutdown the metarelate Apache Fuseki SPARQL server.
 
+        The local backend keeps its data.
             
         """
+        if self.local:
+            return
         if self.alive() and self._process is not None:
             pid = self._process.pid
             self._process.terminate()
@@ -227,6 +484,8 @@ class FusekiServer(object):
             Boolean.
 
         """
+        if self.local:
+            return self._backend.loaded
         result = False
         s = socket.socket() 
         try: 
@@ -244,6 +503,10 @@ class FusekiServer(object):
         :o
 
         """
+        self._changed()
+        if self.local:
+            self._backend.clear()
+            return []
         if self.alive():
             self.stop()
         files = os.path.join(self._tdb_dir, '*')
@@ -255,18 +518,40 @@ class FusekiServer(object):
         """
         remove any triples in the branch that already exist
         in the main graphs
+
+        The triples are found by joining each branch graph to its main
+        graph on all three terms.
+
+        Returns:
+            A dictionary of the number of triples removed from each
+            branch subgraph.
+
         """
         if branch == '' or branch == '/':
             raise ValueError("branch cannot be '' or '/'")
+        removed = {}
+        ops = []
         for subgraph in ['mappings.ttl', 'concepts.ttl']:
-            instr = ('DELETE { GRAPH <http://metarelate.net/%(b)s%(s)s> {\n '
-                     '?s ?p ?o . } }\n'
-                     'WHERE { GRAPH <http://metarelate.net/%(b)s%(s)s> {\n'
-                     '?s ?p ?o } \n'
-                     'EXISTS {GRAPH <http://metarelate.net/%(s)s> {\n'
-                     '?s ?p ?o } } \n'
-                     '}\n' % {'b':branch, 's':subgraph})
-            self.run_query(instr, update=True)
+            graphs = {'b':branch, 's':subgraph}
+            qstr = ('SELECT (COUNT(*) AS ?removed)\n'
+                    'WHERE { GRAPH <http://metarelate.net/%(b)s%(s)s> {\n'
+                    '?s ?p ?o }\n'
+                    'GRAPH <http://metarelate.net/%(s)s> {\n'
+                    '?s ?p ?o } \n'
+                    '}\n' % graphs)
+            result = self.run_query(qstr)
+            removed[subgraph] = int(result[0]['removed']) if result else 0
+            if removed[subgraph]:
+                ops.append('DELETE { GRAPH <http://metarelate.net/%(b)s%(s)s> {\n'
+                           '?s ?p ?o . } }\n'
+                           'WHERE { GRAPH <http://metarelate.net/%(b)s%(s)s> {\n'
+                           '?s ?p ?o }\n'
+                           'GRAPH <http://metarelate.net/%(s)s> {\n'
+                           '?s ?p ?o } \n'
+                           '}\n' % graphs)
+        if ops:
+            self.run_query(' ;\n'.join(ops), update=True)
+        return removed
 
     def merge(self, branch, ticket):
         """
@@ -292,21 +577,62 @@ class FusekiServer(object):
                                        'commit', '-am', 
                                        "{}".format(ticket),
                                        '--author="marqh <markh@metarelate.net>"'])
+                self._latest_sha = None
+                self._changed()
                 for subgraph in subgraphs:
                     instr = ('ADD <http://metarelate.net/{b}{s}> TO '
                              '<http://metarelate.net/{s}>'
                              '\n'.format(b=branch, s=subgraph))
                     self.run_query(instr, update=True)
+                self.update_indexes(branch)
+                if self._search_index is not None:
+                    self._search_index.update(self, branch)
                 self.rebase_branch(branch)
         return all_additions
             
     def latest_sha(self):
         """
         Returns the latest commit sha from the metarelate git data store. 
+
+        The sha is remembered until the git refs of the store change, as
+        seen from the status of their files, so a commit by another process
+        is seen too.
+
         """
-        git_sha = subprocess.check_output(['git', '-C', self._static_dir, 
-                                            'rev-parse', 'HEAD'])
-        return git_sha
+        stamp = self._git_refs_stamp()
+        if self._latest_sha is None or stamp is None or \
+                stamp != self._refs_stamp:
+            git_sha = subprocess.check_output(['git', '-C', self._static_dir, 
+                                                'rev-parse', 'HEAD'])
+            self._latest_sha = git_sha
+            self._refs_stamp = stamp
+        return self._latest_sha
+
+    def _git_refs_stamp(self):
+        # The content of HEAD, with the inode, size and modification time of
+        # the files naming the HEAD commit, which git replaces as it updates
+        # them, or None if they can not be read.
+        if self._git_dir is None:
+            git_dir = subprocess.check_output(['git', '-C', self._static_dir,
+                                               'rev-parse', '--git-dir'])
+            self._git_dir = os.path.join(self._static_dir, git_dir.strip())
+        try:
+            with open(os.path.join(self._git_dir, 'HEAD')) as head_file:
+                head = head_file.read().strip()
+        except IOError:
+            return None
+        paths = ['HEAD', 'packed-refs']
+        if head.startswith('ref: '):
+            paths.append(head[len('ref: '):])
+        stamp = [head]
+        for path in paths:
+            try:
+                stat = os.stat(os.path.join(self._git_dir, path))
+            except OSError:
+                stamp.append(None)
+            else:
+                stamp.append((stat.st_ino, stat.st_size, stat.st_mtime))
+        return tuple(stamp)
 
     def save(self, branch):
         """
@@ -378,17 +704,122 @@ class FusekiServer(object):
                         '?mapping rdf:type mr:Mapping .\n'
                         # why this optional??
                         'OPTIONAL {?mapping dc:replaces ?replaces .}\n'
-                        'MINUS {?mapping ^dc:replaces+ ?anothermap} \n'
+                        'MINUS {?anothermap dc:replaces ?mapping . } \n'
                         '}}' % branch)
             map_ids = self.run_query(map_qstr)
         return map_ids
 
+    def control_panel(self, branch=None, user=None):
+        """
+        Return the data shown on the control panel, from one query for the
+        branch and one for the user's branches.
+
+        Kwargs:
+        * branch:
+            The branch shown on the control panel.
+        * user:
+            The URI of the user, whose branches are listed.
+
+        Returns:
+            A dictionary of:
+
+            * 'mappings': the URIs of the live mappings in the branch
+            * 'owner': the URI of the branch owner, or None
+            * 'contacts': the GitHub user names referred to in the branch
+            * 'triples': the number of triples in each branch subgraph
+            * 'revision': the fingerprint of the branch content, as
+              :meth:`branch_hash`, or None
+            * 'branches': the branches created by the user
+
+        """
+        result = {'mappings': [], 'owner': None, 'contacts': [],
+                  'triples': {}, 'revision': None, 'branches': []}
+        if branch:
+            graphs = dict((subgraph, '<http://metarelate.net/{}{}>'
+                           ''.format(branch, subgraph))
+                          for subgraph in ['mappings.ttl', 'concepts.ttl'])
+            qstr = ('SELECT DISTINCT ?kind ?mapping ?owner ?contact ?graph '
+                    '?triples ?subject ?statements \n'
+                    'WHERE {\n'
+                    '{ GRAPH %(m)s { \n'
+                    '  ?mapping rdf:type mr:Mapping .\n'
+                    '  MINUS {?anothermap dc:replaces ?mapping . } }\n'
+                    '  BIND("mapping" AS ?kind) }\n'
+                    'UNION\n'
+                    '{ %(c)s dc:creator ?owner .\n'
+                    '  %(m)s dc:creator ?owner .\n'
+                    '  BIND("owner" AS ?kind) }\n'
+                    'UNION\n'
+                    '{ VALUES ?graph { %(m)s %(c)s }\n'
+                    '  GRAPH ?graph { ?s ?p ?contact . }\n'
+                    '  FILTER(isIRI(?contact) && REGEX(str(?contact), \n'
+                    '         "^https://github.com/[a-zA-Z0-9-]+$"))\n'
+                    '  BIND("contact" AS ?kind) }\n'
+                    'UNION\n'
+                    '{ { SELECT ?graph (COUNT(*) AS ?triples) \n'
+                    '    WHERE { VALUES ?graph { %(m)s %(c)s }\n'
+                    '            GRAPH ?graph { ?s ?p ?o . } }\n'
+                    '    GROUP BY ?graph }\n'
+                    '  BIND("triples" AS ?kind) }\n'
+                    'UNION\n'
+                    '{ { %(s)s }\n'
+                    '  BIND("subject" AS ?kind) }\n'
+                    '}' % {'m': graphs['mappings.ttl'],
+                           'c': graphs['concepts.ttl'],
+                           's': _BRANCH_SUBJECTS % ' '.join(
+                               [graphs['mappings.ttl'],
+                                graphs['concepts.ttl']])})
+            owners = set()
+            contacts = set()
+            subjects = []
+            for row in self.run_query(qstr):
+                kind = row.get('kind')
+                if kind == '"mapping"':
+                    result['mappings'].append(row['mapping'])
+                elif kind == '"owner"':
+                    owners.add(row['owner'])
+                elif kind == '"contact"':
+                    contacts.add(row['contact'].strip('<>').split('/')[-1])
+                elif kind == '"triples"':
+                    for subgraph, graph in graphs.iteritems():
+                        if row.get('graph') == graph:
+                            result['triples'][subgraph] = int(row['triples'])
+                elif kind == '"subject"':
+                    subjects.append(row)
+            result['revision'] = _content_hash(subjects)
+            if len(owners) > 1:
+                raise ValueError('multiple owners not allowed')
+            elif owners:
+                result['owner'], = owners
+            result['mappings'].sort()
+            result['contacts'] = sorted(contacts)
+        if user:
+            qstr = ('SELECT DISTINCT ?branch WHERE {\n'
+                    '?g dc:creator <%s> .\n'
+                    'FILTER(REGEX(str(?g), '
+                    '"^http://metarelate.net/[0-9a-f/]+mappings.ttl$"))\n'
+                    'BIND(STRBEFORE(STRAFTER(str(?g), '
+                    '"http://metarelate.net/"), "mappings.ttl") AS ?branch)\n'
+                    '}\n'
+                    'ORDER BY ?branch' % user)
+            result['branches'] = [row['branch'].strip('"') for row in
+                                  self.run_query(qstr) if 'branch' in row]
+        return result
+
     def load_main_graphs(self):
         """
         Clear the main graphs and rebuild them from the local ttl files.
         Leave all branches intact.
 
         """
+        if self.local:
+            self._backend.load(['mappings.ttl', 'concepts.ttl',
+                                'contacts.ttl'])
+            self._changed()
+            self.refresh_indexes()
+            self._search_index = None
+            self._latest_sha = None
+            return
         for subgraph in ['mappings.ttl', 'concepts.ttl', 'contacts.ttl']:
             delstr = ('DROP GRAPH <http://metarelate.net/%s> ' % subgraph)
             self.run_query(delstr, update=True)
@@ -400,7 +831,11 @@ class FusekiServer(object):
                             '--loc={}'.format(self._tdb_dir),
                             graph]
             subprocess.check_call(tdb_load)
+        self._search_index = None
+        self._latest_sha = None
+        self._changed()
         self.start()
+        self.refresh_indexes()
 
     def load(self):
         """
@@ -408,6 +843,13 @@ class FusekiServer(object):
         triple store database.
 
         """
+        if self.local:
+            self._backend.load()
+            self._changed()
+            self.refresh_indexes()
+            self._search_index = None
+            self._latest_sha = None
+            return
         self.clean()
         graphs = os.path.join(self._static_dir, 'metarelate.net')
         for ingraph in glob.glob(graphs):
@@ -423,80 +865,232 @@ class FusekiServer(object):
                             insubgraph]
                 print ' '.join(tdb_load)
                 subprocess.check_call(tdb_load)
+        self._search_index = None
+        self._latest_sha = None
+        self._changed()
+        # the indexes of the new store are built as it is started
         self.start()
 
-    def validate(self, graph=None):
+    def _indexes_missing(self):
+        # Whether the main graphs have mappings but the index graphs, from
+        # a store loaded before they were introduced, have none.
+        qstr = ('SELECT ?mapping WHERE {\n'
+                'GRAPH <http://metarelate.net/mappings.ttl> {\n'
+                '?mapping rdf:type mr:Mapping . }\n'
+                'FILTER NOT EXISTS { GRAPH <%s> { ?s ?p ?o . } }\n'
+                '} LIMIT 1' % CURRENT_GRAPH)
+        return bool(self.run_query(qstr))
+
+    def refresh_indexes(self):
+        """
+        Rebuild the index graphs of the main graphs: the current mappings,
+        :data:`CURRENT_GRAPH`, and the mappings by format pair,
+        :data:`FORMAT_GRAPH`.
+
+        The index graphs of a snapshot backend are compiled with the
+        snapshot.
+
+        """
+        if isinstance(self._backend, SnapshotBackend):
+            return
+        for instr in INDEX_UPDATES:
+            self.run_query(instr, update=True)
+
+    def update_indexes(self, branch):
+        """
+        Update the index graphs once a branch has been added to the main
+        graphs: the mappings the branch replaces are removed, and the
+        branch's mappings which are not replaced are added.
+
+        """
+        graphs = {'b': branch, 'c': CURRENT_GRAPH, 'f': FORMAT_GRAPH}
+        instr = ('DELETE { GRAPH <%(c)s> { ?mapping rdf:type mr:Mapping . } }\n'
+                 'WHERE { GRAPH <http://metarelate.net/%(b)smappings.ttl> {\n'
+                 '?anothermap dc:replaces ?mapping . } } ;\n'
+                 'INSERT { GRAPH <%(c)s> { ?mapping rdf:type mr:Mapping . } }\n'
+                 'WHERE { GRAPH <http://metarelate.net/%(b)smappings.ttl> {\n'
+                 '?mapping rdf:type mr:Mapping . }\n'
+                 'FILTER NOT EXISTS { GRAPH <http://metarelate.net/mappings.ttl>'
+                 ' {\n?anothermap dc:replaces ?mapping . } }\n'
+                 '} ;\n'
+                 'DELETE { GRAPH <%(f)s> { ?pair ?index ?mapping . } }\n'
+                 'WHERE { GRAPH <http://metarelate.net/%(b)smappings.ttl> {\n'
+                 '?anothermap dc:replaces ?mapping . }\n'
+                 'GRAPH <%(f)s> { ?pair ?index ?mapping . } } ;\n'
+                 '' % graphs)
+        mappings = ('GRAPH <http://metarelate.net/%smappings.ttl> {\n'
+                    '?mapping rdf:type mr:Mapping . }\n'
+                    '%s' % (branch, _CURRENT))
+        instr += _FORMAT_INSERT % {'mappings': mappings}
+        self.run_query(instr, update=True)
+
+    def branch_hash(self, branch):
+        """
+        Return a sha1 hex digest fingerprinting the content of a branch's
+        mappings and concepts graphs, from one aggregate query.
+
+        The digest is of each subject of each graph, with the sha1 digests
+        of its statements, so any edit to a statement changes it.
+
+        """
+        graphs = ['<http://metarelate.net/{}{}>'.format(branch, subgraph)
+                  for subgraph in ['mappings.ttl', 'concepts.ttl']]
+        qstr = _BRANCH_SUBJECTS % ' '.join(graphs)
+        return _content_hash(self.run_query(qstr))
+
+    def validate(self, graph=None, incremental=False, progress=None,
+                 offset=0, limit=None):
         """
         run the validation queries
 
+        Kwargs:
+        * graph:
+            The branch to validate in combination with the main graph.
+        * incremental:
+            If True, only validate the mappings touched by the branch
+            graph against the main graph, rather than the whole knowledge
+            base.  Validation plug-in checks which accept a 'mappings'
+            keyword are passed the URIs of the branch mappings.
+        * progress:
+            A callable, passed the number of checks completed and the
+            total number of checks each time a check completes.
+        * offset:
+            The number of failures to skip in the report returned.
+        * limit:
+            The maximum number of failures in the report returned, or None
+            for all of them.
+
+        Returns:
+            A :class:`metarelate.validation.ValidationReport`, mapping each
+            failure description to the failing mappings, with the time
+            taken by each check.
+
+        The checks are run concurrently on a bounded pool of threads.
+
         """
-        failures = {}
-        print('multiples')
+        report = ValidationReport()
+        subf_preds = metarelate_metocean.validation.subformat_predicates
+        engine = ValidationEngine(self, graph, subf_preds)
+        start = time.time()
+        if incremental and graph:
+            engine.load_branch()
+        else:
+            engine.load()
+        report.timings['load'] = time.time() - start
         mm_string = ('The following mappings are ambiguous, providing multiple'
                     ' targets in the same format for a particular source')
-        failures[mm_string] = self.run_query(multiple_mappings(graph=graph))
+        checks = [ValidationCheck('multiples', lambda:
+                                  {mm_string: engine.multiple_mappings()})]
         vtests = [o[0] for o in getmembers(metarelate_metocean.validation) if isfunction(o[1]) 
                   and not o[0].startswith('_')]
 
         for vtest in vtests:
-            print(vtest)
-            res = metarelate_metocean.validation.__dict__[vtest].__call__(self, graph)
-            metarelate.careful_update(failures, res)
+            vfunc = metarelate_metocean.validation.__dict__[vtest]
+            kwargs = {}
+            if engine.touched is not None and \
+                    'mappings' in getargspec(vfunc).args:
+                kwargs['mappings'] = engine.touched
+            checks.append(ValidationCheck(vtest, partial(vfunc, self, graph,
+                                                         **kwargs)))
         duplicate_str = ('The following mappings are duplicates')
-        failures[duplicate_str] = self.run_query(duplicate_mappings(graph=graph))
-        return failures
+        checks.append(ValidationCheck('duplicates', lambda:
+                                      {duplicate_str:
+                                       engine.duplicate_mappings()}))
+        run_checks(checks, report=report, progress=progress)
+        logger.info('validation timings:\n{}'.format(report.summary()))
+        if offset or limit is not None:
+            report = report.page(offset, limit)
+        return report
+
+    @property
+    def search_index(self):
+        """
+        The :class:`metarelate.search.SearchIndex` of the main graphs,
+        built on first use after the store is loaded and updated as
+        branches are merged.
+
+        """
+        with self._search_lock:
+            if self._search_index is None:
+                index = SearchIndex()
+                index.build(self)
+                self._search_index = index
+        return self._search_index
+
+    def search(self, statements, offset=0, limit=None):
+        """
+        Return the live mappings with a source or target concept matching
+        all of the statements, as described by
+        :meth:`metarelate.search.SearchIndex.search`.
+
+        Kwargs:
+        * offset:
+            The number of mappings to skip.
+        * limit:
+            The maximum number of mappings to return, or None for all.
 
-    def search(self, statements):
+        """
         results = {}
-        query_string = mapping_search(statements)
-        results['search results'] = self.run_query(query_string)
+        hits = self.search_index.search(statements)
+        stop = None if limit is None else offset + limit
+        results['search results'] = hits[offset:stop]
         return results
 
     def run_query(self, query_string, output='json', update=False, debug=False):
         """
         run a query_string on the FusekiServer instance
         return the results
+
+        Only the prefixes used by the query_string are declared.
+
+        The results of a read only query are taken from, and stored in, the
+        result cache, if there is one; an update discards the cached
+        results.
+
+        A query bound from a :mod:`metarelate.queries` template is timed by
+        its template.
         
         """
-        pref = prefixes.Prefixes().sparql
-        port = self.port
-        if port:
-            port = ':{}'.format(self.port)
-
-        baseurl = "http://{}{}/{}".format(self.host, port,
-                                           self._fuseki_dataset)
-
-        def run_this_query(baseurl):
-            if self.host != 'localhost':
-                qparams={'query': pref+query_string, 'output': 'json'}
-                results = requests.get(baseurl, params=qparams)
-            elif update:
-                action='update'
-                qparams={'update': pref+query_string}
-                url = baseurl + '/' + action
-                results = requests.post(url, proxies={'http':''},
-                                        data=qparams)
-            else:
-                action = 'query'
-                qparams={'query': pref+query_string, 'output': 'json'}
-                url = baseurl + '/' + action
-                results = requests.get(url, proxies={'http':''},
-                                       params=qparams)
-            return results
-        results = run_this_query(baseurl)
-        if results.status_code != 200:
-            results = run_this_query(baseurl)
-        if results.status_code != 200:
-            msg = ('Error connection to Fuseki server on {}.\n'
-                  ' server returned {}\n'
-                  '{}\n{}')
-            msg = msg.format(baseurl, results.status_code,
-                             pref, query_string)
-            raise RuntimeError(msg)
+        template = getattr(query_string, 'template', None)
+        if template is not None:
+            with template.timing():
+                return self._run_query(query_string, output, update)
+        return self._run_query(query_string, output, update)
+
+    def _run_query(self, query_string, output, update):
+        pref = prefixes.sparql_prologue(query_string)
+        if update:
+            try:
+                results = self._backend.update(pref + query_string)
+            finally:
+                self._changed()
+        elif self._results is None:
+            results = self._backend.query(pref + query_string)
+        else:
+            results = self._results.get(query_string)
+            if results is None:
+                generation = self._results.generation
+                results = self._backend.query(pref + query_string)
+                self._results.set(query_string, results, generation)
         if output == 'json':
-            return process_data(results.text)
+            return process_data(results)
         else:
-            return results.text
+            return results
+
+    def _changed(self):
+        # the store has changed, so its cached results are stale
+        if self._results is not None:
+            self._results.bump()
+
+    def result_cache_stats(self):
+        """
+        Return the statistics of the result cache, from
+        :meth:`metarelate.cache.ResultCache.stats`, or None if results are
+        not cached.
+
+        """
+        if self._results is not None:
+            return self._results.stats()
 
     def get_contacts(self, register, debug=False):
         """
@@ -546,32 +1140,58 @@ class FusekiServer(object):
         if not (sourcetype.is_uri() and targettype.is_uri()):
             raise ValueError('sourcetype and targettype must both be URIs')
 
-        qstr = ('SELECT ?mapping ?source ?target ?invertible ?inverted '
-                '''(GROUP_CONCAT(?valueMap; SEPARATOR = '&') AS ?valueMaps) '''
-                'WHERE {  '
-                'GRAPH <http://metarelate.net/mappings.ttl> { { '
-                '?mapping mr:source ?source ; '
-                'mr:target ?target ; '
-                'mr:invertible ?invertible .'
-                'BIND("False" AS ?inverted) '
-                'OPTIONAL {?mapping mr:hasValueMap ?valueMap . } '
-                'MINUS {?mapping ^dc:replaces+ ?anothermap} '
-                '} UNION { '
-                '?mapping mr:source ?target ; '
-                '         mr:target ?source ; '
-                '         mr:invertible "True" . '
-                'BIND("True" AS ?inverted) '
-                'BIND("True" AS ?invertible) '
-                'OPTIONAL {?mapping mr:hasValueMap ?valueMap . } '
-                'MINUS {?mapping ^dc:replaces+ ?anothermap} '
-                '} } '
-                'GRAPH <http://metarelate.net/concepts.ttl> { '
-                '?source rdf:type %s . '
-                '?target rdf:type %s . '
-                '}} '
-                'GROUP BY ?mapping ?source ?target ?inverted ?invertible '
-                'ORDER BY ?mapping') % (sourcetype.data, targettype.data)
-        if service is not None:
+        if service is None:
+            # a lookup in the index of the current mappings by format pair
+            pairs = {'f': FORMAT_GRAPH,
+                     'p': format_pair(sourcetype.data, targettype.data)}
+            qstr = ('SELECT ?mapping ?source ?target ?invertible ?inverted '
+                    '''(GROUP_CONCAT(?valueMap; SEPARATOR = '&') AS ?valueMaps) '''
+                    'WHERE { { '
+                    'GRAPH <%(f)s> { %(p)s mr:hasMapping ?mapping . } '
+                    'GRAPH <http://metarelate.net/mappings.ttl> { '
+                    '?mapping mr:source ?source ; '
+                    'mr:target ?target ; '
+                    'mr:invertible ?invertible .'
+                    'OPTIONAL {?mapping mr:hasValueMap ?valueMap . } } '
+                    'BIND("False" AS ?inverted) '
+                    '} UNION { '
+                    'GRAPH <%(f)s> { %(p)s mr:hasInvertedMapping ?mapping . } '
+                    'GRAPH <http://metarelate.net/mappings.ttl> { '
+                    '?mapping mr:source ?target ; '
+                    '         mr:target ?source . '
+                    'OPTIONAL {?mapping mr:hasValueMap ?valueMap . } } '
+                    'BIND("True" AS ?inverted) '
+                    'BIND("True" AS ?invertible) '
+                    '} } '
+                    'GROUP BY ?mapping ?source ?target ?inverted ?invertible '
+                    'ORDER BY ?mapping' % pairs)
+        else:
+            # the service's store may have no index graphs
+            qstr = ('SELECT ?mapping ?source ?target ?invertible ?inverted '
+                    '''(GROUP_CONCAT(?valueMap; SEPARATOR = '&') AS ?valueMaps) '''
+                    'WHERE {  '
+                    'GRAPH <http://metarelate.net/mappings.ttl> { { '
+                    '?mapping mr:source ?source ; '
+                    'mr:target ?target ; '
+                    'mr:invertible ?invertible .'
+                    'BIND("False" AS ?inverted) '
+                    'OPTIONAL {?mapping mr:hasValueMap ?valueMap . } '
+                    'MINUS {?anothermap dc:replaces ?mapping . } '
+                    '} UNION { '
+                    '?mapping mr:source ?target ; '
+                    '         mr:target ?source ; '
+                    '         mr:invertible "True" . '
+                    'BIND("True" AS ?inverted) '
+                    'BIND("True" AS ?invertible) '
+                    'OPTIONAL {?mapping mr:hasValueMap ?valueMap . } '
+                    'MINUS {?anothermap dc:replaces ?mapping . } '
+                    '} } '
+                    'GRAPH <http://metarelate.net/concepts.ttl> { '
+                    '?source rdf:type %s . '
+                    '?target rdf:type %s . '
+                    '}} '
+                    'GROUP BY ?mapping ?source ?target ?inverted ?invertible '
+                    'ORDER BY ?mapping') % (sourcetype.data, targettype.data)
             qstr = ('SELECT ?mapping ?source ?target ?invertible ?inverted '
                     '?valueMaps '
                     'WHERE {  '
@@ -581,7 +1201,24 @@ class FusekiServer(object):
         map_templates = self.run_query(qstr)
         return json.dumps(map_templates)
 
-    def retrieve_mappings(self, sourcetype, targettype, service=None):
+    def retrieve_mappings(self, sourcetype, targettype, service=None,
+                          session=None):
+        """
+        Return the current mappings from the source type to the target
+        type, populated from the knowledge base.
+
+        The mappings' components are populated within a retrieval session,
+        so each component shared by several mappings is fetched once, and
+        shared between them.
+
+        Kwargs:
+        * session:
+            The :class:`metarelate.session.RetrievalSession` to populate
+            the components in; a new session by default.
+
+        """
+        if session is None:
+            session = RetrievalSession()
         sourcetype = metarelate.Item(sourcetype)
         targettype = metarelate.Item(targettype)
         templates = self.retrieve_mapping_templates(sourcetype, targettype, service=service)
@@ -596,8 +1233,13 @@ class FusekiServer(object):
             mq += 1
         for i in range(MAXTHREADS):
             MappingPopulateWorker(mapping_queue, mapping_list,
-                                  self, service).start()
+                                  self, service, session).start()
         mapping_queue.join()
+        stats = session.stats()
+        logger.info('retrieved {} mappings: {} component requests, {} '
+                    'fetched, {} shared'.format(mq, stats['requests'],
+                                                stats['fetched'],
+                                                stats['shared']))
         if len(mapping_list) != mq:
             msg = '{} entries in mapping_list, expected {}'
             raise ValueError(msg.format(len(mapping_list), mq))
@@ -679,7 +1321,7 @@ class FusekiServer(object):
                         '?mapping mr:source %s ;\n'
                         '\tmr:target %s .\n'
                         'OPTIONAL {?mapping dc:replaces ?replaces .}\n'
-                        'MINUS {?mapping ^dc:replaces+ ?anothermap} \n'
+                        'MINUS {?anothermap dc:replaces ?mapping . } \n'
                         '}' % (graphs, source_uri, target_uri)) 
             map_ids = self.run_query(map_qstr)
             if len(map_ids) > 1:
@@ -689,13 +1331,70 @@ class FusekiServer(object):
                 result = map_ids[0]
         return result
 
-    def summary_graph(self):
+    def summary_counts(self):
+        """
+        Return the number of live mappings, and of invertible live mappings,
+        between each pair of formats, as a list of dictionaries of
+        'sourceformat', 'targetformat', 'mappings' and 'invertibles'.
+
+        """
+        qstr = ('SELECT ?sourceformat ?targetformat '
+                '(COUNT(DISTINCT ?mapping) AS ?mappings) '
+                '(COUNT(DISTINCT ?invmapping) AS ?invertibles) '
+                'WHERE { '
+                '%s'
+                'GRAPH <http://metarelate.net/mappings.ttl> { '
+                '?mapping rdf:type mr:Mapping . '
+                '?mapping mr:source ?source ; '
+                ' mr:target ?target ; '
+                ' mr:invertible ?invertible . '
+                'BIND(IF(str(?invertible) = "True", ?mapping, ?unbound) '
+                'AS ?invmapping) '
+                '}'
+                'GRAPH <http://metarelate.net/concepts.ttl> { '
+                '?source rdf:type ?sourceformat . '
+                '?target rdf:type ?targetformat . '
+                'FILTER(?sourceformat !=  '
+                '<http://www.metarelate.net/vocabulary/index.html#Component>) '
+                'FILTER(?targetformat != '
+                '<http://www.metarelate.net/vocabulary/index.html#Component>) '
+                '}} '
+                'GROUP BY ?sourceformat ?targetformat '
+                'ORDER BY ?sourceformat ?targetformat' % _CURRENT)
+        return self.run_query(qstr)
+
+    def summary_graph(self, aggregate=False, sourceformat=None,
+                      targetformat=None):
+        """
+        Return a pydot graph summarising the live mappings.
+
+        Kwargs:
+        * aggregate:
+            If True, summarise the mappings as one edge between each pair
+            of formats, weighted by the number of mappings, so the size of
+            the graph does not grow with the number of mappings.
+        * sourceformat, targetformat:
+            The format URIs of a pair of formats, to summarise only the
+            mappings from the source format to the target format.
+
+        """
+        if aggregate:
+            summary = metarelate.KBaseFormatSummary(self.summary_counts())
+            return summary.dot()
+        format_filter = ''
+        if sourceformat is not None or targetformat is not None:
+            for aformat in [sourceformat, targetformat]:
+                if aformat is None or not _URI.match(aformat):
+                    raise ValueError('invalid format URI: {}'.format(aformat))
+            format_filter = ('FILTER(?sourceformat = {} && '
+                             '?targetformat = {}) '.format(sourceformat,
+                                                           targetformat))
         qstr = ('SELECT ?mapping ?source ?target ?sourceformat '
                 '?targetformat ?invertible ' 
                 'WHERE { '
+                '%s'
                 'GRAPH <http://metarelate.net/mappings.ttl> { '
                 '?mapping rdf:type mr:Mapping . '
-                'MINUS {?mapping ^dc:replaces+ ?anothermap} '
                 '?mapping mr:source ?source ; '
                 ' mr:target ?target ; '
                 ' mr:invertible ?invertible . '
@@ -707,24 +1406,26 @@ class FusekiServer(object):
                 '<http://www.metarelate.net/vocabulary/index.html#Component>) '
                 'FILTER(?targetformat != '
                 '<http://www.metarelate.net/vocabulary/index.html#Component>) '
-                '}} ')
+                '%s'
+                '}} ' % (_CURRENT, format_filter))
         results = self.run_query(qstr)
         summary = metarelate.KBaseSummary(results)
         return summary.dot()
 
     def branch_graph(self, user):
+        """
+        Create a new branch, owned by the user, in a single update request,
+        and return the branch identifier.
+
+        """
         if not user.startswith('https://github.com/'):
             raise ValueError('invalid user URI: {}'.format(user))
         else:
             user = '<{}>'.format(user)
         datestamp = datetime.now().isoformat()
         graphid = metarelate.make_hash({user: datestamp})
-        instr = ('create GRAPH <http://metarelate.net/{g}/concepts.ttl> '
-                 '\n'.format(g=graphid))
-        self.run_query(instr, update=True)
-        instr = ('create GRAPH <http://metarelate.net/{g}/mappings.ttl>'
-                 '\n'.format(g=graphid))
-        self.run_query(instr, update=True)
+        # no CREATE GRAPH: the store does not keep empty named graphs, and
+        # the local backend does not support it
         instr = ('INSERT DATA {\n '
                  '<http://metarelate.net/%(g)s/concepts.ttl>'
                  ' dc:creator %(u)s .\n'
@@ -751,6 +1452,16 @@ class FusekiServer(object):
         return result
 
     def delete_graph(self, graphid, user):
+        """
+        Delete a branch owned by the user.
+
+        A user who is not the owner of the branch is refused, with a
+        ValueError. The branch is then deleted in a single update request,
+        each operation of which is guarded by the ownership of both of the
+        branch's graphs, so the branch is only deleted, as a whole, if the
+        user is still its sole owner when the update is applied.
+
+        """
         if graphid == '':
             raise ValueError('Only branch graphs may be deleted')
         if '{}'.format(graphid) == '':
@@ -759,22 +1470,34 @@ class FusekiServer(object):
             raise ValueError('invalid user URI: {}'.format(user))
         else:
             user = '<{}>'.format(user)
-        branch_owner = self.branch_owner(graphid)['owner']
-        if user != branch_owner:
+        branch_owner = self.branch_owner(graphid)
+        if not branch_owner or user != branch_owner['owner']:
             raise ValueError('this graph is not owned by {}'.format(user))
-        instr = ('DROP GRAPH <http://metarelate.net/{g}concepts.ttl> '
-                 '\n'.format(g=graphid))
-        self.run_query(instr, update=True)
-        instr = ('DELETE DATA { <http://metarelate.net/%(g)sconcepts.ttl> '
-                 'dc:creator %(u)s .}' % {'g':graphid, 'u':user})
-        self.run_query(instr, update=True)
-        instr = ('DROP GRAPH <http://metarelate.net/{g}mappings.ttl>'
-                 '\n'.format(g=graphid))
-        self.run_query(instr, update=True)
-        instr = ('DELETE DATA { <http://metarelate.net/%(g)smappings.ttl> '
-                 'dc:creator %(u)s .}' % {'g':graphid, 'u':user})
-        self.run_query(instr, update=True)
-        
+        owned = ('<http://metarelate.net/%(g)sconcepts.ttl> '
+                 'dc:creator %(u)s .\n'
+                 '<http://metarelate.net/%(g)smappings.ttl> '
+                 'dc:creator %(u)s .\n'
+                 'FILTER NOT EXISTS {\n'
+                 '    VALUES ?graph {\n'
+                 '        <http://metarelate.net/%(g)sconcepts.ttl>\n'
+                 '        <http://metarelate.net/%(g)smappings.ttl> }\n'
+                 '    ?graph dc:creator ?other .\n'
+                 '    FILTER(?other != %(u)s) }\n' % {'g':graphid, 'u':user})
+        ops = []
+        for subgraph in ['concepts.ttl', 'mappings.ttl']:
+            graph = '<http://metarelate.net/{}{}>'.format(graphid, subgraph)
+            ops.append('DELETE { GRAPH %(gr)s { ?s ?p ?o } }\n'
+                       'WHERE { %(o)s GRAPH %(gr)s { ?s ?p ?o } }'
+                       '' % {'gr':graph, 'o':owned})
+        ops.append('DELETE {\n'
+                   '<http://metarelate.net/%(g)sconcepts.ttl> '
+                   'dc:creator %(u)s .\n'
+                   '<http://metarelate.net/%(g)smappings.ttl> '
+                   'dc:creator %(u)s .\n'
+                   '}\n'
+                   'WHERE { %(o)s }' % {'g':graphid, 'u':user, 'o':owned})
+        self.run_query(' ;\n'.join(ops), update=True)
+
 
 
 def process_data(jsondata):
@@ -819,55 +1542,15 @@ def duplicate_mappings(test_source=None, graph=None):
     filter to a single test mapping with test_map
     
     """
-    gstr = ''
-    if graph:
-        gstr = ('FROM <http://metarelate.net/{}mappings.ttl>'
-                'FROM <http://metarelate.net/{}concepts.ttl>'
-                ''.format(graph, graph))
-    tm_filter = ''
+    graphs = (queries.graph_uris('mappings.ttl', graph) +
+              queries.graph_uris('concepts.ttl', graph))
+    sources = ['UNDEF']
     if test_source:
         pattern = '<http.*>'
         pattern = re.compile(pattern)
         if pattern.match(test_source):
-            tm_filter = '\n\tFILTER(?asource = {})'.format(test_source)
-    qstr = ('SELECT ?amap ?asource ?atarget ?bmap ?bsource ?btarget\n'
-            '(GROUP_CONCAT(DISTINCT(?valuemap); SEPARATOR="&") AS ?valuemaps)\n'
-            '(CONCAT(str(?amap), ": ", str(?bmap)) AS ?signature)\n'
-            'FROM <http://metarelate.net/mappings.ttl>\n'
-            'FROM <http://metarelate.net/concepts.ttl>\n'
-            '%(gs)s\n'
-            'WHERE {{\n'
-            '?amap mr:source ?asource ;\n'
-            'mr:target ?atarget . } \n'
-            'UNION \n'
-            '{\n'
-            '?amap mr:invertible "True" ;\n'
-            'mr:target ?asource ;\n'
-            'mr:source ?atarget . } \n'
-            'MINUS {?amap ^dc:replaces+ ?anothermap} \n'
-            '%(tm)s\n'
-            '{\n'
-            '?bmap mr:source ?bsource ;\n'
-            'mr:target ?btarget . } \n'
-            'UNION  \n'
-            '{ \n'
-            '?bmap mr:invertible "True" ;\n'
-            'mr:target ?bsource ;\n'
-            'mr:source ?btarget . } \n'
-            'MINUS {?bmap ^dc:replaces+ ?bnothermap}\n'
-            'filter (?bmap != ?amap)\n'
-            'filter (?bsource = ?asource)\n'
-            'filter (?btarget = ?atarget)\n'
-            '?asource rdf:type ?asourceformat .\n'
-            '?bsource rdf:type ?bsourceformat .\n'
-            '?atarget rdf:type ?atargetformat .\n'
-            '?btarget rdf:type ?btargetformat .\n'
-            'filter (?asourceformat != <http://www.metarelate.net/nulltype>)\n'
-            'filter (?asourceformat != <http://www.metarelate.net/vocabulary/index.html#Component>)\n'
-            '}\n'
-            'GROUP BY ?amap ?asource ?atarget ?bmap ?bsource ?btarget\n'
-            'ORDER BY ?asource\n'
-            '' % ({'gs':gstr, 'tm':tm_filter}))
+            sources = [test_source]
+    qstr = queries.bind('duplicate_mappings', graphs=graphs, sources=sources)
     return qstr
   
 
@@ -909,7 +1592,7 @@ def multiple_mappings(test_source=None, graph=None):
             '?amap mr:invertible "True" ;\n'
             'mr:target ?asource ;\n'
             'mr:source ?atarget . } \n'
-            'MINUS {?amap ^dc:replaces+ ?anothermap} \n'
+            'MINUS {?anothermap dc:replaces ?amap . } \n'
             '%(tm)s\n'
             '{\n'
             '?bmap mr:source ?bsource ;\n'
@@ -919,7 +1602,7 @@ def multiple_mappings(test_source=None, graph=None):
             '?bmap mr:invertible "True" ;\n'
             'mr:target ?bsource ;\n'
             'mr:source ?btarget . } \n'
-            'MINUS {?bmap ^dc:replaces+ ?bnothermap}\n'
+            'MINUS {?bnothermap dc:replaces ?bmap . }\n'
             'filter (?bmap != ?amap)\n'
             'filter (?bsource = ?asource)\n'
             'filter (?btarget != ?atarget)\n'
@@ -935,41 +1618,3 @@ def multiple_mappings(test_source=None, graph=None):
             'ORDER BY ?asource\n'
             '' % ({'gs':gstr, 'tm':tm_filter, 'op':op, 'opf':opf}))
     return qstr
-
-
-def mapping_search(statements=None):
-    """"""
-    if statements is None:
-        statements = []
-    statement_strings = []
-    filter_strings = []
-    for i, statement in enumerate(statements):
-        
-        inpred = statement.get('predicate')
-        pred = '?{}pred'.format(i)
-        inobj = statement.get('rdfobject')
-        rdfobj = '?{}obj'.format(i)
-        ststring = '?aconcept %(p)s %(o)s .' % {'p':pred, 'o':rdfobj}
-        statement_strings.append(ststring)
-        fstring = 'FILTER(regex(str(?{}pred), "{}"))'.format(i, inpred)
-        filter_strings.append(fstring)
-        fstring = 'FILTER(regex(str(?{}obj), "{}"))'.format(i, inobj)
-        filter_strings.append(fstring)
-    statements = '\n'.join(statement_strings)
-    filters = '\n'.join(filter_strings)
-    query_string = ('SELECT DISTINCT ?amap \n'
-                    '(CONCAT(str(?amap)) AS ?signature) \n'
-                    'WHERE { \n'
-                    'GRAPH <http://metarelate.net/concepts.ttl> { \n'
-                    '%s\n'
-                    '%s\n'
-                    '} \n'
-                    'GRAPH <http://metarelate.net/mappings.ttl> { \n'
-                    '{?amap mr:target ?aconcept . }\n'
-                    'UNION\n'
-                    '{?amap mr:source ?aconcept . }\n'
-                    'MINUS {?amap ^dc:replaces+ ?anothermap} \n'
-                    '}}' % (statements, filters))
-            
-    return query_string
-            
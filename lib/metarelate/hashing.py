@@ -0,0 +1,118 @@
+# (C) British Crown Copyright 2015, Met Office
+#
+# This file is part of metarelate.
+#
+# metarelate is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metarelate is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metarelate. If not, see <http://www.gnu.org/licenses/>.
+"""
+Provides the sha1 hashes which identify the records of the knowledge base,
+made from a canonical byte form of their predicates and objects.
+
+"""
+
+import hashlib
+from threading import Lock
+
+import metarelate.prefixes as prefixes
+
+
+# The prefixes do not change once configured, so are built once, and each
+# predicate is expanded once.
+_PREFIXES = None
+_EXPANDED = {}
+_LOCK = Lock()
+
+
+def expand(pred):
+    """
+    Return the full URI of a predicate: a '<prefix>:<item>' CURIE is
+    expanded, using :mod:`metarelate.prefixes`, and a '<uri>' is unchanged.
+
+    """
+    predicate = _EXPANDED.get(pred)
+    if predicate is None:
+        global _PREFIXES
+        with _LOCK:
+            if _PREFIXES is None:
+                _PREFIXES = prefixes.Prefixes()
+        if not pred.startswith('<'):
+            pred_elems = pred.split(':')
+            if len(pred_elems) == 2:
+                if pred_elems[0] in _PREFIXES:
+                    predicate = '%s%s' % (_PREFIXES[pred_elems[0]],
+                                          pred_elems[1])
+                else:
+                    raise ValueError('predicate {} not in prefixes.py'
+                                     ''.format(pred_elems[0]))
+            else:
+                raise ValueError('make hash passed a predicate '
+                                 'which is not of the form <prefix>:<item>')
+        else:
+            predicate = pred
+        _EXPANDED[pred] = predicate
+    return predicate
+
+
+def _bytes(value):
+    # hashlib encodes unicode as ascii
+    if isinstance(value, unicode):
+        value = value.encode('ascii')
+    return value
+
+
+def canonical(pred_obj, omitted=None):
+    """
+    Return the canonical byte form of a dictionary of predicates and
+    objects: each expanded predicate followed by its object, for each of
+    its objects, in the sorted order of the predicates.
+
+    Args:
+    * pred_obj:
+        A dictionary of predicates and lists of objects, or single objects.
+
+    Kwargs:
+    * omitted:
+        A list of predicate strings to be ignored.
+
+    """
+    if omitted is None:
+        omitted = ()
+    parts = []
+    for pred in sorted(pred_obj):
+        if pred not in omitted:
+            predicate = _bytes(expand(pred))
+            objects = pred_obj[pred]
+            if not isinstance(objects, list):
+                objects = [objects]
+            for obj in objects:
+                parts.append(predicate)
+                parts.append(_bytes(obj))
+    return ''.join(parts)
+
+
+def make_hash(pred_obj, omitted=None):
+    """
+    Return the sha1 hex digest of the canonical byte form, from
+    :func:`canonical`, of a dictionary of predicates and objects.
+
+    Args:
+    * pred_obj:
+        A dictionary of predicates and lists of objects, or single objects
+        which will be used, in order, to construct the hash.
+
+    Kwargs:
+    * omitted:
+        A list of predicate strings to be ignored when building the hash.
+
+    """
+    return hashlib.sha1(canonical(pred_obj, omitted)).hexdigest()
@@ -109,3 +109,30 @@ class Prefixes(dict):
         return sorted(self.keys())
 
 
+# the prefixes are configured once, so the prologue of each set of
+# prefixes is built once
+_PREFIXES = None
+_PROLOGUES = {}
+_PREFIXED_NAME = re.compile(r'([A-Za-z][\w-]*):')
+
+
+def sparql_prologue(query_string=None):
+    """
+    Return the SPARQL PREFIX declarations of the prefixes used in a query
+    string, or of all of the prefixes.
+
+    """
+    global _PREFIXES
+    if _PREFIXES is None:
+        _PREFIXES = Prefixes()
+    if query_string is None:
+        used = frozenset(_PREFIXES)
+    else:
+        used = frozenset(_PREFIXED_NAME.findall(query_string))
+        used = used.intersection(_PREFIXES)
+    prologue = _PROLOGUES.get(used)
+    if prologue is None:
+        prologue = ''.join('PREFIX %s: <%s>\n' % (key, _PREFIXES[key]) for
+                           key in sorted(used)) + '\n'
+        _PROLOGUES[used] = prologue
+    return prologue
@@ -0,0 +1,439 @@
+# (C) British Crown Copyright 2015, Met Office
+#
+# This file is part of metarelate.
+#
+# metarelate is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metarelate is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metarelate. If not, see <http://www.gnu.org/licenses/>.
+"""
+Provides a registry of named, parameterised SPARQL query templates.
+
+A template marks its parameters as %(name)s, and is compiled once, when it
+is registered. Each parameter is bound by a binder function, which checks
+its value and returns the SPARQL text to substitute: by default
+:func:`term`, which binds a single RDF term only, quoting any other value
+as a string literal, so a value can not change the structure of the query.
+
+For example::
+
+    >>> template = register('notation',
+    ...                     'SELECT ?n WHERE { %(s)s skos:notation ?n }')
+    >>> print bind('notation', s='<http://www.metarelate.net/a>')
+    SELECT ?n WHERE { <http://www.metarelate.net/a> skos:notation ?n }
+
+"""
+
+from contextlib import contextmanager
+from threading import Lock
+import re
+import time
+
+
+_PARAMETER = re.compile(r'%\((\w+)\)s')
+
+_IRI = r'<[^<>"{}|^`\\\x00-\x20]*>'
+_PREFIXED = r'[A-Za-z][\w-]*:(?:[\w-]|[\w.-]*[\w-])?'
+# the INTEGER, DECIMAL and DOUBLE numerics of the SPARQL grammar
+_NUMERIC = r'[-+]?(?:(?:\d+\.\d*|\.\d+|\d+)[eE][-+]?\d+|\d*\.\d+|\d+)'
+_TERM = re.compile(r'\A(?:{iri}|{prefixed}'
+                   r'|"(?:[^"\\\n\r]|\\.)*"(?:@[A-Za-z]+(?:-[A-Za-z0-9]+)*'
+                   r'|\^\^(?:{iri}|{prefixed}))?'
+                   r'|{numeric}|true|false|UNDEF)\Z'
+                   ''.format(iri=_IRI, prefixed=_PREFIXED, numeric=_NUMERIC))
+_IRI_TERM = re.compile(r'\A{}\Z'.format(_IRI))
+# the special float values, which have no SPARQL numeric form
+_SPECIAL = {'nan': '"NaN"^^xsd:double', 'inf': '"INF"^^xsd:double',
+            '+inf': '"INF"^^xsd:double', 'infinity': '"INF"^^xsd:double',
+            '+infinity': '"INF"^^xsd:double', '-inf': '"-INF"^^xsd:double',
+            '-infinity': '"-INF"^^xsd:double'}
+_BRANCH = re.compile(r'\A\w+/\Z')
+
+
+class Query(str):
+    """
+    The SPARQL text of a bound template, with the template it was bound
+    from, if any, so that running it is timed by its template.
+
+    """
+    template = None
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n').replace('\r', '\\r')
+
+
+def term(value):
+    """
+    Bind a single RDF term: a <uri>, a prefixed name, a literal or a
+    number. The line breaks of a literal are escaped, and any other value
+    is quoted as a string literal.
+
+    """
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, float):
+        value = repr(value)
+    elif isinstance(value, (int, long)):
+        value = str(value)
+    if not isinstance(value, basestring):
+        raise ValueError('{!r} is not an RDF term'.format(value))
+    if _TERM.match(value):
+        return value
+    special = _SPECIAL.get(value.lower())
+    if special is not None:
+        return special
+    if value.startswith('"'):
+        escaped = value.replace('\n', '\\n').replace('\r', '\\r')
+        if _TERM.match(escaped):
+            return escaped
+    return '"{}"'.format(_escape(value))
+
+
+def _iri(value):
+    # graphs are named by <uri>s only
+    if not isinstance(value, basestring) or not _IRI_TERM.match(value):
+        raise ValueError('{!r} is not a graph <uri>'.format(value))
+    return value
+
+
+def terms(values):
+    """Bind a list of RDF terms, for instance the data of a VALUES block."""
+    if isinstance(values, basestring):
+        raise ValueError('{!r} is not a list of RDF terms'.format(values))
+    return ' '.join(term(value) for value in values)
+
+
+def graph_uris(subgraph, graph=None):
+    """
+    Return the list of the <uri>s of a subgraph, such as 'mappings.ttl', of
+    the knowledge base, and of its branch graph, such as 'abc123/', if any.
+
+    """
+    uris = ['<http://metarelate.net/{}>'.format(subgraph)]
+    if graph:
+        if not isinstance(graph, basestring) or not _BRANCH.match(graph):
+            raise ValueError('{!r} is not a branch'.format(graph))
+        uris.append('<http://metarelate.net/{}{}>'.format(graph, subgraph))
+    return uris
+
+
+def from_default(graphs):
+    """Bind a list of graph <uri>s as FROM clauses."""
+    return ''.join('FROM {}\n'.format(_iri(graph)) for graph in graphs)
+
+
+def from_named(graphs):
+    """Bind a list of graph <uri>s as FROM NAMED clauses."""
+    return ''.join('FROM NAMED {}\n'.format(_iri(graph)) for graph in
+                   graphs)
+
+
+def bound(value):
+    """Bind a :class:`Query`, from binding another template, as a part."""
+    if not isinstance(value, Query):
+        raise ValueError('{!r} is not a bound query'.format(value))
+    return value
+
+
+def option(text):
+    """Return a binder which binds True to the text, and False to ''."""
+    def binder(value):
+        return text if value else ''
+    return binder
+
+
+class Template(object):
+    """
+    A named, parameterised SPARQL query template.
+
+    Args:
+    * name:
+        The name of the template.
+    * text:
+        The SPARQL text of the template, with its parameters as %(name)s.
+
+    Kwargs:
+    * binders:
+        The binder function of each parameter not bound by :func:`term`.
+
+    """
+    def __init__(self, name, text, **binders):
+        self.name = name
+        self.text = text
+        # the literal parts of the text, interleaved with parameter names
+        self._parts = _PARAMETER.split(text)
+        self.parameters = frozenset(self._parts[1::2])
+        unknown = set(binders) - self.parameters
+        if unknown:
+            raise ValueError('{} are not parameters of the {} template'
+                             ''.format(sorted(unknown), name))
+        self._binders = dict((param, binders.get(param, term)) for param in
+                             self.parameters)
+        self._stats_lock = Lock()
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def bind(self, **params):
+        """Return the :class:`Query` of the template bound to parameters."""
+        if set(params) != self.parameters:
+            msg = 'the {} template takes the parameters {}, not {}'
+            raise ValueError(msg.format(self.name, sorted(self.parameters),
+                                        sorted(params)))
+        values = dict((param, self._binders[param](value)) for
+                      param, value in params.iteritems())
+        parts = list(self._parts)
+        for i in range(1, len(parts), 2):
+            parts[i] = values[parts[i]]
+        query = Query(''.join(parts))
+        query.template = self
+        return query
+
+    def run(self, fuseki_process, **params):
+        """
+        Bind the template to parameters and run it on a
+        :class:`metarelate.fuseki.FusekiServer`, returning the results.
+
+        """
+        return fuseki_process.run_query(self.bind(**params))
+
+    @contextmanager
+    def timing(self):
+        """
+        A context manager recording the time taken by a run of the
+        template; :meth:`metarelate.fuseki.FusekiServer.run_query` times
+        the queries bound from templates with it.
+
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record(time.time() - start)
+
+    def record(self, elapsed):
+        """Record a run of the template, taking elapsed seconds."""
+        with self._stats_lock:
+            self.calls += 1
+            self.total_time += elapsed
+            self.max_time = max(self.max_time, elapsed)
+
+    def stats(self):
+        """
+        Return a dictionary of the number of 'calls' run, and their
+        'total_time' and 'max_time', in seconds.
+
+        """
+        with self._stats_lock:
+            return {'calls': self.calls, 'total_time': self.total_time,
+                    'max_time': self.max_time}
+
+
+_TEMPLATES = {}
+_LOCK = Lock()
+
+
+def register(name, text, **binders):
+    """
+    Compile and register a query template, replacing any of the same name.
+
+    Args:
+    * name:
+        The name of the template.
+    * text:
+        The SPARQL text of the template, with its parameters as %(name)s.
+
+    Kwargs:
+    * binders:
+        The binder function of each parameter not bound by :func:`term`.
+
+    """
+    template = Template(name, text, **binders)
+    with _LOCK:
+        _TEMPLATES[name] = template
+    return template
+
+
+def get(name):
+    """Return the registered template of a name."""
+    try:
+        return _TEMPLATES[name]
+    except KeyError:
+        raise KeyError('no query template named {!r}'.format(name))
+
+
+def bind(name, **params):
+    """Return the :class:`Query` of a template bound to parameters."""
+    return get(name).bind(**params)
+
+
+def run(name, fuseki_process, **params):
+    """Bind a template to parameters and return the results of running it."""
+    return get(name).run(fuseki_process, **params)
+
+
+def stats():
+    """Return a dictionary of the timing statistics of each template."""
+    with _LOCK:
+        templates = _TEMPLATES.values()
+    return dict((template.name, template.stats()) for template in templates)
+
+
+register('mappings',
+         "SELECT ?mapping ?source ?target ?invertible ?replaces\n"
+         "       ?note ?date ?creator ?rights ?dateAccepted\n"
+         "(GROUP_CONCAT(?rightsHolder; SEPARATOR = '&') AS ?rightsHolders)\n"
+         "(GROUP_CONCAT(?contributor; SEPARATOR = '&') AS ?contributors)\n"
+         "(GROUP_CONCAT(?valueMap; SEPARATOR = '&') AS ?valueMaps)\n"
+         "%(graphs)s"
+         "WHERE {\n"
+         "graph ?g {\n"
+         "VALUES ?mapping { %(mappings)s }\n"
+         "?mapping mr:source ?source ;\n"
+         "     mr:target ?target ;\n"
+         "     mr:invertible ?invertible ;\n"
+         "     dc:date ?date ;\n"
+         "     dc:creator ?creator .\n"
+         "OPTIONAL {?mapping dc:replaces ?replaces .}\n"
+         "OPTIONAL {?mapping skos:note ?note .}\n"
+         "OPTIONAL {?mapping mr:hasValueMap ?valueMap .}\n"
+         "OPTIONAL {?mapping dc:rightsHolder ?rights .}\n"
+         "OPTIONAL {?mapping dc:rightsHolder ?rightsHolder .}\n"
+         "OPTIONAL {?mapping dc:contributor ?contributor .}\n"
+         "OPTIONAL {?mapping dc:dateAccepted ?dateAccepted .}\n"
+         "%(current)s"
+         "}\n\n}\n"
+         "GROUP BY ?mapping ?source ?target ?invertible ?replaces\n"
+         "         ?note ?date ?creator ?rights ?dateAccepted"
+         " \n",
+         graphs=from_named, mappings=terms,
+         current=option('\n\tMINUS {?anothermap dc:replaces ?mapping . }'))
+
+register('mappings_service',
+         "SELECT ?mapping ?source ?target ?invertible ?replaces\n"
+         "       ?note ?date ?creator ?rights ?dateAccepted\n"
+         "       ?rightsHolders ?contributors ?valueMaps\n"
+         "WHERE {\n"
+         "SERVICE %(service)s {"
+         "%(query)s"
+         "}}",
+         query=bound)
+
+register('components',
+         'SELECT ?component ?p ?o \n'
+         '%(graphs)s'
+         'WHERE {\n'
+         'VALUES ?component { %(components)s }\n'
+         'GRAPH ?g {\n'
+         '?component ?p ?o ; \n'
+         'rdf:type mr:Component .\n'
+         'FILTER(?o != mr:Component) } \n'
+         '}\n',
+         graphs=from_named, components=terms)
+
+register('components_service',
+         'SELECT ?component ?p ?o \n'
+         'WHERE {\n'
+         'SERVICE %(service)s {'
+         '%(query)s'
+         '}}',
+         query=bound)
+
+register('identifiers',
+         'SELECT ?key ?value\n'
+         ' WHERE {\n'
+         '  {SELECT ?key ?value\n'
+         '   WHERE {\n'
+         '    {SERVICE %(ps)s \n'
+         '     {SELECT ?key WHERE {\n'
+         '      %(p)s skos:notation ?key .\n'
+         '    }}}\n'
+         '    {SERVICE %(os)s \n'
+         '     {SELECT ?value WHERE {\n'
+         '      %(o)s skos:notation ?value\n'
+         '    }}}\n'
+         '       }}\n'
+         ' UNION \n'
+         '  {SELECT ?key ?value\n'
+         '   WHERE {\n'
+         '    {SERVICE %(ps)s \n'
+         '     {SELECT ?key ?value WHERE {\n'
+         '      %(p)s skos:notation ?key .\n'
+         '      FILTER(isLiteral(%(o)s))\n'
+         '      BIND(%(o)s as ?value)\n'
+         '    }}}\n'
+         '       }}\n'
+         ' UNION \n'
+         '  {SELECT ?key ?value\n'
+         '   WHERE {\n'
+         '    {SERVICE %(os)s \n'
+         '     {SELECT ?key ?value ?idr ?rdfobj ?rdfobjnot WHERE {\n'
+         '      %(o)s <http://metarelate.net/vocabulary/index.html#identifier>'
+         ' ?idr ;\n'
+         '       ?idr ?rdfobj .\n'
+         '      OPTIONAL {?idr skos:notation ?key . }\n'
+         '      OPTIONAL {?rdfobj skos:notation ?rdfobjnot}\n'
+         '      %(ssc)s\n'
+         '      BIND((IF(isURI(?rdfobj), ?rdfobjnot, ?rdfobj)) AS ?value)\n'
+         '     }}\n'
+         '    }\n'
+         '  }}\n'
+         '}',
+         ssc=bound)
+
+register('identifiers_subservice',
+         '{SERVICE %(ps)s \n'
+         '\t\t{SELECT ?idr ?rdfobj ?rdfobjnot ?key WHERE {\n'
+         '\t\tOPTIONAL {?idr skos:notation ?key .} \n'
+         '\t\tOPTIONAL {?rdfobj skos:notation ?rdfobjnot .}\n'
+         '\t}}}')
+
+register('duplicate_mappings',
+         'SELECT ?amap ?asource ?atarget ?bmap ?bsource ?btarget\n'
+         '(GROUP_CONCAT(DISTINCT(?valuemap); SEPARATOR="&") AS ?valuemaps)\n'
+         '(CONCAT(str(?amap), ": ", str(?bmap)) AS ?signature)\n'
+         '%(graphs)s'
+         'WHERE {\n'
+         'VALUES ?asource { %(sources)s }\n'
+         '{\n'
+         '?amap mr:source ?asource ;\n'
+         'mr:target ?atarget . } \n'
+         'UNION \n'
+         '{\n'
+         '?amap mr:invertible "True" ;\n'
+         'mr:target ?asource ;\n'
+         'mr:source ?atarget . } \n'
+         'MINUS {?anothermap dc:replaces ?amap . } \n'
+         '{\n'
+         '?bmap mr:source ?bsource ;\n'
+         'mr:target ?btarget . } \n'
+         'UNION  \n'
+         '{ \n'
+         '?bmap mr:invertible "True" ;\n'
+         'mr:target ?bsource ;\n'
+         'mr:source ?btarget . } \n'
+         'MINUS {?bnothermap dc:replaces ?bmap . }\n'
+         'filter (?bmap != ?amap)\n'
+         'filter (?bsource = ?asource)\n'
+         'filter (?btarget = ?atarget)\n'
+         '?asource rdf:type ?asourceformat .\n'
+         '?bsource rdf:type ?bsourceformat .\n'
+         '?atarget rdf:type ?atargetformat .\n'
+         '?btarget rdf:type ?btargetformat .\n'
+         'filter (?asourceformat != <http://www.metarelate.net/nulltype>)\n'
+         'filter (?asourceformat != '
+         '<http://www.metarelate.net/vocabulary/index.html#Component>)\n'
+         '}\n'
+         'GROUP BY ?amap ?asource ?atarget ?bmap ?bsource ?btarget\n'
+         'ORDER BY ?asource\n',
+         graphs=from_default, sources=terms)
@@ -0,0 +1,267 @@
+# (C) British Crown Copyright 2015, Met Office
+#
+# This file is part of metarelate.
+#
+# metarelate is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metarelate is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metarelate. If not, see <http://www.gnu.org/licenses/>.
+"""
+Provides an in memory inverted index of the concepts in the knowledge base,
+for searching for mappings by the statements made about their concepts.
+
+"""
+
+import bisect
+from collections import defaultdict
+import re
+from threading import Lock
+
+
+#: The length of the substrings indexed for substring matching.
+NGRAM = 3
+
+_TOKEN = re.compile('[A-Za-z0-9]+')
+
+
+def _text(value):
+    # The searchable text of a value, as returned by the FusekiServer:
+    # URIs and literals without their delimiters.
+    if len(value) > 1 and value[0] + value[-1] in ('<>', '""'):
+        value = value[1:-1]
+    return value
+
+
+def _ngrams(text):
+    return set(text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1))
+
+
+class _Postings(object):
+    """
+    An index of a collection of values by the text associated with them,
+    supporting substring and token prefix matching.
+
+    """
+    def __init__(self):
+        # ngram -> values, for substring matching
+        self.ngrams = defaultdict(set)
+        # token -> values, for prefix matching
+        self.tokens = defaultdict(set)
+        # value -> indexed texts
+        self.texts = defaultdict(set)
+        self._sorted_tokens = None
+
+    def add(self, value, text):
+        if text in self.texts[value]:
+            return
+        self.texts[value].add(text)
+        for ngram in _ngrams(text):
+            self.ngrams[ngram].add(value)
+        for token in [text] + _TOKEN.findall(text):
+            if value not in self.tokens[token]:
+                self.tokens[token].add(value)
+                self._sorted_tokens = None
+
+    def containing(self, term):
+        """Return the values with a text containing the term."""
+        if len(term) < NGRAM:
+            candidates = self.texts.iterkeys()
+        else:
+            ngrams = [self.ngrams.get(ngram, set()) for ngram in
+                      _ngrams(term)]
+            candidates = set.intersection(*sorted(ngrams, key=len))
+        return set(value for value in candidates if
+                   any(term in text for text in self.texts[value]))
+
+    def prefixed(self, term):
+        """Return the values with a text or token starting with the term."""
+        if self._sorted_tokens is None:
+            self._sorted_tokens = sorted(self.tokens)
+        result = set()
+        start = bisect.bisect_left(self._sorted_tokens, term)
+        for token in self._sorted_tokens[start:]:
+            if not token.startswith(term):
+                break
+            result.update(self.tokens[token])
+        return result
+
+
+class SearchIndex(object):
+    """
+    An inverted index from the predicate, object and object notation text
+    of the statements about each concept in the knowledge base to the
+    live mappings which have that concept as their source or target.
+
+    """
+    def __init__(self):
+        # concept -> set of (predicate, object) statements
+        self.statements = defaultdict(set)
+        # predicate or object -> concepts with a statement using it
+        self.by_predicate = defaultdict(set)
+        self.by_object = defaultdict(set)
+        # concept -> live mappings with that source or target
+        self.mappings = defaultdict(set)
+        # mapping -> (source, target)
+        self.concepts = {}
+        self.predicates = _Postings()
+        self.objects = _Postings()
+        self._lock = Lock()
+
+    def _graph_queries(self, branch):
+        concepts = ('SELECT ?s ?p ?o\n'
+                    'WHERE { GRAPH <http://metarelate.net/%sconcepts.ttl> {\n'
+                    '    ?s ?p ?o .\n'
+                    '} }' % branch)
+        notations = ('SELECT DISTINCT ?o ?notation\n'
+                     'WHERE {\n'
+                     'GRAPH <http://metarelate.net/%sconcepts.ttl> {\n'
+                     '    ?s ?p ?o .\n'
+                     '}\n'
+                     'GRAPH ?g { ?o skos:notation ?notation . }\n'
+                     '}' % branch)
+        if branch:
+            current = ('    MINUS {?anothermap dc:replaces ?mapping . }\n'
+                       '} }')
+        else:
+            # the main graphs' current mappings are materialised
+            current = ('} GRAPH <http://metarelate.net/current.ttl> {\n'
+                       '    ?mapping rdf:type mr:Mapping .\n'
+                       '} }')
+        mappings = ('SELECT ?mapping ?source ?target ?replaces\n'
+                    'WHERE { GRAPH <http://metarelate.net/%smappings.ttl> {\n'
+                    '    ?mapping mr:source ?source ;\n'
+                    '             mr:target ?target .\n'
+                    '    OPTIONAL {?mapping dc:replaces ?replaces . }\n'
+                    '%s' % (branch, current))
+        return concepts, notations, mappings
+
+    def build(self, fuseki_process):
+        """Index the main graphs of the knowledge base."""
+        self.update(fuseki_process, '')
+
+    def update(self, fuseki_process, branch):
+        """
+        Add the concepts and mappings of a graph to the index, removing
+        any mappings which the graph's mappings replace.
+
+        Args:
+        * fuseki_process:
+            The :class:`metarelate.fuseki.FusekiServer` to query.
+        * branch:
+            The branch prefix of the graphs to index; '' for the main
+            graphs.
+
+        """
+        concepts, notations, mappings = self._graph_queries(branch)
+        concepts = fuseki_process.run_query(concepts)
+        notations = fuseki_process.run_query(notations)
+        mappings = fuseki_process.run_query(mappings)
+        with self._lock:
+            self.add_statements([(r['s'], r['p'], r['o']) for r in concepts])
+            self.add_notations([(r['o'], r['notation']) for r in notations])
+            for mapping in mappings:
+                self.remove_mapping(mapping.get('replaces'))
+                self.add_mapping(mapping['mapping'], mapping['source'],
+                                 mapping['target'])
+
+    def add_statements(self, statements):
+        """Index (concept, predicate, object) statements."""
+        for concept, predicate, rdfobject in statements:
+            self.statements[concept].add((predicate, rdfobject))
+            self.by_predicate[predicate].add(concept)
+            self.by_object[rdfobject].add(concept)
+            self.predicates.add(predicate, _text(predicate))
+            self.objects.add(rdfobject, _text(rdfobject))
+
+    def add_notations(self, notations):
+        """Index the (object, notation) pairs as object text."""
+        for rdfobject, notation in notations:
+            self.objects.add(rdfobject, _text(notation))
+
+    def add_mapping(self, mapping, source, target):
+        """Index a live mapping by its source and target concepts."""
+        self.concepts[mapping] = (source, target)
+        self.mappings[source].add(mapping)
+        self.mappings[target].add(mapping)
+
+    def remove_mapping(self, mapping):
+        """Remove a replaced mapping from the index, if present."""
+        for concept in self.concepts.pop(mapping, ()):
+            self.mappings[concept].discard(mapping)
+
+    def _matches(self, postings, term, prefix):
+        if not term:
+            result = None
+        elif prefix:
+            result = postings.prefixed(term)
+        else:
+            result = postings.containing(term)
+        return result
+
+    def _candidates(self, preds, objs):
+        # The concepts using one of the matched objects, or predicates.
+        if objs is not None:
+            result = set()
+            for obj in objs:
+                result.update(self.by_object[obj])
+        elif preds is not None:
+            result = set()
+            for pred in preds:
+                result.update(self.by_predicate[pred])
+        else:
+            result = set(self.statements)
+        return result
+
+    def search(self, statements):
+        """
+        Return the live mappings with a source or target concept which
+        matches all of the statements.
+
+        Args:
+        * statements:
+            A list of dictionaries, each with a 'predicate' and an
+            'rdfobject' term; a concept matches a statement if it has a
+            predicate and object which both match the terms.  A term
+            matches text containing it, or, if the statement's 'prefix' is
+            True, text with a token starting with it; an empty term
+            matches anything.
+
+        Returns:
+            A list of dictionaries of 'amap' and 'signature', ordered by
+            mapping.
+
+        """
+        with self._lock:
+            concepts = None
+            for statement in statements:
+                prefix = statement.get('prefix', False)
+                preds = self._matches(self.predicates,
+                                      statement.get('predicate'), prefix)
+                objs = self._matches(self.objects,
+                                     statement.get('rdfobject'), prefix)
+                candidates = self._candidates(preds, objs)
+                if concepts is not None:
+                    candidates &= concepts
+                matched = set()
+                for concept in candidates:
+                    for pred, obj in self.statements[concept]:
+                        if (preds is None or pred in preds) and \
+                                (objs is None or obj in objs):
+                            matched.add(concept)
+                            break
+                concepts = matched
+            if concepts is None:
+                concepts = self.statements
+            mappings = set()
+            for concept in concepts:
+                mappings.update(self.mappings.get(concept, ()))
+        return [{'amap': mapping, 'signature': mapping} for mapping in
+                sorted(mappings)]
@@ -0,0 +1,170 @@
+# (C) British Crown Copyright 2015, Met Office
+#
+# This file is part of metarelate.
+#
+# metarelate is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metarelate is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metarelate. If not, see <http://www.gnu.org/licenses/>.
+"""
+Provides retrieval sessions, which share the components populated from
+the knowledge base between the mappings retrieved together.
+
+"""
+
+from threading import Event, Lock
+
+import metarelate
+
+
+class _Entry(object):
+    # A component being, or having been, populated by one thread, which
+    # other threads wait for.
+    def __init__(self):
+        self.component = None
+        self.error = None
+        self._done = Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def set(self, component=None, error=None):
+        self.component = component
+        self.error = error
+        self._done.set()
+
+    def wait(self):
+        self._done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.component
+
+
+class RetrievalSession(object):
+    """
+    An identity map of the components populated during a retrieval, so
+    each component is fetched from the knowledge base once, and the same
+    :class:`metarelate.Component` instance is shared by every mapping, or
+    compound component, referring to it.
+
+    Shared components should not be modified.
+
+    A session may be used by many threads; a thread needing a component
+    which another thread is populating waits for it.
+
+    """
+    def __init__(self):
+        # (uri, graph, service) -> _Entry
+        self._components = {}
+        self._lock = Lock()
+        self.requests = 0
+        self.fetches = 0
+
+    def _entry(self, uri, graph, service):
+        # The entry of a component, and whether it is newly claimed.
+        key = (metarelate.Item(uri).data, graph, service)
+        with self._lock:
+            self.requests += 1
+            entry = self._components.get(key)
+            claimed = entry is None
+            if claimed:
+                entry = _Entry()
+                self._components[key] = entry
+                self.fetches += 1
+        return entry, claimed
+
+    def claim(self, uri, graph=None, service=None):
+        """
+        Return a tuple of the populated component of a URI, or None, and
+        the entry claimed for the caller to populate, or None.
+
+        If the component is being populated by another thread, neither is
+        returned, and the caller should populate its own copy; waiting for
+        it could deadlock, while the caller holds claims of its own.
+        A claimed entry must be released, with its populated component or
+        an error, by calling its set method.
+
+        """
+        entry, claimed = self._entry(uri, graph, service)
+        if claimed:
+            result = (None, entry)
+        elif entry.done:
+            result = (entry.component, None)
+        else:
+            # the caller populates its own copy
+            with self._lock:
+                self.fetches += 1
+            result = (None, None)
+        return result
+
+    def components(self, uris, fuseki_process, graph=None, service=None):
+        """
+        Return the populated components of URIs, populating those not yet
+        populated together, with
+        :func:`metarelate.populate_components`.
+
+        Args:
+        * uris:
+            The URIs of the components.
+        * fuseki_process:
+            The :class:`metarelate.fuseki.FusekiServer` to query.
+
+        Kwargs:
+        * graph:
+            The branch to populate from, as well as the main graphs.
+        * service:
+            The SPARQL service to populate from.
+
+        """
+        results = []
+        pending = []
+        claimed = []
+        for uri in uris:
+            entry, claim = self._entry(uri, graph, service)
+            if claim:
+                component = metarelate.Component(uri)
+                claimed.append((entry, component))
+                pending.append(component)
+            results.append(entry)
+        if claimed:
+            try:
+                metarelate.populate_components(pending, fuseki_process,
+                                               graph, service, session=self)
+            except Exception, e:
+                for entry, component in claimed:
+                    entry.set(error=e)
+                raise
+            for entry, component in claimed:
+                entry.set(component)
+        # other threads' components are waited for once this thread's
+        # claims are released
+        return [entry.wait() for entry in results]
+
+    def component(self, uri, fuseki_process, graph=None, service=None):
+        """
+        Return the populated component of a URI, populating it on first
+        use.
+
+        """
+        component, = self.components([uri], fuseki_process, graph, service)
+        return component
+
+    def stats(self):
+        """
+        Return a dictionary of the number of component 'requests', the
+        number of components 'fetched' from the knowledge base, and the
+        number of requests 'shared' from the identity map instead.
+
+        """
+        with self._lock:
+            return {'requests': self.requests, 'fetched': self.fetches,
+                    'shared': self.requests - self.fetches}
@@ -0,0 +1,252 @@
+# (C) British Crown Copyright 2015, Met Office
+#
+# This file is part of metarelate.
+#
+# metarelate is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metarelate is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metarelate. If not, see <http://www.gnu.org/licenses/>.
+"""
+Provides read-only snapshots of the static data turtle files, compiled
+into SQLite databases with SPO, POS and OSP indexes, keyed by the git sha
+of the static data, and an rdflib store which reads them.
+
+Requires the rdflib package.
+
+To compile a snapshot::
+
+    python -m metarelate.snapshot /path/to/static_dir /path/to/snapshots
+
+"""
+
+import argparse
+import hashlib
+import os
+import sqlite3
+import subprocess
+import tempfile
+import threading
+
+import rdflib
+from rdflib.store import Store
+from rdflib.util import from_n3
+
+
+#: The static data files compiled into a snapshot.
+SUBGRAPHS = ('mappings.ttl', 'concepts.ttl', 'contacts.ttl')
+
+_SCHEMA = ('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);\n'
+           'CREATE TABLE quads (g TEXT, s TEXT, p TEXT, o TEXT);\n')
+
+_INDEXES = ('CREATE INDEX spo ON quads (s, p, o, g);\n'
+            'CREATE INDEX pos ON quads (p, o, s, g);\n'
+            'CREATE INDEX osp ON quads (o, s, p, g);\n'
+            'CREATE INDEX graphs ON quads (g);\n')
+
+
+def static_sha(static_dir):
+    """Return the git sha of the static data directory."""
+    sha = subprocess.check_output(['git', '-C', static_dir, 'rev-parse',
+                                   'HEAD'])
+    return sha.strip()
+
+
+def snapshot_path(directory, sha, updates=()):
+    """Return the path of the snapshot of a git sha and updates."""
+    key = sha
+    if updates:
+        digest = hashlib.sha1('\n'.join(updates).encode('utf-8'))
+        key = '{}-{}'.format(sha, digest.hexdigest()[:12])
+    return os.path.join(directory, 'snapshot-{}.sqlite'.format(key))
+
+
+def compile_snapshot(static_dir, directory, sha=None, updates=()):
+    """
+    Compile the static data turtle files into a snapshot, unless the
+    snapshot of the static data git sha already exists, and return the
+    snapshot path.
+
+    Each file is stored as the named graph http://metarelate.net/<file>.
+
+    Args:
+    * static_dir:
+        The static data directory, holding the metarelate.net graphs.
+    * directory:
+        The directory to write the snapshot to.
+
+    Kwargs:
+    * sha:
+        The git sha of the static data; by default, found with git.
+    * updates:
+        SPARQL updates to run on the graphs before they are stored, such as
+        those building index graphs.
+
+    """
+    if sha is None:
+        sha = static_sha(static_dir)
+    path = snapshot_path(directory, sha, updates)
+    if os.path.exists(path):
+        return path
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp')
+    os.close(fd)
+    try:
+        connection = sqlite3.connect(tmp_path)
+        connection.executescript(_SCHEMA)
+        dataset = rdflib.ConjunctiveGraph()
+        for subgraph in SUBGRAPHS:
+            fpath = os.path.join(static_dir, 'metarelate.net', subgraph)
+            if os.path.exists(fpath):
+                name = rdflib.URIRef('http://metarelate.net/{}'
+                                     ''.format(subgraph))
+                dataset.parse(fpath, format='turtle', publicID=name)
+        for update in updates:
+            dataset.update(update)
+        rows = ((g.identifier.n3(), s.n3(), p.n3(), o.n3()) for
+                s, p, o, g in dataset.quads((None, None, None)))
+        connection.executemany('INSERT INTO quads VALUES (?, ?, ?, ?)', rows)
+        connection.executescript(_INDEXES)
+        connection.execute('INSERT INTO meta VALUES (?, ?)', ('sha', sha))
+        connection.commit()
+        connection.close()
+        os.rename(tmp_path, path)
+    except:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+class SnapshotStore(Store):
+    """
+    A read-only, context aware rdflib store, reading a compiled snapshot.
+
+    Args:
+    * path:
+        The path of the snapshot.
+
+    """
+    context_aware = True
+    formula_aware = False
+    transaction_aware = False
+    graph_aware = False
+
+    def __init__(self, path):
+        super(SnapshotStore, self).__init__()
+        self.path = path
+        # sqlite3 connections may only be used by the thread creating them
+        self._local = threading.local()
+
+    @property
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path)
+            self._local.connection = connection
+        return connection
+
+    @property
+    def sha(self):
+        """The git sha of the static data of the snapshot."""
+        row = self._connection.execute('SELECT value FROM meta '
+                                       'WHERE key = "sha"').fetchone()
+        return row[0] if row else None
+
+    def _context(self, context):
+        if context is None:
+            result = None
+        else:
+            result = getattr(context, 'identifier', context)
+        return result
+
+    def triples(self, triple_pattern, context=None):
+        clauses = []
+        params = []
+        for column, term in zip('spo', triple_pattern):
+            if term is not None:
+                clauses.append('{} = ?'.format(column))
+                params.append(term.n3())
+        identifier = self._context(context)
+        if identifier is not None:
+            clauses.append('g = ?')
+            params.append(identifier.n3())
+        qstr = 'SELECT s, p, o, g FROM quads'
+        if clauses:
+            qstr += ' WHERE ' + ' AND '.join(clauses)
+        qstr += ' ORDER BY s, p, o'
+        current = None
+        graphs = []
+        for s, p, o, g in self._connection.execute(qstr, params):
+            if (s, p, o) != current:
+                if current is not None:
+                    yield self._triple(current), iter(graphs)
+                current = (s, p, o)
+                graphs = []
+            graphs.append(from_n3(g))
+        if current is not None:
+            yield self._triple(current), iter(graphs)
+
+    def _triple(self, terms):
+        return tuple(from_n3(term) for term in terms)
+
+    def __len__(self, context=None):
+        identifier = self._context(context)
+        if identifier is None:
+            qstr = 'SELECT COUNT(*) FROM (SELECT DISTINCT s, p, o FROM quads)'
+            params = []
+        else:
+            qstr = 'SELECT COUNT(*) FROM quads WHERE g = ?'
+            params = [identifier.n3()]
+        return self._connection.execute(qstr, params).fetchone()[0]
+
+    def contexts(self, triple=None):
+        if triple is None:
+            rows = self._connection.execute('SELECT DISTINCT g FROM quads')
+            for row in rows:
+                yield from_n3(row[0])
+        else:
+            for _, graphs in self.triples(triple):
+                for graph in graphs:
+                    yield graph
+
+    def add(self, triple, context, quoted=False):
+        raise TypeError('a snapshot store is read-only')
+
+    def addN(self, quads):
+        raise TypeError('a snapshot store is read-only')
+
+    def remove(self, triple, context=None):
+        raise TypeError('a snapshot store is read-only')
+
+    def close(self, commit_pending_transaction=False):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+def main(argv=None):
+    # imported here, as metarelate.fuseki imports this module
+    from metarelate.fuseki import snapshot_updates
+    parser = argparse.ArgumentParser(description='Compile the metarelate '
+                                     'static data into a read-only snapshot.')
+    parser.add_argument('static_dir', help='the static data directory')
+    parser.add_argument('directory', help='the snapshot directory')
+    parser.add_argument('--sha', help='the git sha of the static data')
+    args = parser.parse_args(argv)
+    # the snapshot the 'snapshot' backend of FusekiServer opens
+    print compile_snapshot(args.static_dir, args.directory, args.sha,
+                           snapshot_updates())
+
+
+if __name__ == '__main__':
+    main()
@@ -19,10 +19,14 @@ Test the metarelate Apache Fuseki server.
 
 """
 
+import json
 import unittest
 
 import metarelate
+import metarelate.queries as queries
 import metarelate.tests as tests
+from metarelate.backends import rdflib
+from metarelate.cache import ResultCache
 from metarelate.fuseki import FusekiServer
 
 SCHEME_CF = '<http://def.scitools.org.uk/cfdatamodel/Field>'
@@ -46,6 +50,183 @@ class TestFuseki(tests.MetarelateTestCase):
         imappings = self.fuseki.retrieve_mappings(SCHEME_CF, SCHEME_UM)
         self.assertEqual(len(imappings), 1)
 
+    def test_retrieve_timing(self):
+        before = queries.get('mappings').stats()['calls']
+        qstr = ('SELECT ?mapping WHERE { '
+                'GRAPH <http://metarelate.net/current.ttl> { '
+                '?mapping rdf:type mr:Mapping . } }')
+        uris = [row['mapping'] for row in self.fuseki.run_query(qstr)]
+        qstr = metarelate.mappings_sparql_retriever(uris)
+        self.assertEqual(len(self.fuseki.run_query(qstr)), len(uris))
+        self.assertEqual(queries.get('mappings').stats()['calls'],
+                         before + 1)
+
+    def test_retrieve_mapping_templates(self):
+        templates = self.fuseki.retrieve_mapping_templates(SCHEME_UM,
+                                                           SCHEME_CF)
+        templates = json.loads(templates)
+        self.assertEqual([t['inverted'] for t in templates], ['"False"'])
+        templates = self.fuseki.retrieve_mapping_templates(SCHEME_CF,
+                                                           SCHEME_UM)
+        templates = json.loads(templates)
+        self.assertEqual([t['inverted'] for t in templates], ['"True"'])
+
+    def test_current_mappings(self):
+        qstr = ('SELECT ?mapping WHERE { '
+                'GRAPH <http://metarelate.net/mappings.ttl> { '
+                '?mapping rdf:type mr:Mapping . '
+                'MINUS {?mapping ^dc:replaces+ ?anothermap} } } '
+                'ORDER BY ?mapping')
+        expected = self.fuseki.run_query(qstr)
+        qstr = ('SELECT ?mapping WHERE { '
+                'GRAPH <http://metarelate.net/current.ttl> { '
+                '?mapping rdf:type mr:Mapping . } } '
+                'ORDER BY ?mapping')
+        self.assertEqual(self.fuseki.run_query(qstr), expected)
+        self.assertTrue(expected)
+
+    def test_control_panel(self):
+        user = 'https://github.com/metarelate-test'
+        branch = self.fuseki.branch_graph(user)
+        try:
+            cpanel = self.fuseki.control_panel(branch)
+            self.assertEqual(cpanel['owner'], '<{}>'.format(user))
+            self.assertEqual(cpanel['mappings'], [])
+            self.assertEqual(cpanel['branches'], [])
+            self.assertEqual(cpanel['revision'],
+                             self.fuseki.branch_hash(branch))
+            cpanel = self.fuseki.control_panel(user=user)
+            self.assertEqual(cpanel['branches'], [branch])
+        finally:
+            self.fuseki.delete_graph(branch, user)
+
+    def test_delete_graph(self):
+        user = 'https://github.com/metarelate-test'
+        branch = self.fuseki.branch_graph(user)
+        try:
+            with self.assertRaises(ValueError):
+                self.fuseki.delete_graph(branch, 'https://github.com/other')
+            self.assertEqual(self.fuseki.branch_owner(branch),
+                             {'owner': '<{}>'.format(user)})
+            # another creator of either of the branch's graphs guards it
+            instr = ('{} DATA {{ <http://metarelate.net/{}concepts.ttl> '
+                     'dc:creator <https://github.com/other> . }}')
+            self.fuseki.run_query(instr.format('INSERT', branch), update=True)
+            self.fuseki.delete_graph(branch, user)
+            self.assertEqual(self.fuseki.branch_owner(branch),
+                             {'owner': '<{}>'.format(user)})
+            self.fuseki.run_query(instr.format('DELETE', branch), update=True)
+        finally:
+            self.fuseki.delete_graph(branch, user)
+        self.assertEqual(self.fuseki.branch_owner(branch), '')
+
+    def test_branch_hash(self):
+        user = 'https://github.com/metarelate-test'
+        branch = self.fuseki.branch_graph(user)
+        try:
+            empty = self.fuseki.branch_hash(branch)
+            instr = ('INSERT DATA {{ GRAPH <http://metarelate.net/{}'
+                     'concepts.ttl> {{ <http://www.metarelate.net/test/c1> '
+                     'skos:notation "{}" . }} }}')
+            self.fuseki.run_query(instr.format(branch, 'a'), update=True)
+            first = self.fuseki.branch_hash(branch)
+            self.assertNotEqual(first, empty)
+            self.assertEqual(self.fuseki.branch_hash(branch), first)
+            self.fuseki.run_query(instr.format(branch, 'bc'), update=True)
+            second = self.fuseki.branch_hash(branch)
+            self.assertNotEqual(second, first)
+            # an edit which keeps the length of the content
+            instr = ('DELETE DATA {{ GRAPH <http://metarelate.net/{}'
+                     'concepts.ttl> {{ <http://www.metarelate.net/test/c1> '
+                     'skos:notation "bc" . }} }} ;\n'
+                     'INSERT DATA {{ GRAPH <http://metarelate.net/{}'
+                     'concepts.ttl> {{ <http://www.metarelate.net/test/c1> '
+                     'skos:notation "cd" . }} }}')
+            self.fuseki.run_query(instr.format(branch, branch), update=True)
+            self.assertNotIn(self.fuseki.branch_hash(branch),
+                             [empty, first, second])
+        finally:
+            self.fuseki.delete_graph(branch, user)
+
+    def test_result_cache(self):
+        user = 'https://github.com/metarelate-test'
+        qstr = ('SELECT ?g WHERE {{ ?g dc:creator <{}> }} '
+                'ORDER BY ?g'.format(user))
+        self.fuseki._results = ResultCache()
+        try:
+            before = self.fuseki.run_query(qstr)
+            self.assertEqual(self.fuseki.run_query(qstr), before)
+            self.assertEqual(self.fuseki.result_cache_stats()['hits'], 1)
+            branch = self.fuseki.branch_graph(user)
+            try:
+                after = self.fuseki.run_query(qstr)
+                self.assertEqual(len(after), len(before) + 2)
+            finally:
+                self.fuseki.delete_graph(branch, user)
+            self.assertEqual(self.fuseki.run_query(qstr), before)
+        finally:
+            self.fuseki._results = None
+
+    def _requests(self, method, *args):
+        # The result of a method, with the queries it ran.
+        queried = []
+        run_query = self.fuseki.run_query
+        def counting(query_string, *qargs, **kwargs):
+            queried.append(query_string)
+            return run_query(query_string, *qargs, **kwargs)
+        self.fuseki.run_query = counting
+        try:
+            return method(*args), queried
+        finally:
+            del self.fuseki.run_query
+
+    def test_rebase_large_branch(self):
+        # a synthetic large branch: a copy of the main concepts graph, which
+        # the rebase removes, and many new triples, which it keeps, in a
+        # query per subgraph and a single update
+        user = 'https://github.com/metarelate-test'
+        branch = self.fuseki.branch_graph(user)
+        graph = '<http://metarelate.net/{}concepts.ttl>'.format(branch)
+        count = ('SELECT (COUNT(*) AS ?n) WHERE {{ GRAPH {} '
+                 '{{ ?s ?p ?o }} }}')
+        try:
+            instr = ('INSERT {{ GRAPH {} {{ ?s ?p ?o }} }}\n'
+                     'WHERE {{ GRAPH <http://metarelate.net/concepts.ttl> '
+                     '{{ ?s ?p ?o }} }}'.format(graph))
+            self.fuseki.run_query(instr, update=True)
+            main = int(self.fuseki.run_query(count.format(
+                '<http://metarelate.net/concepts.ttl>'))[0]['n'])
+            new = 20000
+            for start in range(0, new, 50):
+                triples = ['<http://www.metarelate.net/test/component/c{}> '
+                           'skos:notation "{}" .'.format(i, i)
+                           for i in range(start, start + 50)]
+                instr = 'INSERT DATA {{ GRAPH {} {{\n{}\n}} }}'
+                self.fuseki.run_query(instr.format(graph, '\n'.join(triples)),
+                                      update=True)
+            removed, queried = self._requests(self.fuseki.rebase_branch,
+                                              branch)
+            self.assertEqual(removed, {'mappings.ttl': 0,
+                                       'concepts.ttl': main})
+            self.assertEqual(len(queried), 3)
+            remaining = int(self.fuseki.run_query(count.format(graph))[0]['n'])
+            self.assertEqual(remaining, new)
+            removed, queried = self._requests(self.fuseki.rebase_branch,
+                                              branch)
+            self.assertEqual(removed, {'mappings.ttl': 0, 'concepts.ttl': 0})
+            self.assertEqual(len(queried), 2)
+        finally:
+            self.fuseki.delete_graph(branch, user)
+
+
+@unittest.skipIf(rdflib is None, 'requires rdflib')
+class TestLocal(TestFuseki):
+    # The same tests, on the in-process local backend, which start() alone
+    # loads and indexes.
+    @classmethod
+    def setUpClass(cls):
+        cls.fuseki = FusekiServer(test=True, backend='local')
+        cls.fuseki.start()
 
 
 if __name__ == '__main__':
@@ -19,6 +19,7 @@ Unit tests for the `metarelateTest.Component` class.
 
 """
 
+import re
 import unittest
 
 import metarelate
@@ -49,6 +50,33 @@ class Test_checks(tests.MetarelateTestCase):
         comp3 = stock.simple_component_um()
         self.assertNotEqual(comp1, comp3)
 
+    def test_eq_property_order(self):
+        comp1 = stock.simple_component_cf()
+        comp2 = stock.simple_component_cf()
+        comp2.properties.reverse()
+        self.assertEqual(comp1, comp2)
+
+    def test_hash(self):
+        comps = [stock.simple_component_cf(), stock.simple_component_um(),
+                 stock.simple_component_cf()]
+        self.assertEqual(len(set(comps)), 2)
+
+    def test_content_key_changes(self):
+        comp = stock.simple_component_cf()
+        key = comp.content_key
+        comp.properties.pop()
+        self.assertNotEqual(comp.content_key, key)
+
+    def test_content_key_property_changes(self):
+        comp = stock.simple_component_cf()
+        other = stock.simple_component_cf()
+        key = comp.content_key
+        self.assertEqual(comp, other)
+        prop = comp.properties[0]
+        prop.rdfobject = metarelate.Item('"changed"')
+        self.assertNotEqual(comp.content_key, key)
+        self.assertNotEqual(comp, other)
+
 class Test_attrs(tests.MetarelateTestCase):
     def test_getattr(self):
         prop = stock.property_cf_standard_name()
@@ -77,5 +105,57 @@ class Test_attrs(tests.MetarelateTestCase):
         self.assertEqual(len(comp), 2)
 
 
+class FakeProcess(object):
+    # Answers component queries from a tree of components, recording the
+    # URIs of each query.
+    def __init__(self, members):
+        self.members = members
+        self.queries = []
+
+    def run_query(self, qstr):
+        values, = re.findall(r'VALUES \?component \{([^}]*)\}', qstr)
+        uris = values.split()
+        self.queries.append(sorted(uris))
+        result = []
+        for uri in uris:
+            result.append({'component': uri, 'p': '<https://example.com/n>',
+                           'o': '"{}"'.format(uri)})
+            for member in self.members.get(uri, []):
+                result.append({'component': uri,
+                               'p': '<https://example.com/member>',
+                               'o': member})
+        return result
+
+
+class Test_populate_from_uri(tests.MetarelateTestCase):
+    def setUp(self):
+        # avoid resolving the notations of the test component URIs
+        self._get_notation = metarelate.get_notation
+        metarelate.get_notation = lambda uri: None
+
+    def tearDown(self):
+        metarelate.get_notation = self._get_notation
+
+    def _comp(self, name):
+        return '<http://www.metarelate.net/metOcean/component/{}>'.format(name)
+
+    def test_breadth_first(self):
+        field, dim1, dim2, cm = [self._comp(name) for name in
+                                 ['field', 'dim1', 'dim2', 'cm']]
+        process = FakeProcess({field: [dim1, dim2], dim1: [cm], dim2: [cm]})
+        comp = metarelate.Component(field)
+        comp.populate_from_uri(process)
+        self.assertEqual(process.queries, [[field], [dim1, dim2], [cm]])
+        members = [prop.component for prop in comp.properties if
+                   isinstance(prop, metarelate.ComponentProperty)]
+        self.assertEqual([member.uri.data for member in members],
+                         [dim1, dim2])
+        cms = [prop.component for member in members for prop in
+               member.properties if
+               isinstance(prop, metarelate.ComponentProperty)]
+        self.assertIs(cms[0], cms[1])
+        self.assertEqual(len(cms[0].properties), 1)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,67 @@
+# (C) British Crown Copyright 2015, Met Office
+#
+# This file is part of metarelate.
+#
+# metarelate is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metarelate is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metarelate. If not, see <http://www.gnu.org/licenses/>.
+"""
+Unit tests for the `metarelate.cache.DiskCache` class.
+
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import metarelate.tests as tests
+from metarelate.cache import DiskCache
+
+
+class Test(tests.MetarelateTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_get_set(self):
+        cache = DiskCache(self.directory, suffix='.svg')
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', '<svg/>')
+        self.assertEqual(cache.get('a'), '<svg/>')
+        self.assertIn('a', cache)
+        self.assertIsNotNone(cache.mtime('a'))
+
+    def test_unicode_key(self):
+        cache = DiskCache(self.directory)
+        key = u'svg mapping <http://www.metarelate.net/caf\xe9>'
+        cache.set(key, 'value')
+        self.assertEqual(cache.get(key), 'value')
+        self.assertEqual(cache.path(key), cache.path(key.encode('utf-8')))
+
+    def test_maxsize(self):
+        cache = DiskCache(self.directory, suffix='.svg', maxsize=2)
+        for age, key in enumerate(['c', 'b', 'a']):
+            cache.set(key, key)
+            # stored in order, a second apart
+            mtime = 1000000000 - 10 + age
+            os.utime(cache.path(key), (mtime, mtime))
+        self.assertNotIn('c', cache)
+        self.assertEqual(cache.get('b'), 'b')
+        self.assertEqual(cache.get('a'), 'a')
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+# (C) British Crown Copyright 2015, Met Office
+#
+# This file is part of metarelate.
+#
+# metarelate is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metarelate is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metarelate. If not, see <http://www.gnu.org/licenses/>.
+"""
+Unit tests for the `metarelate.backends.FusekiBackend` class.
+
+"""
+
+import unittest
+
+import metarelate.tests as tests
+import metarelate.backends as backends
+from metarelate.backends import FusekiBackend
+
+
+class FakeResponse(object):
+    status_code = 200
+    text = '{"head": {"vars": []}, "results": {"bindings": []}}'
+
+
+class FakeRequests(object):
+    # records the HTTP method of each request
+    def __init__(self):
+        self.methods = []
+
+    def get(self, url, **kwargs):
+        self.methods.append(('GET', url, kwargs.get('params')))
+        return FakeResponse()
+
+    def post(self, url, **kwargs):
+        self.methods.append(('POST', url, kwargs.get('data')))
+        return FakeResponse()
+
+
+class Test(tests.MetarelateTestCase):
+    def setUp(self):
+        self.requests = backends.requests
+        backends.requests = FakeRequests()
+
+    def tearDown(self):
+        backends.requests = self.requests
+
+    def test_short_query_get(self):
+        backend = FusekiBackend('localhost', 3131, 'metOcean')
+        backend.query('SELECT ?s WHERE { ?s ?p ?o }')
+        method, url, params = backends.requests.methods[0]
+        self.assertEqual(method, 'GET')
+        self.assertEqual(url, 'http://localhost:3131/metOcean/query')
+
+    def test_long_query_post(self):
+        backend = FusekiBackend('localhost', 3131, 'metOcean',
+                                max_url_length=100)
+        qstr = 'SELECT ?s WHERE { ?s ?p ?o } VALUES ?s { %s }' % (
+            ' '.join('<http://a/%d>' % i for i in range(20)))
+        backend.query(qstr)
+        method, url, params = backends.requests.methods[0]
+        self.assertEqual(method, 'POST')
+        self.assertEqual(url, 'http://localhost:3131/metOcean/query')
+        self.assertEqual(params, {'query': qstr, 'output': 'json'})
+
+    def test_remote_long_query_post(self):
+        backend = FusekiBackend('example.org', None, 'metOcean',
+                                max_url_length=10)
+        backend.query('SELECT ?s WHERE { ?s ?p ?o }')
+        method, url, params = backends.requests.methods[0]
+        self.assertEqual(method, 'POST')
+        self.assertEqual(url, 'http://example.org/metOcean')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+# (C) British Crown Copyright 2015, Met Office
+#
+# This file is part of metarelate.
+#
+# metarelate is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metarelate is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metarelate. If not, see <http://www.gnu.org/licenses/>.
+"""
+Unit tests for the `metarelate.fuseki.FusekiServer` class.
+
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+import metarelate.tests as tests
+from metarelate.fuseki import FusekiServer
+
+
+class Test_latest_sha(tests.MetarelateTestCase):
+    def setUp(self):
+        self.static_dir = tempfile.mkdtemp()
+        self.fuseki = FusekiServer(test=True, backend='local')
+        self.fuseki._static_dir = self.static_dir
+
+    def tearDown(self):
+        shutil.rmtree(self.static_dir)
+
+    def _commit(self, message):
+        git = ['git', '-C', self.static_dir, '-c', 'user.name=test',
+               '-c', 'user.email=test@example.com']
+        with open(os.devnull, 'w') as devnull:
+            if not os.path.isdir(os.path.join(self.static_dir, '.git')):
+                subprocess.check_call(git + ['init'], stdout=devnull,
+                                      stderr=devnull)
+            subprocess.check_call(git + ['commit', '--allow-empty', '-m',
+                                         message], stdout=devnull)
+        return subprocess.check_output(git + ['rev-parse', 'HEAD'])
+
+    def test_remembered(self):
+        sha = self._commit('one')
+        self.assertEqual(self.fuseki.latest_sha(), sha)
+        self.assertEqual(self.fuseki.latest_sha(), sha)
+
+    def test_commit_elsewhere(self):
+        # a commit which the server does not make itself, as by another
+        # process, is seen
+        self._commit('one')
+        self.fuseki.latest_sha()
+        sha = self._commit('two')
+        self.assertEqual(self.fuseki.latest_sha(), sha)
+
+
+if __name__ == '__main__':
+    unittest.main()
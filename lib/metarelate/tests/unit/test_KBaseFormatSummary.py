@@ -0,0 +1,57 @@
+# (C) British Crown Copyright 2015, Met Office
+#
+# This file is part of metarelate.
+#
+# metarelate is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metarelate is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metarelate. If not, see <http://www.gnu.org/licenses/>.
+"""
+Unit tests for the `metarelate.KBaseFormatSummary` class.
+
+"""
+
+import unittest
+
+import metarelate.tests as tests
+import metarelate
+
+UM = '<http://reference.metoffice.gov.uk/um/f3/UMField>'
+CF = '<http://def.scitools.org.uk/cfdatamodel/Field>'
+GRIB = '<http://def.scitools.org.uk/grib2/GRIB2Message>'
+
+
+class Test_dot(tests.MetarelateTestCase):
+    def setUp(self):
+        results = [{'sourceformat': UM, 'targetformat': CF,
+                    'mappings': '12000', 'invertibles': '0'},
+                   {'sourceformat': GRIB, 'targetformat': CF,
+                    'mappings': '40', 'invertibles': '40'},
+                   {'sourceformat': CF, 'targetformat': GRIB,
+                    'mappings': '3', 'invertibles': '0'}]
+        self.graph = metarelate.KBaseFormatSummary(results).dot()
+
+    def test_nodes(self):
+        self.assertEqual(len(self.graph.get_nodes()), 3)
+
+    def test_edges(self):
+        labels = [edge.get_label() for edge in self.graph.get_edges()]
+        self.assertEqual(labels, ['12000', '40 (40 invertible)', '3'])
+
+    def test_weights(self):
+        widths = [float(edge.get_penwidth()) for edge in
+                  self.graph.get_edges()]
+        self.assertEqual(widths[0], 5.0)
+        self.assertGreater(widths[1], widths[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+# (C) British Crown Copyright 2015, Met Office
+#
+# This file is part of metarelate.
+#
+# metarelate is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metarelate is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metarelate. If not, see <http://www.gnu.org/licenses/>.
+"""
+Unit tests for the `metarelate.cache.LRUCache` class.
+
+"""
+
+import shutil
+import tempfile
+import unittest
+
+import metarelate.tests as tests
+from metarelate.cache import LRUCache
+
+
+class Test(tests.MetarelateTestCase):
+    def test_hits_and_misses(self):
+        cache = LRUCache()
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', {'units': 'K'})
+        self.assertEqual(cache.get('a'), {'units': 'K'})
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'size': 1})
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_persisted(self):
+        directory = tempfile.mkdtemp()
+        try:
+            LRUCache(directory=directory).set('a', {'units': 'K'})
+            cache = LRUCache(directory=directory)
+            self.assertEqual(cache.get('a'), {'units': 'K'})
+            self.assertEqual(cache.stats(), {'hits': 1, 'misses': 0,
+                                             'size': 1})
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+# (C) British Crown Copyright 2015, Met Office
+#
+# This file is part of metarelate.
+#
+# metarelate is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metarelate is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metarelate. If not, see <http://www.gnu.org/licenses/>.
+"""
+Unit tests for the `metarelate.backends.LocalBackend` class.
+
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import metarelate.tests as tests
+from metarelate.backends import LocalBackend, rdflib
+from metarelate.fuseki import process_data
+import metarelate.prefixes as prefixes
+
+CONCEPTS = '''
+@prefix skos: <http://www.w3.org/2004/02/skos/core#> .
+<http://www.metarelate.net/test/component/c1> skos:notation "one" .
+<http://www.metarelate.net/test/component/c2> skos:notation "two" .
+'''
+
+
+@unittest.skipIf(rdflib is None, 'requires rdflib')
+class Test(tests.MetarelateTestCase):
+    def setUp(self):
+        self.static_dir = tempfile.mkdtemp()
+        graphs = os.path.join(self.static_dir, 'metarelate.net')
+        os.mkdir(graphs)
+        with open(os.path.join(graphs, 'concepts.ttl'), 'w') as ttl:
+            ttl.write(CONCEPTS)
+        self.backend = LocalBackend(self.static_dir)
+        self.backend.load()
+
+    def tearDown(self):
+        shutil.rmtree(self.static_dir)
+
+    def _query(self, qstr):
+        pref = prefixes.Prefixes().sparql
+        return process_data(self.backend.query(pref + qstr))
+
+    def test_query(self):
+        qstr = ('SELECT ?notation WHERE { '
+                'GRAPH <http://metarelate.net/concepts.ttl> '
+                '{ ?s skos:notation ?notation } } ORDER BY ?notation')
+        self.assertEqual(self._query(qstr),
+                         [{'notation': '"one"'}, {'notation': '"two"'}])
+
+    def test_update(self):
+        pref = prefixes.Prefixes().sparql
+        self.backend.update(pref +
+                            'INSERT DATA { <http://metarelate.net/b/c.ttl> '
+                            'dc:creator <https://github.com/test> . } ;\n'
+                            'INSERT DATA { GRAPH <http://metarelate.net/b/c.ttl> '
+                            '{ <http://metarelate.net/b/c.ttl> a skos:Concept '
+                            '} }')
+        qstr = 'SELECT ?g WHERE { ?g dc:creator <https://github.com/test> }'
+        self.assertEqual(self._query(qstr),
+                         [{'g': '<http://metarelate.net/b/c.ttl>'}])
+
+    def test_reload(self):
+        self.backend.update('DROP GRAPH <http://metarelate.net/concepts.ttl>')
+        self.backend.load(['concepts.ttl'])
+        qstr = ('SELECT (COUNT(*) AS ?n) WHERE { '
+                'GRAPH <http://metarelate.net/concepts.ttl> { ?s ?p ?o } }')
+        self.assertEqual(self._query(qstr), [{'n': '2'}])
+
+    def test_not_loaded(self):
+        self.backend.clear()
+        with self.assertRaises(RuntimeError):
+            self.backend.query('SELECT * WHERE { ?s ?p ?o }')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -37,6 +37,11 @@ class Test_checks(tests.MetarelateTestCase):
                                      stock.simple_component_um())
         self.assertNotEqual(self.mapping, mapping)
 
+    def test_hash(self):
+        mappings = [self.mapping, stock.simple_mapping_um_cf()]
+        self.assertEqual(len(set(mappings)), 1)
+        self.assertEqual(mappings[0].content_key, mappings[1].content_key)
+
     def test_dot(self):
         self.check_dot(self.mapping)
 
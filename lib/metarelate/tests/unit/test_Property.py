@@ -22,6 +22,7 @@ Test the metarelate framework.
 import unittest
 
 import metarelate
+from metarelate.cache import LRUCache
 import metarelate.fuseki
 import metarelate.tests as tests
 import metarelate.tests.stock as stock
@@ -42,6 +43,22 @@ class Test_StatementProperty(tests.MetarelateTestCase):
             self.assertEqual(self.prop.get_identifiers(fu_p),
                              expected)
 
+    def test_get_identifiers_cached(self):
+        class FakeProcess(object):
+            queries = 0
+            def run_query(self, qstr):
+                self.queries += 1
+                return [{'key': '"units"', 'value': '"K"'}]
+        fu_p = FakeProcess()
+        cache = LRUCache()
+        first = self.prop.get_identifiers(fu_p, cache)
+        first['wibble'] = 'wobble'
+        second = self.prop.get_identifiers(fu_p, cache)
+        self.assertEqual(fu_p.queries, 1)
+        self.assertNotIn('wibble', second)
+        self.assertEqual(second['units'], 'K')
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'size': 1})
+
 
 if __name__ == '__main__':
     unittest.main()
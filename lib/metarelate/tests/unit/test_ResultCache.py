@@ -0,0 +1,75 @@
+# (C) British Crown Copyright 2015, Met Office
+#
+# This file is part of metarelate.
+#
+# metarelate is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metarelate is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metarelate. If not, see <http://www.gnu.org/licenses/>.
+"""
+Unit tests for the `metarelate.cache.ResultCache` class.
+
+"""
+
+import time
+import unittest
+
+import metarelate.tests as tests
+from metarelate.cache import ResultCache, normalise_query
+
+
+class Test(tests.MetarelateTestCase):
+    def test_normalised(self):
+        cache = ResultCache()
+        cache.set('SELECT ?s\n  WHERE { ?s ?p "a  b" }', '[1]')
+        self.assertEqual(cache.get('SELECT ?s WHERE {\n?s ?p "a  b" }  '),
+                         '[1]')
+        self.assertIsNone(cache.get('SELECT ?s WHERE { ?s ?p "a b" }'))
+        self.assertEqual(cache.stats()['hit_rate'], 0.5)
+
+    def test_normalise_query(self):
+        qstr = ' SELECT  ?s\n\tWHERE { ?s <http://a/b> "x\\"  y"\n}\n'
+        self.assertEqual(normalise_query(qstr),
+                         'SELECT ?s WHERE { ?s <http://a/b> "x\\"  y" }')
+
+    def test_bump(self):
+        cache = ResultCache()
+        cache.set('q', '[1]')
+        generation = cache.generation
+        cache.bump()
+        self.assertIsNone(cache.get('q'))
+        # a result of a query run before the store changed is not stored
+        cache.set('q', '[1]', generation)
+        self.assertIsNone(cache.get('q'))
+        cache.set('q', '[2]', cache.generation)
+        self.assertEqual(cache.get('q'), '[2]')
+
+    def test_evicts_least_recently_used(self):
+        cache = ResultCache(maxsize=2)
+        cache.set('a', '1')
+        cache.set('b', '2')
+        cache.get('a')
+        cache.set('c', '3')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), '1')
+        self.assertEqual(len(cache), 2)
+
+    def test_ttl(self):
+        cache = ResultCache(ttl=0.05)
+        cache.set('a', '1')
+        self.assertEqual(cache.get('a'), '1')
+        time.sleep(0.1)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
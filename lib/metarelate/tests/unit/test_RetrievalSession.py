@@ -0,0 +1,114 @@
+# (C) British Crown Copyright 2015, Met Office
+#
+# This file is part of metarelate.
+#
+# metarelate is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metarelate is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metarelate. If not, see <http://www.gnu.org/licenses/>.
+"""
+Unit tests for the `metarelate.session.RetrievalSession` class.
+
+"""
+
+import re
+import unittest
+
+import metarelate
+import metarelate.tests as tests
+from metarelate.session import RetrievalSession
+
+RDF_TYPE = '<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>'
+NAME = '<https://example.com/name>'
+
+
+def _comp(name):
+    return '<http://www.metarelate.net/test/component/{}>'.format(name)
+
+
+def _map(name):
+    return '<http://www.metarelate.net/test/mapping/{}>'.format(name)
+
+
+class FakeProcess(object):
+    # Answers the mapping and component retrieval queries, recording the
+    # components queried.
+    mappings = {_map('m1'): (_comp('um1'), _comp('cf1')),
+                _map('m2'): (_comp('um2'), _comp('cf1'))}
+
+    def __init__(self):
+        self.queried = []
+
+    def run_query(self, qstr):
+        mapping = re.findall(r'VALUES \?mapping \{ (<[^>]+>) \}', qstr)
+        if mapping:
+            uri, = mapping
+            source, target = self.mappings[uri]
+            result = [{'mapping': uri, 'source': source, 'target': target,
+                       'invertible': '"False"', 'date': '"2015-01-01"',
+                       'creator': '<https://github.com/test>'}]
+        else:
+            values, = re.findall(r'VALUES \?component \{([^}]*)\}', qstr)
+            result = []
+            for uri in values.split():
+                self.queried.append(uri)
+                result.extend([{'component': uri, 'p': RDF_TYPE,
+                                'o': '<https://example.com/Field>'},
+                               {'component': uri, 'p': NAME,
+                                'o': '"{}"'.format(uri)}])
+        return result
+
+
+class Test(tests.MetarelateTestCase):
+    def setUp(self):
+        self.process = FakeProcess()
+        self.session = RetrievalSession()
+
+    def _populate(self, name):
+        mapping = metarelate.Mapping(_map(name))
+        mapping.populate_from_uri(self.process, session=self.session)
+        return mapping
+
+    def test_shared_component(self):
+        m1 = self._populate('m1')
+        m2 = self._populate('m2')
+        self.assertIs(m1.target, m2.target)
+        self.assertIsNot(m1.source, m2.source)
+        self.assertEqual(sorted(self.process.queried),
+                         [_comp('cf1'), _comp('um1'), _comp('um2')])
+        self.assertEqual(len(m1.target.properties), 1)
+
+    def test_stats(self):
+        self._populate('m1')
+        self._populate('m2')
+        self.assertEqual(self.session.stats(),
+                         {'requests': 4, 'fetched': 3, 'shared': 1})
+
+    def test_no_session(self):
+        m1 = metarelate.Mapping(_map('m1'))
+        m1.populate_from_uri(self.process)
+        m2 = metarelate.Mapping(_map('m2'))
+        m2.populate_from_uri(self.process)
+        self.assertIsNot(m1.target, m2.target)
+        self.assertEqual(self.process.queried.count(_comp('cf1')), 2)
+
+    def test_error(self):
+        def run_query(qstr):
+            raise RuntimeError('query failed')
+        self.process.run_query = run_query
+        # the error is raised for the fetch, and for later requests
+        for attempt in range(2):
+            with self.assertRaises(RuntimeError):
+                self.session.component(_comp('cf1'), self.process)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+# (C) British Crown Copyright 2015, Met Office
+#
+# This file is part of metarelate.
+#
+# metarelate is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metarelate is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metarelate. If not, see <http://www.gnu.org/licenses/>.
+"""
+Unit tests for the `metarelate.search.SearchIndex` class.
+
+"""
+
+import unittest
+
+import metarelate.tests as tests
+from metarelate.search import SearchIndex
+
+STASH = '<http://reference.metoffice.gov.uk/um/c4/stash/Stash>'
+STDNAME = '<http://def.scitools.org.uk/cfdatamodel/standard_name>'
+UNITS = '<http://def.scitools.org.uk/cfdatamodel/units>'
+M01S16I203 = '<http://reference.metoffice.gov.uk/um/stash/m01s16i203>'
+AIR_TEMP = '<http://vocab.nerc.ac.uk/standard_name/air_temperature>'
+AIR_PRES = '<http://vocab.nerc.ac.uk/standard_name/air_pressure>'
+
+
+def _comp(name):
+    return '<http://www.metarelate.net/test/component/{}>'.format(name)
+
+
+def _map(name):
+    return '<http://www.metarelate.net/test/mapping/{}>'.format(name)
+
+
+class Test(tests.MetarelateTestCase):
+    def setUp(self):
+        self.index = SearchIndex()
+        self.index.add_statements([(_comp('um1'), STASH, M01S16I203),
+                                   (_comp('cf1'), STDNAME, AIR_TEMP),
+                                   (_comp('cf1'), UNITS, '"K"'),
+                                   (_comp('cf2'), STDNAME, AIR_PRES),
+                                   (_comp('cf2'), UNITS, '"Pa"')])
+        self.index.add_notations([(M01S16I203, '"16203"')])
+        self.index.add_mapping(_map('m1'), _comp('um1'), _comp('cf1'))
+        self.index.add_mapping(_map('m2'), _comp('um1'), _comp('cf2'))
+
+    def _search(self, *statements):
+        results = self.index.search(list(statements))
+        return [result['amap'] for result in results]
+
+    def test_substring(self):
+        self.assertEqual(self._search({'rdfobject': 'temperat'}),
+                         [_map('m1')])
+
+    def test_substring_predicate(self):
+        self.assertEqual(self._search({'predicate': 'stash/Sta'}),
+                         [_map('m1'), _map('m2')])
+
+    def test_notation(self):
+        self.assertEqual(self._search({'rdfobject': '1620'}),
+                         [_map('m1'), _map('m2')])
+
+    def test_prefix(self):
+        self.assertEqual(self._search({'rdfobject': 'air',
+                                       'prefix': True}),
+                         [_map('m1'), _map('m2')])
+        self.assertEqual(self._search({'rdfobject': 'emperature',
+                                       'prefix': True}), [])
+
+    def test_same_statement(self):
+        # the predicate and object must match the same statement
+        self.assertEqual(self._search({'predicate': 'units',
+                                       'rdfobject': 'air'}), [])
+        self.assertEqual(self._search({'predicate': 'units',
+                                       'rdfobject': 'Pa'}), [_map('m2')])
+
+    def test_all_statements(self):
+        self.assertEqual(self._search({'rdfobject': 'air_'},
+                                      {'predicate': 'units',
+                                       'rdfobject': 'K'}),
+                         [_map('m1')])
+
+    def test_replaced(self):
+        self.index.add_mapping(_map('m3'), _comp('um1'), _comp('cf1'))
+        self.index.remove_mapping(_map('m1'))
+        self.assertEqual(self._search({'rdfobject': 'temperat'}),
+                         [_map('m3')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+# (C) British Crown Copyright 2015, Met Office
+#
+# This file is part of metarelate.
+#
+# metarelate is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metarelate is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metarelate. If not, see <http://www.gnu.org/licenses/>.
+"""
+Unit tests for the `metarelate.backends.SnapshotBackend` class.
+
+"""
+
+from StringIO import StringIO
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import metarelate.tests as tests
+from metarelate.backends import SnapshotBackend, rdflib
+from metarelate.fuseki import process_data, snapshot_updates
+import metarelate.prefixes as prefixes
+import metarelate.snapshot as snapshot
+
+CONCEPTS = '''
+@prefix skos: <http://www.w3.org/2004/02/skos/core#> .
+<http://www.metarelate.net/test/component/c1> skos:notation "one" .
+<http://www.metarelate.net/test/component/c2> skos:notation "two"@en .
+'''
+
+MAPPINGS = '''
+@prefix mr: <http://www.metarelate.net/vocabulary/index.html#> .
+<http://www.metarelate.net/test/mapping/m1>
+    mr:source <http://www.metarelate.net/test/component/c1> ;
+    mr:target <http://www.metarelate.net/test/component/c2> .
+'''
+
+CONTACTS = '''
+@prefix skos: <http://www.w3.org/2004/02/skos/core#> .
+<https://github.com/test> skos:inScheme <http://www.metarelate.net/test/contacts> .
+'''
+
+
+@unittest.skipIf(rdflib is None, 'requires rdflib')
+class Test(tests.MetarelateTestCase):
+    def setUp(self):
+        self.static_dir = tempfile.mkdtemp()
+        self.snapshots = tempfile.mkdtemp()
+        graphs = os.path.join(self.static_dir, 'metarelate.net')
+        os.mkdir(graphs)
+        self._commit('concepts.ttl', CONCEPTS)
+        self._commit('mappings.ttl', MAPPINGS)
+        self.backend = SnapshotBackend(self.static_dir, self.snapshots)
+        self.backend.load()
+
+    def tearDown(self):
+        self.backend.clear()
+        shutil.rmtree(self.static_dir)
+        shutil.rmtree(self.snapshots)
+
+    def _commit(self, name, content):
+        with open(os.path.join(self.static_dir, 'metarelate.net', name),
+                  'w') as ttl:
+            ttl.write(content)
+        git = ['git', '-C', self.static_dir, '-c', 'user.name=test',
+               '-c', 'user.email=test@example.com']
+        with open(os.devnull, 'w') as devnull:
+            if not os.path.isdir(os.path.join(self.static_dir, '.git')):
+                subprocess.check_call(git + ['init'], stdout=devnull,
+                                      stderr=devnull)
+            subprocess.check_call(git + ['add', '-A'], stdout=devnull)
+            subprocess.check_call(git + ['commit', '-m', name],
+                                  stdout=devnull)
+
+    def _query(self, qstr):
+        pref = prefixes.Prefixes().sparql
+        return process_data(self.backend.query(pref + qstr))
+
+    def test_query(self):
+        qstr = ('SELECT ?notation WHERE { '
+                'GRAPH <http://metarelate.net/concepts.ttl> '
+                '{ ?s skos:notation ?notation } } ORDER BY ?notation')
+        self.assertEqual(self._query(qstr),
+                         [{'notation': '"one"'}, {'notation': '"two"'}])
+
+    def test_join(self):
+        qstr = ('SELECT ?mapping ?notation '
+                'FROM <http://metarelate.net/mappings.ttl> '
+                'FROM <http://metarelate.net/concepts.ttl> '
+                'WHERE { ?mapping mr:source ?source . '
+                '?source skos:notation ?notation }')
+        self.assertEqual(self._query(qstr),
+                         [{'mapping':
+                           '<http://www.metarelate.net/test/mapping/m1>',
+                           'notation': '"one"'}])
+
+    def test_read_only(self):
+        with self.assertRaises(RuntimeError):
+            self.backend.update('DROP GRAPH '
+                                '<http://metarelate.net/concepts.ttl>')
+
+    def test_snapshot_per_sha(self):
+        self.assertEqual(len(os.listdir(self.snapshots)), 1)
+        self._commit('contacts.ttl', CONTACTS)
+        self.backend.load()
+        self.assertEqual(len(os.listdir(self.snapshots)), 2)
+        qstr = ('SELECT (COUNT(*) AS ?n) WHERE { ?s ?p ?o }')
+        self.assertEqual(self._query(qstr), [{'n': '5'}])
+
+    def test_cli_snapshot(self):
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            snapshot.main([self.static_dir, self.snapshots])
+            path = sys.stdout.getvalue().strip()
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(len(os.listdir(self.snapshots)), 2)
+        backend = SnapshotBackend(self.static_dir, self.snapshots,
+                                  snapshot_updates())
+        backend.load()
+        backend.clear()
+        self.assertEqual(len(os.listdir(self.snapshots)), 2)
+        sha = snapshot.static_sha(self.static_dir)
+        self.assertEqual(path, snapshot.snapshot_path(self.snapshots, sha,
+                                                      snapshot_updates()))
+
+
+if __name__ == '__main__':
+    unittest.main()
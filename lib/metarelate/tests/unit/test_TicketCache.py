@@ -0,0 +1,122 @@
+# (C) British Crown Copyright 2015, Met Office
+#
+# This file is part of metarelate.
+#
+# metarelate is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metarelate is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metarelate. If not, see <http://www.gnu.org/licenses/>.
+"""
+Unit tests for the `metarelate.editor.app.tickets.TicketCache` class,
+against a local stand-in for the GitHub issues API.
+
+"""
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+import json
+from threading import Thread
+import time
+import unittest
+
+import metarelate.tests as tests
+from metarelate.editor.app.tickets import CONTROL_PANEL_URL, TicketCache
+
+ETAG = '"abc123"'
+
+
+def _issue(number, branch):
+    body = ('I propose these changes.\n{}?branch={}'
+            ''.format(CONTROL_PANEL_URL, branch.replace('/', '%2F')))
+    return {'html_url': 'https://github.com/issues/{}'.format(number),
+            'body': body}
+
+
+class _IssuesHandler(BaseHTTPRequestHandler):
+    # Serves the server's issues, honouring If-None-Match.
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        if self.path != '/issues':
+            self.send_response(404)
+            self.end_headers()
+        elif self.headers.get('If-None-Match') == ETAG:
+            self.send_response(304)
+            self.end_headers()
+        else:
+            content = json.dumps(self.server.issues)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('ETag', ETAG)
+            self.end_headers()
+            self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class Test(tests.MetarelateTestCase):
+    def setUp(self):
+        self.server = HTTPServer(('localhost', 0), _IssuesHandler)
+        self.server.issues = [_issue(1, 'abc/'), _issue(2, 'def/'),
+                              _issue(3, 'def/'),
+                              {'html_url': 'x', 'body': None}]
+        self.server.requests = []
+        thread = Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        uri = 'http://localhost:{}/issues'.format(self.server.server_port)
+        self.cache = TicketCache(issues_uri=uri, ttl=60)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_not_blocking(self):
+        # the first lookup answers from the empty cache
+        self.assertIsNone(self.cache.ticket('abc/'))
+        while self.cache.fetched is None:
+            time.sleep(0.01)
+        self.assertEqual(self.cache.ticket('abc/'),
+                         'https://github.com/issues/1')
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_multiple_tickets(self):
+        self.cache.refresh()
+        self.assertIsNone(self.cache.ticket('def/'))
+
+    def test_conditional(self):
+        self.cache.refresh(token='secret')
+        self.cache.refresh()
+        first, second = self.server.requests
+        self.assertEqual(first.get('authorization'), 'token secret')
+        self.assertNotIn('if-none-match', first)
+        self.assertEqual(second.get('if-none-match'), ETAG)
+        self.assertEqual(self.cache.ticket('abc/'),
+                         'https://github.com/issues/1')
+
+    def test_stale(self):
+        self.cache.refresh()
+        self.assertIsNone(self.cache.refresh_if_stale())
+        self.cache.fetched -= 61
+        self.cache.refresh_if_stale().join()
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_unavailable(self):
+        self.cache.refresh()
+        self.server.issues = []
+        self.cache.etag = None
+        self.cache.issues_uri += 'missing'
+        self.cache.refresh()
+        self.assertEqual(self.cache.ticket('abc/'),
+                         'https://github.com/issues/1')
+
+
+if __name__ == '__main__':
+    unittest.main()
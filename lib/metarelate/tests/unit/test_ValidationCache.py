@@ -0,0 +1,141 @@
+# (C) British Crown Copyright 2015, Met Office
+#
+# This file is part of metarelate.
+#
+# metarelate is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metarelate is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metarelate. If not, see <http://www.gnu.org/licenses/>.
+"""
+Unit tests for the `metarelate.validation.ValidationCache` class.
+
+"""
+
+import shutil
+import tempfile
+from threading import Event
+import time
+import unittest
+
+import metarelate.tests as tests
+from metarelate.validation import ValidationCache, ValidationReport
+
+
+class _Validator(object):
+    # Stands in for a FusekiServer, counting validation runs.
+    def __init__(self):
+        self.sha = 'abc123\n'
+        self.content = {'b/': 'one'}
+        self.runs = 0
+        self.hashes = 0
+        self.error = None
+        self.release = Event()
+        self.release.set()
+
+    def latest_sha(self):
+        return self.sha
+
+    def branch_hash(self, branch):
+        self.hashes += 1
+        return self.content[branch]
+
+    def validate(self, graph=None, incremental=False, progress=None):
+        self.runs += 1
+        if self.error is not None:
+            raise self.error
+        progress(1, 2)
+        self.release.wait()
+        progress(2, 2)
+        report = ValidationReport({'failures': ['<m{}>'.format(self.runs)]})
+        report.timings['check'] = 0.5
+        return report
+
+
+class Test(tests.MetarelateTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.validator = _Validator()
+        self.cache = ValidationCache(self.validator, self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _validate(self, branch):
+        self.cache.start(branch)
+        while self.cache.status(branch)['state'] == 'running':
+            time.sleep(0.01)
+        return self.cache.get(branch)
+
+    def test_miss(self):
+        self.assertIsNone(self.cache.get('b/'))
+        self.assertIsNone(self.cache.status('b/'))
+
+    def test_hit(self):
+        report = self._validate('b/')
+        self.assertEqual(report, {'failures': ['<m1>']})
+        self.assertEqual(report.timings['check'], 0.5)
+        self.cache.start('b/')
+        self.assertEqual(self.cache.status('b/'), {'state': 'complete'})
+        self.assertEqual(self.validator.runs, 1)
+
+    def test_persisted(self):
+        self._validate('b/')
+        cache = ValidationCache(self.validator, self.directory)
+        self.assertEqual(cache.get('b/'), {'failures': ['<m1>']})
+
+    def test_branch_changed(self):
+        self._validate('b/')
+        self.validator.content['b/'] = 'two'
+        self.assertIsNone(self.cache.get('b/'))
+        self.assertEqual(self._validate('b/'), {'failures': ['<m2>']})
+
+    def test_main_changed(self):
+        self._validate('b/')
+        self.validator.sha = 'def456\n'
+        self.assertIsNone(self.cache.get('b/'))
+
+    def test_running(self):
+        self.validator.release.clear()
+        self.cache.start('b/')
+        self.cache.start('b/')
+        status = self.cache.status('b/')
+        self.assertEqual(status['state'], 'running')
+        self.validator.release.set()
+        self._validate('b/')
+        self.assertEqual(self.validator.runs, 1)
+
+    def test_key_once(self):
+        key = self.cache.key('b/')
+        self.assertIsNone(self.cache.get('b/', key))
+        self.cache.start('b/', key)
+        while self.cache.status('b/', key)['state'] == 'running':
+            time.sleep(0.01)
+        self.assertEqual(self.cache.get('b/', key), {'failures': ['<m1>']})
+        self.assertEqual(self.validator.hashes, 1)
+
+    def test_key_branch_hash(self):
+        self.assertEqual(self.cache.key('b/', 'one'), self.cache.key('b/'))
+        self.assertEqual(self.validator.hashes, 1)
+
+    def test_failed_pruned(self):
+        self.validator.error = RuntimeError('no store')
+        self._validate('b/')
+        status = self.cache.status('b/')
+        self.assertEqual(status, {'state': 'failed', 'completed': 0,
+                                  'total': None, 'error': 'no store'})
+        self.validator.content['b/'] = 'two'
+        self.validator.error = None
+        self.assertEqual(self._validate('b/'), {'failures': ['<m2>']})
+        self.assertEqual(self.cache.jobs, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
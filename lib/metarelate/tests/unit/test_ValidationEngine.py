@@ -0,0 +1,152 @@
+# (C) British Crown Copyright 2015, Met Office
+#
+# This file is part of metarelate.
+#
+# metarelate is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metarelate is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metarelate. If not, see <http://www.gnu.org/licenses/>.
+"""
+Unit tests for the `metarelate.validation.ValidationEngine` class.
+
+"""
+
+import unittest
+
+import metarelate.tests as tests
+from metarelate.validation import COMPONENT, ValidationEngine
+
+UM = '<http://reference.metoffice.gov.uk/um/f3/UMField>'
+CF = '<http://def.scitools.org.uk/cfdatamodel/Field>'
+GRIB = '<http://def.scitools.org.uk/grib2/GRIB2Message>'
+
+
+def _comp(name):
+    return '<http://www.metarelate.net/test/component/{}>'.format(name)
+
+
+def _map(name):
+    return '<http://www.metarelate.net/test/mapping/{}>'.format(name)
+
+
+def _mapping(name, source, target, invertible='"False"'):
+    return {'mapping': _map(name), 'source': _comp(source),
+            'target': _comp(target), 'invertible': invertible}
+
+
+class Test_validation(tests.MetarelateTestCase):
+    def setUp(self):
+        self.engine = ValidationEngine(None)
+        types = {'um1': UM, 'cf1': CF, 'cf2': CF, 'grib1': GRIB}
+        for comp, ctype in types.iteritems():
+            self.engine.types[_comp(comp)] = set([COMPONENT, ctype])
+
+    def _edges(self, mappings, replaced=None):
+        self.engine.edges = self.engine.mapping_edges(mappings, replaced)
+
+    def test_invertible_edges(self):
+        self._edges([_mapping('m1', 'um1', 'cf1', '"True"'),
+                     _mapping('m2', 'um1', 'grib1')])
+        self.assertEqual(len(self.engine.edges), 3)
+
+    def test_multiple(self):
+        self._edges([_mapping('m1', 'um1', 'cf1'),
+                     _mapping('m2', 'um1', 'cf2')])
+        results = self.engine.multiple_mappings()
+        self.assertEqual([(r['amap'], r['bmap']) for r in results],
+                         [(_map('m1'), _map('m2')), (_map('m2'), _map('m1'))])
+        self.assertEqual(results[0]['signature'],
+                         '<{}: {}>'.format(_map('m1').strip('<>'),
+                                           _map('m2').strip('<>')))
+
+    def test_multiple_other_format(self):
+        self.engine.component_format = False
+        self._edges([_mapping('m1', 'um1', 'cf1'),
+                     _mapping('m2', 'um1', 'grib1')])
+        self.assertEqual(self.engine.multiple_mappings(), [])
+
+    def test_multiple_component_format(self):
+        # as the SPARQL check, mr:Component is a format the targets share
+        self._edges([_mapping('m1', 'um1', 'cf1'),
+                     _mapping('m2', 'um1', 'grib1')])
+        results = self.engine.multiple_mappings()
+        self.assertEqual([(r['amap'], r['bmap']) for r in results],
+                         [(_map('m1'), _map('m2')), (_map('m2'), _map('m1'))])
+
+    def test_rows(self):
+        self._edges([_mapping('m1', 'um1', 'cf1'),
+                     _mapping('m2', 'um1', 'cf2')])
+        row = self.engine.multiple_mappings()[0]
+        self.assertEqual(sorted(row), ['amap', 'asource', 'atarget', 'bmap',
+                                       'bsource', 'btarget', 'signature',
+                                       'valuemaps'])
+        self.assertEqual(row['valuemaps'], '""')
+
+    def test_multiple_inverted(self):
+        self._edges([_mapping('m1', 'cf1', 'um1', '"True"'),
+                     _mapping('m2', 'um1', 'cf2')])
+        results = self.engine.multiple_mappings()
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0]['asource'], _comp('um1'))
+
+    def test_replaced(self):
+        self._edges([_mapping('m1', 'um1', 'cf1'),
+                     _mapping('m2', 'um1', 'cf2')],
+                    replaced=set([_map('m1')]))
+        self.assertEqual(self.engine.multiple_mappings(), [])
+
+    def test_duplicate(self):
+        self._edges([_mapping('m1', 'um1', 'cf1'),
+                     _mapping('m2', 'cf1', 'um1', '"True"')])
+        results = self.engine.duplicate_mappings()
+        self.assertEqual(len(results), 2)
+        self.assertEqual(self.engine.multiple_mappings(), [])
+
+
+class _BranchStore(object):
+    # Answers the branch validation queries from lists of records.
+    def __init__(self, branch, main, types):
+        self.branch = branch
+        self.main = main
+        self.types = types
+
+    def run_query(self, qstr):
+        if 'GRAPH <http://metarelate.net/b/mappings.ttl>' in qstr:
+            result = self.branch
+        elif '?replacedby' in qstr:
+            result = [rec for rec in self.branch + self.main
+                      if rec['source'] in qstr or rec['target'] in qstr]
+        else:
+            result = [{'component': comp, 'format': ctype}
+                      for comp, ctype in self.types
+                      if comp in qstr]
+        return result
+
+
+class Test_load_branch(tests.MetarelateTestCase):
+    def test_branch_only(self):
+        main = [_mapping('m1', 'um1', 'cf1'),
+                _mapping('m2', 'cf2', 'um2'),
+                _mapping('m3', 'cf2', 'um3')]
+        branch = [_mapping('m4', 'um1', 'cf3')]
+        types = [(_comp(c), t) for c, t in
+                 [('um1', UM), ('um2', UM), ('um3', UM),
+                  ('cf1', CF), ('cf2', CF), ('cf3', CF)]]
+        engine = ValidationEngine(_BranchStore(branch, main, types), 'b/')
+        engine.load_branch()
+        self.assertEqual(engine.touched, [_map('m4')])
+        results = engine.multiple_mappings()
+        self.assertEqual(sorted(set((r['amap'], r['bmap']) for r in results)),
+                         [(_map('m1'), _map('m4')), (_map('m4'), _map('m1'))])
+
+
+if __name__ == '__main__':
+    unittest.main()
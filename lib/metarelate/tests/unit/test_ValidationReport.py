@@ -0,0 +1,109 @@
+# (C) British Crown Copyright 2015, Met Office
+#
+# This file is part of metarelate.
+#
+# metarelate is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metarelate is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metarelate. If not, see <http://www.gnu.org/licenses/>.
+"""
+Unit tests for the `metarelate.validation.ValidationReport` class and the
+concurrent running of validation checks.
+
+"""
+
+import time
+import unittest
+
+import metarelate.tests as tests
+from metarelate.validation import (ValidationCheck, ValidationReport,
+                                   run_checks)
+
+
+def _check(name, result, delay=0):
+    def func():
+        time.sleep(delay)
+        return result
+    return ValidationCheck(name, func)
+
+
+def _fail():
+    raise RuntimeError('check failed')
+
+
+class Test_run_checks(tests.MetarelateTestCase):
+    def test_order(self):
+        checks = [_check('slow', {'a': []}, 0.2),
+                  _check('fast', {'b': ['<m1>']})]
+        report = run_checks(checks, workers=2)
+        self.assertEqual(report, {'a': [], 'b': ['<m1>']})
+        self.assertEqual(report.timings.keys(), ['slow', 'fast'])
+        self.assertGreaterEqual(report.timings['slow'], 0.2)
+        self.assertFalse(report.valid)
+
+    def test_valid(self):
+        report = run_checks([_check('one', {'a': []})], workers=4)
+        self.assertTrue(report.valid)
+
+    def test_key_collision(self):
+        checks = [_check('one', {'a': []}), _check('two', {'a': []})]
+        with self.assertRaises(ValueError):
+            run_checks(checks, workers=2)
+
+    def test_exception(self):
+        checks = [_check('one', {'a': []}), ValidationCheck('two', _fail)]
+        with self.assertRaises(RuntimeError):
+            run_checks(checks, workers=2)
+
+    def test_progress(self):
+        calls = []
+        checks = [_check('one', {'a': []}), _check('two', {'b': []}),
+                  _check('three', {'c': []})]
+        run_checks(checks, workers=2,
+                   progress=lambda done, total: calls.append((done, total)))
+        self.assertEqual(calls, [(1, 3), (2, 3), (3, 3)])
+
+
+class Test_page(tests.MetarelateTestCase):
+    def setUp(self):
+        self.report = ValidationReport({'b': ['<m3>', '<m4>', '<m5>'],
+                                        'a': ['<m1>', '<m2>'],
+                                        'c': []})
+        self.report.timings['check'] = 1.0
+
+    def test_count(self):
+        self.assertEqual(self.report.count, 5)
+
+    def test_all(self):
+        self.assertEqual(self.report.page(), {'a': ['<m1>', '<m2>'],
+                                              'b': ['<m3>', '<m4>', '<m5>']})
+
+    def test_window(self):
+        page = self.report.page(offset=1, limit=2)
+        self.assertEqual(page, {'a': ['<m2>'], 'b': ['<m3>']})
+        self.assertEqual(page.timings, {'check': 1.0})
+
+    def test_past_end(self):
+        self.assertEqual(self.report.page(offset=5, limit=2), {})
+
+
+class Test_json(tests.MetarelateTestCase):
+    def test_round_trip(self):
+        report = run_checks([_check('slow', {'a': ['<m1>']}),
+                             _check('fast', {'b': []})])
+        result = ValidationReport.from_json(report.to_json())
+        self.assertEqual(result, report)
+        self.assertEqual(result.timings, report.timings)
+        self.assertFalse(result.valid)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+# (C) British Crown Copyright 2015, Met Office
+#
+# This file is part of metarelate.
+#
+# metarelate is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metarelate is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metarelate. If not, see <http://www.gnu.org/licenses/>.
+"""
+Unit tests for the `metarelate.fuseki.lockfile` class.
+
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import metarelate.tests as tests
+from metarelate.fuseki import lockfile
+
+
+class Test_lockfile(tests.MetarelateTestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.fpath = os.path.join(self.tmpdir, 'lockfile')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_acquire_release(self):
+        with lockfile(self.fpath) as lock:
+            self.assertIsNotNone(lock.wait_time)
+        with lockfile(self.fpath, timeout=0):
+            pass
+
+    def test_timeout(self):
+        with lockfile(self.fpath):
+            with self.assertRaises(ValueError):
+                with lockfile(self.fpath, timeout=0.2):
+                    pass
+
+    def test_waiter_acquires_on_release(self):
+        held = threading.Event()
+        def hold():
+            with lockfile(self.fpath):
+                held.set()
+                time.sleep(0.3)
+        holder = threading.Thread(target=hold)
+        holder.start()
+        held.wait()
+        with lockfile(self.fpath, timeout=5, poll=0.01) as lock:
+            self.assertGreater(lock.wait_time, 0.1)
+        holder.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
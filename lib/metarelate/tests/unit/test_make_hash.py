@@ -0,0 +1,69 @@
+# (C) British Crown Copyright 2015, Met Office
+#
+# This file is part of metarelate.
+#
+# metarelate is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metarelate is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metarelate. If not, see <http://www.gnu.org/licenses/>.
+"""
+Unit tests for the `metarelate.make_hash` function, and the
+`metarelate.hashing` module.
+
+"""
+
+import unittest
+
+import metarelate
+import metarelate.tests as tests
+import metarelate.hashing as hashing
+
+
+class Test(tests.MetarelateTestCase):
+    def setUp(self):
+        self.contact = {'<https://github.com/someone>':
+                        '2015-03-04T10:11:12.123456'}
+        self.mapping = {'mr:source': '<http://a/b>',
+                        'mr:target': '<http://a/c>',
+                        'mr:invertible': '"True"',
+                        'dc:date': ['"2015"^^xsd:dateTime'],
+                        'dc:creator': '<https://github.com/x>',
+                        'dc:contributor': ['<https://github.com/b>',
+                                           '<https://github.com/a>']}
+        self.notes = {u'skos:note': u'"a note"', 'rdf:type': ['mr:Mapping'],
+                      'cfmodel:units': ['"K"', '"Pa"']}
+
+    def test_digests(self):
+        # the digests are those of the knowledge base's existing records
+        self.assertEqual(metarelate.make_hash(self.contact),
+                         '81ce705d119b459e242f46e302c66a943ad837bd')
+        self.assertEqual(metarelate.make_hash(self.mapping, ['dc:date']),
+                         '14e0cde154bdc6d5fffd506966d4e440ed25defb')
+        self.assertEqual(metarelate.make_hash(self.notes),
+                         'a1fa33d846bd4cc8f4381102c8fc4b8692a1eacb')
+
+    def test_canonical(self):
+        result = hashing.canonical({'dc:contributor': ['<a>', '<b>'],
+                                    '<http://p>': '"x"'})
+        expected = ('<http://p>"x"'
+                    'http://purl.org/dc/terms/contributor<a>'
+                    'http://purl.org/dc/terms/contributor<b>')
+        self.assertEqual(result, expected)
+
+    def test_bad_predicates(self):
+        with self.assertRaisesRegexp(ValueError, 'not of the form'):
+            metarelate.make_hash({'nocolon': '"x"'})
+        with self.assertRaisesRegexp(ValueError, 'unknown not in prefixes'):
+            metarelate.make_hash({'unknown:x': '"x"'})
+
+
+if __name__ == '__main__':
+    unittest.main()
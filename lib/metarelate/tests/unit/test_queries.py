@@ -0,0 +1,131 @@
+# (C) British Crown Copyright 2015, Met Office
+#
+# This file is part of metarelate.
+#
+# metarelate is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metarelate is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metarelate. If not, see <http://www.gnu.org/licenses/>.
+"""
+Unit tests for the `metarelate.queries.Template` class.
+
+"""
+
+import unittest
+
+import metarelate.tests as tests
+from metarelate.queries import (Query, Template, bound, from_named, term,
+                                 terms)
+
+
+class FakeProcess(object):
+    def __init__(self):
+        self.queried = []
+
+    def run_query(self, qstr):
+        self.queried.append(qstr)
+        return []
+
+
+class Test(tests.MetarelateTestCase):
+    def setUp(self):
+        self.template = Template('test',
+                                 'SELECT ?n %(graphs)sWHERE { '
+                                 'VALUES ?s { %(subjects)s } '
+                                 '?s skos:notation %(notation)s }',
+                                 graphs=from_named, subjects=terms)
+
+    def test_bind(self):
+        result = self.template.bind(graphs=['<http://metarelate.net/a.ttl>'],
+                                    subjects=['<http://a/1>', '<http://a/2>'],
+                                    notation='"K"^^xsd:string')
+        expected = ('SELECT ?n FROM NAMED <http://metarelate.net/a.ttl>\n'
+                    'WHERE { VALUES ?s { <http://a/1> <http://a/2> } '
+                    '?s skos:notation "K"^^xsd:string }')
+        self.assertEqual(result, expected)
+        self.assertIsInstance(result, Query)
+
+    def test_terms(self):
+        for notation in ['<http://a/1>', 'skos:Concept', '"a \\" b"',
+                         '"chat"@fr', '12', '-1.5', 'true', '1e-05',
+                         '-2.5E+10', '.5', '3.e2']:
+            self.assertEqual(term(notation), notation)
+            self.template.bind(graphs=[], subjects=[], notation=notation)
+
+    def test_numbers(self):
+        self.assertEqual(term(12), '12')
+        self.assertEqual(term(1e-05), '1e-05')
+        self.assertEqual(term(True), 'true')
+        self.assertEqual(term('nan'), '"NaN"^^xsd:double')
+        self.assertEqual(term(float('inf')), '"INF"^^xsd:double')
+        self.assertEqual(term('-inf'), '"-INF"^^xsd:double')
+
+    def test_line_breaks(self):
+        self.assertEqual(term('"a\nb"'), '"a\\nb"')
+        self.assertEqual(term('"a\r\nb"@en'), '"a\\r\\nb"@en')
+
+    def test_injection(self):
+        quoted = {'<http://a/1> } DROP ALL ; {':
+                      '"<http://a/1> } DROP ALL ; {"',
+                  '"a" . ?s ?p ?o': '"\\"a\\" . ?s ?p ?o"',
+                  '<http://a/b c>': '"<http://a/b c>"',
+                  '"a"b"': '"\\"a\\"b\\""',
+                  'skos:a skos:b': '"skos:a skos:b"',
+                  'a\\"\n': '"a\\\\\\"\\n"'}
+        for notation, expected in quoted.iteritems():
+            result = self.template.bind(graphs=[], subjects=[],
+                                        notation=notation)
+            self.assertTrue(result.endswith('skos:notation {} }}'
+                                            ''.format(expected)))
+        with self.assertRaises(ValueError):
+            self.template.bind(graphs=[], subjects=[], notation=None)
+        with self.assertRaises(ValueError):
+            self.template.bind(graphs=['<a> <b>'], subjects=[],
+                               notation='"K"')
+        with self.assertRaises(ValueError):
+            self.template.bind(graphs=[], subjects='<http://a/1>',
+                               notation='"K"')
+
+    def test_parameters(self):
+        with self.assertRaises(ValueError):
+            self.template.bind(graphs=[], subjects=[])
+        with self.assertRaises(ValueError):
+            self.template.bind(graphs=[], subjects=[], notation='"K"',
+                               other='"K"')
+        with self.assertRaises(ValueError):
+            Template('test', 'SELECT ?s WHERE { ?s ?p %(o)s }', p=terms)
+
+    def test_bound(self):
+        outer = Template('outer', 'SELECT * WHERE { %(query)s }',
+                         query=bound)
+        inner = self.template.bind(graphs=[], subjects=[], notation='"K"')
+        self.assertIn(inner, outer.bind(query=inner))
+        with self.assertRaises(ValueError):
+            outer.bind(query='?s ?p ?o')
+
+    def test_run(self):
+        process = FakeProcess()
+        self.template.run(process, graphs=[], subjects=['<http://a/1>'],
+                          notation='"K"')
+        query, = process.queried
+        self.assertIs(query.template, self.template)
+
+    def test_timing(self):
+        for i in range(2):
+            with self.template.timing():
+                pass
+        stats = self.template.stats()
+        self.assertEqual(stats['calls'], 2)
+        self.assertGreaterEqual(stats['total_time'], stats['max_time'])
+
+
+if __name__ == '__main__':
+    unittest.main()
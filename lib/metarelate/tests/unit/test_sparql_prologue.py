@@ -0,0 +1,51 @@
+# (C) British Crown Copyright 2015, Met Office
+#
+# This file is part of metarelate.
+#
+# metarelate is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metarelate is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metarelate. If not, see <http://www.gnu.org/licenses/>.
+"""
+Unit tests for the `metarelate.prefixes.sparql_prologue` function.
+
+"""
+
+import unittest
+
+import metarelate.tests as tests
+import metarelate.prefixes as prefixes
+
+
+class Test(tests.MetarelateTestCase):
+    def test_used_prefixes(self):
+        qstr = ('SELECT ?s WHERE { GRAPH <http://metarelate.net/concepts.ttl> '
+                '{ ?s skos:notation ?n ; dc:replaces ?r . } }')
+        expected = ('PREFIX dc: <http://purl.org/dc/terms/>\n'
+                    'PREFIX skos: <http://www.w3.org/2004/02/skos/core#>\n\n')
+        self.assertEqual(prefixes.sparql_prologue(qstr), expected)
+
+    def test_unknown_prefixes(self):
+        qstr = 'SELECT ?s WHERE { ?s <https://github.com/x> "a:b" }'
+        self.assertEqual(prefixes.sparql_prologue(qstr), '\n')
+
+    def test_all_prefixes(self):
+        self.assertEqual(prefixes.sparql_prologue(),
+                         prefixes.Prefixes().sparql)
+
+    def test_cached(self):
+        qstr = 'SELECT ?s WHERE { ?s a mr:Mapping }'
+        self.assertIs(prefixes.sparql_prologue(qstr),
+                      prefixes.sparql_prologue(qstr + ' LIMIT 1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -15,6 +15,7 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with metarelate. If not, see <http://www.gnu.org/licenses/>.
 
+from Queue import Empty
 from threading import Thread
 
 import metarelate
@@ -36,8 +37,11 @@ class WorkerThread(Thread):
         Thread.__init__(self)
         self.daemon = True
     def run(self):
-        while not self.queue.empty():
-            resource = self.queue.get()
+        while True:
+            try:
+                resource = self.queue.get_nowait()
+            except Empty:
+                break
             try:
                 self.dowork(resource)
                 self.deque.append(resource)
@@ -0,0 +1,648 @@
+# (C) British Crown Copyright 2015, Met Office
+#
+# This file is part of metarelate.
+#
+# metarelate is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metarelate is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metarelate. If not, see <http://www.gnu.org/licenses/>.
+"""
+Provides an in-memory validation engine for the knowledge base.
+
+The mapping, source, target and format tuples are retrieved from the
+triple store with linear queries, and the validation checks are
+evaluated in Python by grouping these tuples, rather than by self-joins
+within the triple store.
+
+"""
+
+from collections import defaultdict, deque, namedtuple, OrderedDict
+import json
+import logging
+from Queue import Queue
+import re
+import sys
+from threading import Lock, Thread
+import time
+
+from metarelate import careful_update
+from metarelate.cache import DiskCache
+from metarelate.thread import WorkerThread, MAXTHREADS
+
+logger = logging.getLogger(__name__)
+
+COMPONENT = '<http://www.metarelate.net/vocabulary/index.html#Component>'
+NULLTYPE = '<http://www.metarelate.net/nulltype>'
+
+
+class Edge(namedtuple('Edge', 'mapping source target')):
+    """
+    A directed source to target relation provided by a mapping.
+
+    An invertible mapping provides two edges, one in each direction.
+
+    """
+
+
+def _graphs(subgraph, graph=None):
+    graphs = 'FROM <http://metarelate.net/{}>\n'.format(subgraph)
+    if graph:
+        graphs += 'FROM <http://metarelate.net/{}{}>\n'.format(graph, subgraph)
+    return graphs
+
+
+def _signature(amap, bmap):
+    return '<{}: {}>'.format(amap.strip('<>'), bmap.strip('<>'))
+
+
+class ValidationEngine(object):
+    """
+    Validates the mappings in the main graph, or in the main graph
+    combined with a branch graph, against each other.
+
+    Args:
+    * fuseki_process:
+        The :class:`metarelate.fuseki.FusekiServer` to query.
+
+    Kwargs:
+    * graph:
+        The branch identifier to combine with the main graph, or None.
+    * subformat_predicates:
+        A list of predicates which distinguish sub-formats of a source
+        format, as provided by the validation plug-in.
+    * component_format:
+        Whether mr:Component, which every component carries, is a format
+        shared by the targets of multiple mappings, as in the SPARQL
+        check.  If False, only the targets sharing another format are
+        reported.  Defaults to True.
+
+    """
+    def __init__(self, fuseki_process, graph=None, subformat_predicates=None,
+                 component_format=True):
+        self.fuseki_process = fuseki_process
+        self.graph = graph
+        if subformat_predicates is None:
+            subformat_predicates = []
+        self.subformat_predicates = subformat_predicates
+        self.component_format = component_format
+        self.edges = []
+        self.types = {}
+        self.subformats = {}
+        self.touched = None
+
+    def mapping_query(self):
+        qstr = ('SELECT ?mapping ?source ?target ?invertible\n'
+                '%s'
+                'WHERE {\n'
+                '?mapping mr:source ?source ;\n'
+                '         mr:target ?target .\n'
+                'OPTIONAL {?mapping mr:invertible ?invertible .}\n'
+                '}\n' % _graphs('mappings.ttl', self.graph))
+        return qstr
+
+    def replaced_query(self):
+        qstr = ('SELECT DISTINCT ?replaced\n'
+                '%s'
+                'WHERE {\n'
+                '?mapping dc:replaces ?replaced .\n'
+                '}\n' % _graphs('mappings.ttl', self.graph))
+        return qstr
+
+    def type_query(self):
+        qstr = ('SELECT ?component ?format\n'
+                '%s'
+                'WHERE {\n'
+                '?component rdf:type ?format .\n'
+                '}\n' % _graphs('concepts.ttl', self.graph))
+        return qstr
+
+    def subformat_query(self, components=None):
+        values = ''
+        if components is not None:
+            values = ('VALUES ?component { %s }\n'
+                      '' % ' '.join(sorted(components)))
+        qstr = ('SELECT ?component ?predicate ?value\n'
+                '%s'
+                'WHERE {\n'
+                '%s'
+                'VALUES ?predicate { %s }\n'
+                '?component ?predicate ?value .\n'
+                '}\n' % (_graphs('concepts.ttl', self.graph), values,
+                         ' '.join(self.subformat_predicates)))
+        return qstr
+
+    def load(self):
+        """
+        Retrieve the mapping edges, component formats and sub-format values
+        from the triple store.
+
+        Mappings which have been replaced by another mapping are excluded.
+
+        """
+        replaced = set(res['replaced'] for res in
+                       self.fuseki_process.run_query(self.replaced_query()))
+        mappings = self.fuseki_process.run_query(self.mapping_query())
+        self.edges = self.mapping_edges(mappings, replaced)
+        self.types = defaultdict(set)
+        for res in self.fuseki_process.run_query(self.type_query()):
+            self.types[res['component']].add(res['format'])
+        self.subformats = defaultdict(set)
+        if self.subformat_predicates:
+            qstr = self.subformat_query()
+            for res in self.fuseki_process.run_query(qstr):
+                key = (res['component'], res['predicate'])
+                self.subformats[key].add(res['value'])
+        return self
+
+    def branch_query(self):
+        qstr = ('SELECT ?mapping ?source ?target ?invertible\n'
+                'WHERE {\n'
+                'GRAPH <http://metarelate.net/%smappings.ttl> {\n'
+                '?mapping mr:source ?source ;\n'
+                '         mr:target ?target .\n'
+                'OPTIONAL {?mapping mr:invertible ?invertible .}\n'
+                '}}\n' % self.graph)
+        return qstr
+
+    def neighbour_query(self, components):
+        qstr = ('SELECT ?mapping ?source ?target ?invertible ?replacedby\n'
+                '%s'
+                'WHERE {\n'
+                'VALUES ?component { %s }\n'
+                '{?mapping mr:source ?component .}\n'
+                'UNION\n'
+                '{?mapping mr:target ?component .}\n'
+                '?mapping mr:source ?source ;\n'
+                '         mr:target ?target .\n'
+                'OPTIONAL {?mapping mr:invertible ?invertible .}\n'
+                'OPTIONAL {?replacedby dc:replaces ?mapping .}\n'
+                '}\n' % (_graphs('mappings.ttl', self.graph),
+                         ' '.join(sorted(components))))
+        return qstr
+
+    def component_type_query(self, components):
+        qstr = ('SELECT ?component ?format\n'
+                '%s'
+                'WHERE {\n'
+                'VALUES ?component { %s }\n'
+                '?component rdf:type ?format .\n'
+                '}\n' % (_graphs('concepts.ttl', self.graph),
+                         ' '.join(sorted(components))))
+        return qstr
+
+    def load_branch(self):
+        """
+        Retrieve only the mapping edges, component formats and sub-format
+        values which bear on the mappings in the branch graph.
+
+        Every pair of mappings reported by the checks shares a source, so
+        only the sources of the branch mappings' edges need validating;
+        all of the edges from those sources, in the main graph and the
+        branch, are retrieved.  Failures between main graph mappings
+        elsewhere are not reported: the main graph is validated when each
+        branch is merged onto it.
+
+        """
+        if not self.graph:
+            raise ValueError('branch validation requires a branch graph')
+        branch_mappings = self.fuseki_process.run_query(self.branch_query())
+        self.touched = sorted(set(res['mapping'] for res in branch_mappings))
+        sources = set(edge.source for edge in
+                      self.mapping_edges(branch_mappings))
+        self.edges = []
+        self.types = defaultdict(set)
+        self.subformats = defaultdict(set)
+        if not sources:
+            return self
+        qstr = self.neighbour_query(sources)
+        mappings = self.fuseki_process.run_query(qstr)
+        replaced = set(res['mapping'] for res in mappings
+                       if res.get('replacedby'))
+        self.edges = [edge for edge in self.mapping_edges(mappings, replaced)
+                      if edge.source in sources]
+        components = set()
+        for edge in self.edges:
+            components.update((edge.source, edge.target))
+        qstr = self.component_type_query(components)
+        for res in self.fuseki_process.run_query(qstr):
+            self.types[res['component']].add(res['format'])
+        if self.subformat_predicates:
+            qstr = self.subformat_query(sources)
+            for res in self.fuseki_process.run_query(qstr):
+                key = (res['component'], res['predicate'])
+                self.subformats[key].add(res['value'])
+        return self
+
+    @staticmethod
+    def mapping_edges(mappings, replaced=None):
+        """
+        Return the directed :class:`Edge` instances for the mapping
+        records provided, omitting any mapping in the replaced set.
+
+        """
+        if replaced is None:
+            replaced = set()
+        edges = set()
+        for res in mappings:
+            if res['mapping'] in replaced:
+                continue
+            edges.add(Edge(res['mapping'], res['source'], res['target']))
+            if res.get('invertible') == '"True"':
+                edges.add(Edge(res['mapping'], res['target'], res['source']))
+        return sorted(edges)
+
+    def formats(self, component):
+        """Return the formats of a component, excluding mr:Component."""
+        return self.types.get(component, set()) - set([COMPONENT])
+
+    def _subformat_distinct(self, source):
+        # As with the SPARQL formulation, each sub-format predicate must
+        # provide differing values for the (shared) source.
+        for pred in self.subformat_predicates:
+            if len(self.subformats.get((source, pred), ())) < 2:
+                return False
+        return True
+
+    def _by_source(self, test_source=None):
+        if test_source and not re.match('<http.*>', test_source):
+            test_source = None
+        groups = defaultdict(list)
+        for edge in self.edges:
+            if test_source is None or edge.source == test_source:
+                groups[edge.source].append(edge)
+        return groups
+
+    def _rows(self, pairs):
+        rows = []
+        order = lambda pair: (pair[0].source, pair[0].mapping, pair[0].target,
+                              pair[1].mapping, pair[1].target)
+        for aedge, bedge in sorted(pairs, key=order):
+            rows.append({'amap': aedge.mapping, 'asource': aedge.source,
+                         'atarget': aedge.target, 'bmap': bedge.mapping,
+                         'bsource': bedge.source, 'btarget': bedge.target,
+                         'signature': _signature(aedge.mapping,
+                                                 bedge.mapping),
+                         # the SPARQL checks bind no value maps
+                         'valuemaps': '""'})
+        return rows
+
+    def multiple_mappings(self, test_source=None):
+        """
+        Return the pairs of mappings which map the same source to different
+        targets, where the targets share a format.
+
+        """
+        if self.component_format:
+            formats = lambda component: self.types.get(component, set())
+        else:
+            formats = self.formats
+        pairs = set()
+        for source, edges in self._by_source(test_source).iteritems():
+            if len(edges) < 2 or not self.types.get(source):
+                continue
+            if not self._subformat_distinct(source):
+                continue
+            for aedge in edges:
+                aformats = formats(aedge.target)
+                for bedge in edges:
+                    if bedge.mapping == aedge.mapping or \
+                            bedge.target == aedge.target:
+                        continue
+                    if aformats & formats(bedge.target):
+                        pairs.add((aedge, bedge))
+        return self._rows(pairs)
+
+    def duplicate_mappings(self, test_source=None):
+        """
+        Return the pairs of mappings which map the same source to the
+        same target.
+
+        """
+        pairs = set()
+        for source, edges in self._by_source(test_source).iteritems():
+            if len(edges) < 2:
+                continue
+            if not self.formats(source) - set([NULLTYPE]):
+                continue
+            by_target = defaultdict(list)
+            for edge in edges:
+                by_target[edge.target].append(edge)
+            for target, tedges in by_target.iteritems():
+                if len(tedges) < 2 or not self.types.get(target):
+                    continue
+                for aedge in tedges:
+                    for bedge in tedges:
+                        if bedge.mapping != aedge.mapping:
+                            pairs.add((aedge, bedge))
+        return self._rows(pairs)
+
+
+class ValidationCheck(object):
+    """
+    A named validation check: a callable, taking no arguments, which
+    returns a dictionary of failure descriptions and failing mappings.
+
+    Running the check records the result, or the exception raised, and
+    the time taken.
+
+    """
+    def __init__(self, name, func):
+        self.name = name
+        self.func = func
+        self.result = None
+        self.exc_info = None
+        self.elapsed = None
+        self.callback = None
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, self.name)
+
+    def run(self):
+        start = time.time()
+        try:
+            self.result = self.func()
+        except Exception:
+            self.exc_info = sys.exc_info()
+        self.elapsed = time.time() - start
+        if self.callback is not None:
+            self.callback(self)
+
+
+class ValidationCheckWorker(WorkerThread):
+    """
+    WorkerThread for running a :class:`ValidationCheck`.
+    """
+    def dowork(self, resource):
+        resource.run()
+
+
+class ValidationReport(dict):
+    """
+    The failures found by a validation run, keyed by failure description,
+    with the time taken by each check, in seconds, in the timings
+    attribute.
+
+    """
+    def __init__(self, *args, **kwargs):
+        super(ValidationReport, self).__init__(*args, **kwargs)
+        self.timings = OrderedDict()
+
+    def add(self, check):
+        """
+        Add the results of a completed :class:`ValidationCheck`, raising
+        a ValueError if it shares a failure description with a check
+        already added.
+
+        """
+        careful_update(self, check.result)
+        self.timings[check.name] = check.elapsed
+
+    @property
+    def valid(self):
+        return not any(self.values())
+
+    @property
+    def count(self):
+        """The total number of failures."""
+        return sum(len(failures) for failures in self.itervalues())
+
+    def page(self, offset=0, limit=None):
+        """
+        Return a :class:`ValidationReport` of a window of the failures,
+        taken in order of failure description, with the same timings.
+
+        Kwargs:
+        * offset:
+            The number of failures to skip.
+        * limit:
+            The maximum number of failures to include, or None for all.
+
+        """
+        result = ValidationReport()
+        result.timings.update(self.timings)
+        stop = None if limit is None else offset + limit
+        start = 0
+        for key in sorted(self):
+            failures = self[key]
+            end = start + len(failures)
+            window = failures[max(offset - start, 0):
+                              None if stop is None else max(stop - start, 0)]
+            if window:
+                result[key] = window
+            start = end
+        return result
+
+    def summary(self):
+        """Return a description of the time taken by each check."""
+        lines = ['{}: {:.3f}s'.format(name, elapsed) for name, elapsed
+                 in self.timings.iteritems()]
+        return '\n'.join(lines)
+
+    def to_json(self):
+        return json.dumps({'failures': dict(self),
+                           'timings': self.timings.items()})
+
+    @classmethod
+    def from_json(cls, jsonstr):
+        content = json.loads(jsonstr)
+        report = cls(content['failures'])
+        report.timings.update(content['timings'])
+        return report
+
+
+def run_checks(checks, workers=None, report=None, progress=None):
+    """
+    Run the validation checks concurrently, on a bounded pool of worker
+    threads, and return a :class:`ValidationReport`.
+
+    The results are added to the report in the order the checks are
+    provided, whatever order they complete in, and the first exception
+    raised by a check, in that order, is re-raised.
+
+    Args:
+    * checks:
+        A list of :class:`ValidationCheck` instances.
+
+    Kwargs:
+    * workers:
+        The maximum number of worker threads; defaults to the configured
+        number of workers.
+    * report:
+        A :class:`ValidationReport` to add to, rather than a new one.
+    * progress:
+        A callable, passed the number of checks completed and the total
+        number of checks each time a check completes.
+
+    """
+    if report is None:
+        report = ValidationReport()
+    if workers is None:
+        workers = MAXTHREADS or 1
+    check_queue = Queue()
+    done = deque()
+    completed = [0]
+    progress_lock = Lock()
+    def check_done(check):
+        with progress_lock:
+            completed[0] += 1
+            progress(completed[0], len(checks))
+    for check in checks:
+        if progress is not None:
+            check.callback = check_done
+        check_queue.put(check)
+    for i in range(min(workers, len(checks))):
+        ValidationCheckWorker(check_queue, done).start()
+    check_queue.join()
+    for check in checks:
+        if check.exc_info is not None:
+            raise check.exc_info[0], check.exc_info[1], check.exc_info[2]
+        report.add(check)
+    return report
+
+
+class ValidationCache(object):
+    """
+    Validation reports for branches, persisted to disk and keyed by the
+    revision of the main graph and a hash of the branch content, so that
+    an unchanged branch is not validated again.
+
+    Validation of a branch without a stored report is run in a
+    background thread, whose progress is available from :meth:`status`.
+
+    Args:
+    * fuseki_process:
+        The :class:`metarelate.fuseki.FusekiServer` to validate with.
+    * directory:
+        The directory in which to persist the reports.
+
+    Kwargs:
+    * incremental:
+        Whether branches are validated incrementally.
+
+    """
+    def __init__(self, fuseki_process, directory, incremental=True):
+        self.fuseki_process = fuseki_process
+        self.store = DiskCache(directory, suffix='.json')
+        self.incremental = incremental
+        self.jobs = {}
+        self._lock = Lock()
+
+    def key(self, branch, branch_hash=None):
+        """
+        Return the cache key for a branch: the main graph revision and the
+        branch content hash.
+
+        Kwargs:
+        * branch_hash:
+            The branch content hash, from
+            :meth:`metarelate.fuseki.FusekiServer.branch_hash` or the
+            control panel 'revision', if known.
+
+        """
+        sha = self.fuseki_process.latest_sha().strip()
+        if not branch:
+            branch_hash = ''
+        elif branch_hash is None:
+            branch_hash = self.fuseki_process.branch_hash(branch)
+        return 'validation {} {} {} {}'.format(self.incremental, sha,
+                                               branch, branch_hash)
+
+    def get(self, branch, key=None):
+        """
+        Return the stored :class:`ValidationReport` for the current state
+        of a branch, or None.
+
+        Kwargs:
+        * key:
+            The cache key of the branch, from :meth:`key`, if known.
+
+        """
+        if key is None:
+            key = self.key(branch)
+        report = self.store.get(key)
+        if report is not None:
+            report = ValidationReport.from_json(report)
+        return report
+
+    def status(self, branch, key=None):
+        """
+        Return a dictionary describing the validation state of the current
+        state of a branch, or None if it has not been validated.
+
+        The 'state' is one of 'complete', 'running' or 'failed'; a running
+        validation reports the number of checks 'completed' of the
+        'total', and a failed validation the 'error'.
+
+        Kwargs:
+        * key:
+            The cache key of the branch, from :meth:`key`, if known.
+
+        """
+        if key is None:
+            key = self.key(branch)
+        if key in self.store:
+            result = {'state': 'complete'}
+        else:
+            with self._lock:
+                result = self.jobs.get(key)
+                if result is not None:
+                    result = dict(result)
+                    del result['branch']
+        return result
+
+    def start(self, branch, key=None):
+        """
+        Start validating the current state of a branch in the background,
+        unless a report is already stored or validation is running.
+
+        The failed validations of the branch are discarded.
+
+        Kwargs:
+        * key:
+            The cache key of the branch, from :meth:`key`, if known.
+
+        """
+        if key is None:
+            key = self.key(branch)
+        with self._lock:
+            job = self.jobs.get(key)
+            if key in self.store or \
+                    (job is not None and job['state'] == 'running'):
+                return
+            for old_key, old_job in self.jobs.items():
+                if old_job['branch'] == branch and \
+                        old_job['state'] == 'failed':
+                    del self.jobs[old_key]
+            job = {'state': 'running', 'completed': 0, 'total': None,
+                   'branch': branch}
+            self.jobs[key] = job
+        worker = Thread(target=self._run, args=(branch, key, job))
+        worker.daemon = True
+        worker.start()
+
+    def _run(self, branch, key, job):
+        def progress(completed, total):
+            with self._lock:
+                job['completed'] = completed
+                job['total'] = total
+        try:
+            report = self.fuseki_process.validate(branch,
+                                                  incremental=self.incremental,
+                                                  progress=progress)
+            self.store.set(key, report.to_json())
+            with self._lock:
+                del self.jobs[key]
+        except Exception, e:
+            logger.error('validation of branch {} failed: {}'.format(branch,
+                                                                     e))
+            with self._lock:
+                job['state'] = 'failed'
+                job['error'] = str(e)